@@ -0,0 +1,483 @@
+import asyncio
+import json
+import logging
+import time
+import httpx
+from google.oauth2 import service_account
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from config import Config
+from firebase_common import firebase_key_order, server_increment, stats_increment_updates, user_cache, user_change_updates
+from storage import Storage
+from utils.bans import banned_users
+from utils.premium_index import premium_index
+from utils.request_context import count_round_trip
+from utils.settings import live_settings
+from utils.usage_history import DAILY, HOURLY, daily_rollup, day_key, hour_key, retention_cutoffs
+
+logger = logging.getLogger(__name__)
+
+# صلاحيات OAuth اللازمة للوصول إلى Realtime Database عبر REST
+FIREBASE_SCOPES = [
+    "https://www.googleapis.com/auth/firebase.database",
+    "https://www.googleapis.com/auth/userinfo.email"
+]
+
+
+class FirebaseTransactionError(Exception):
+    """فشل المعاملة بعد عدة محاولات بسبب كتابات متزامنة"""
+
+
+class AsyncFirebaseDB(Storage):
+    """تخزين Realtime Database عبر REST API بعميل httpx دائم (keep-alive)
+
+    التنفيذ الوحيد لـ Storage على Firebase؛ firebase_db يبدأ المستمعين فقط، وهم يحدثون الكاش والفهارس المشتركة.
+    """
+
+    def __init__(self, database_url: str = None, service_account_info: dict = None):
+        self.database_url = (database_url or Config.FIREBASE_DATABASE_URL).rstrip('/')
+        self._service_account_info = service_account_info or Config.FIREBASE_SERVICE_ACCOUNT
+        self._credentials = None
+        self._token_lock = None
+        self._client = None
+
+    # ------------------- النقل -------------------
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.database_url,
+                limits=httpx.Limits(
+                    max_connections=Config.FIREBASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.FIREBASE_MAX_CONNECTIONS,
+                    keepalive_expiry=60
+                ),
+                timeout=Config.FIREBASE_TIMEOUT
+            )
+        return self._client
+
+    async def _get_token(self) -> str:
+        """رمز OAuth من حساب الخدمة، يُجدد في خيط منفصل قبل انتهائه"""
+        if self._credentials is None:
+            self._credentials = service_account.Credentials.from_service_account_info(
+                self._service_account_info, scopes=FIREBASE_SCOPES
+            )
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        if not self._credentials.valid:
+            async with self._token_lock:
+                if not self._credentials.valid:
+                    await asyncio.to_thread(self._credentials.refresh, GoogleAuthRequest())
+        return self._credentials.token
+
+    async def request(self, method: str, path: str, params: dict = None, headers: dict = None,
+                      json_body=None, check: bool = True) -> httpx.Response:
+        """طلب REST على path (بدون .json) مع رمز الوصول"""
+        request_headers = {"Authorization": f"Bearer {await self._get_token()}", **(headers or {})}
+        count_round_trip()
+        response = await self._get_client().request(
+            method,
+            f"/{path.strip('/')}.json",
+            params=params,
+            headers=request_headers,
+            content=json.dumps(json_body) if json_body is not None else None
+        )
+        if check:
+            response.raise_for_status()
+        return response
+
+    async def get(self, path: str, shallow: bool = False, **query):
+        """قراءة عقدة؛ query مثل orderBy/equalTo تُرمّز JSON كما يتطلب REST"""
+        params = {name: json.dumps(value) for name, value in query.items()}
+        if shallow:
+            params['shallow'] = 'true'
+        return (await self.request('GET', path, params=params or None)).json()
+
+    async def patch(self, path: str, updates: dict):
+        """تحديث متعدد المسارات في طلب واحد"""
+        await self.request('PATCH', path, json_body=updates)
+
+    async def put(self, path: str, value):
+        await self.request('PUT', path, json_body=value)
+
+    async def delete(self, path: str):
+        await self.request('DELETE', path)
+
+    async def transaction(self, path: str, update_fn, max_retries: int = 25):
+        """معاملة بالكتابة المشروطة (ETag): تُعاد update_fn مع أحدث قيمة عند التعارض"""
+        response = await self.request('GET', path, headers={'X-Firebase-ETag': 'true'})
+        etag, value = response.headers.get('ETag'), response.json()
+        for _ in range(max_retries):
+            new_value = update_fn(value)
+            response = await self.request(
+                'PUT', path, headers={'if-match': etag}, json_body=new_value, check=False
+            )
+            if response.status_code == 412:
+                # كتب غيرنا أولاً: الرد يحمل القيمة الحالية وETag الجديد
+                etag, value = response.headers.get('ETag'), response.json()
+                continue
+            response.raise_for_status()
+            return new_value
+        raise FirebaseTransactionError(f"Transaction on {path} failed after {max_retries} attempts")
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+    # ------------------- إدارة المستخدمين -------------------
+    async def get_user(self, user_id: int) -> dict:
+        """الحصول على بيانات مستخدم (من الكاش إن وجد)"""
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            return cached
+        try:
+            user_data = await self.get(f"users/{user_id}") or {}
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {str(e)}")
+            raise
+        user_cache.put(user_id, user_data)
+        premium_index.set_flag(user_id, bool(user_data.get('is_premium', False)))
+        return user_data
+
+    async def update_user(self, user_id: int, data: dict):
+        """تحديث بيانات مستخدم (كتابة واحدة تمر عبر الكاش)"""
+        try:
+            data = dict(data)
+            data.setdefault('last_activity', time.time())
+            updates = {f"users/{user_id}/{key}": value for key, value in data.items()}
+            updates.update(user_change_updates(user_id))
+            await self.patch('', updates)
+            user_cache.merge(user_id, data)
+        except Exception as e:
+            logger.error(f"Error updating user {user_id}: {str(e)}")
+            user_cache.invalidate(user_id)
+            raise
+
+    async def commit_user(self, user_id: int, changes: dict, new_user: bool = False) -> bool:
+        """تحديث متعدد المسارات واحد: حقول المستخدم وختم user_changes وزيادة total_users للجديد
+
+        للمستخدم الجديد يُكتب joined_at أولاً بمعاملة (ETag) لا تستبدل قيمة موجودة، ولا يُزاد
+        total_users إلا إذا أنشأتها هذه المعاملة. الطلب العادي يبقى كتابة واحدة.
+        """
+        data = dict(changes)
+        now = time.time()
+        data.setdefault('last_activity', now)
+        data.pop('joined_at', None)
+        state = {'created': False}
+
+        def create(joined_at):
+            state['created'] = joined_at is None
+            return now if joined_at is None else joined_at
+
+        try:
+            if new_user:
+                data['joined_at'] = await self.transaction(f"users/{user_id}/joined_at", create)
+            updates = {f"users/{user_id}/{key}": value for key, value in data.items() if key != 'joined_at'}
+            updates.update(user_change_updates(user_id))
+            if state['created']:
+                updates.update(stats_increment_updates({'total_users': 1}))
+            await self.patch('', updates)
+            user_cache.merge(user_id, data)
+            return state['created']
+        except Exception as e:
+            logger.error(f"Error committing user {user_id}: {str(e)}")
+            user_cache.invalidate(user_id)
+            raise
+
+    async def apply_usage(self, users: dict, total: int, hourly: dict):
+        """تحديث متعدد المسارات واحد لكل الزيادات المعلقة (زيادة على الخادم)"""
+        updates = {}
+        for user_id, pending in users.items():
+            path = f"users/{user_id}"
+            updates[f"{path}/request_count"] = server_increment(pending['count'])
+            updates[f"{path}/last_request"] = pending['last_request']
+            updates[f"{path}/last_activity"] = pending['last_request']
+            updates.update(user_change_updates(user_id))
+        updates.update(stats_increment_updates({'total_requests': total}))
+        for period, buckets in ((HOURLY, hourly), (DAILY, daily_rollup(hourly))):
+            for key, fields in buckets.items():
+                for field, delta in fields.items():
+                    updates[f"usage/{period}/{key}/{field}"] = server_increment(delta)
+        await self.patch('', updates)
+        for user_id, pending in users.items():
+            user_cache.add(user_id, 'request_count', pending['count'])
+            user_cache.merge(user_id, {'last_request': pending['last_request'], 'last_activity': pending['last_request']})
+
+    async def touch_user(self, user_id: int):
+        user_cache.invalidate(user_id)
+        try:
+            await self.patch('', user_change_updates(user_id))
+        except Exception as e:
+            logger.error(f"Error recording change for user {user_id}: {str(e)}")
+
+    async def get_all_users(self) -> dict:
+        try:
+            return await self.get('users') or {}
+        except Exception as e:
+            logger.error(f"Error getting all users: {str(e)}")
+            return {}
+
+    async def iter_user_pages(self, page_size: int = None):
+        """صفحات /users مرتبة بالمفتاح (orderBy=$key, startAt, limitToFirst)"""
+        page_size = page_size or Config.USER_PAGE_SIZE
+        last_key = None
+        while True:
+            query = {'orderBy': '$key', 'limitToFirst': page_size + (last_key is not None)}
+            if last_key is not None:
+                # startAt شامل: نطلب عنصراً إضافياً ونسقط المفتاح المكرر
+                query['startAt'] = last_key
+            page = await self.get('users', **query) or {}
+            page.pop(last_key, None)
+            if not page:
+                return
+            yield page
+            last_key = max(page, key=firebase_key_order)
+
+    async def ban_user(self, user_id: int, reason: str = ""):
+        try:
+            await self.put(f"banned_users/{user_id}", {'timestamp': time.time(), 'reason': reason})
+            banned_users.add(user_id)
+        except Exception as e:
+            logger.error(f"Error banning user {user_id}: {str(e)}")
+            raise
+
+    async def unban_user(self, user_id: int):
+        try:
+            await self.delete(f"banned_users/{user_id}")
+            banned_users.discard(user_id)
+        except Exception as e:
+            logger.error(f"Error unbanning user {user_id}: {str(e)}")
+            raise
+
+    async def get_premium_users(self) -> dict:
+        try:
+            return await self.get('premium_users') or {}
+        except Exception as e:
+            logger.error(f"Error getting premium users: {str(e)}")
+            return {}
+
+    async def register_user(self, user_id: int) -> bool:
+        """إنشاء سجل المستخدم عند أول ظهور وزيادة عداد المستخدمين مرة واحدة فقط"""
+        state = {'created': False}
+
+        def create(user):
+            state['created'] = user is None
+            return user if user is not None else {'joined_at': time.time(), 'last_activity': time.time()}
+
+        try:
+            await self.transaction(f"users/{user_id}", create)
+            if state['created']:
+                await self.touch_user(user_id)
+                await self.increment_stats(total_users=1)
+            return state['created']
+        except Exception as e:
+            logger.error(f"Error registering user {user_id}: {str(e)}")
+            return False
+
+    async def set_premium_flag(self, user_id: int, is_premium: bool) -> bool:
+        """تغيير علامة is_premium وتعديل عداد المميزين فقط عند تغيرها فعلاً"""
+        state = {'changed': False}
+
+        def flip(current):
+            state['changed'] = bool(current) != is_premium
+            return is_premium
+
+        try:
+            await self.transaction(f"users/{user_id}/is_premium", flip)
+            premium_index.set_flag(user_id, is_premium)
+            if state['changed']:
+                await self.touch_user(user_id)
+                await self.increment_stats(premium_users=1 if is_premium else -1)
+            return state['changed']
+        except Exception as e:
+            logger.error(f"Error setting premium flag for user {user_id}: {str(e)}")
+            return False
+
+    # ------------------- الإحصاءات -------------------
+    async def get_stats(self) -> dict:
+        try:
+            stats = await self.get('stats')
+            if not stats:
+                stats = {
+                    'total_users': await self.count_users(),
+                    'premium_users': await self.count_premium_users(),
+                    'total_requests': 0
+                }
+                await self.put('stats', stats)
+            return stats
+        except Exception as e:
+            logger.error(f"Error getting stats: {str(e)}", exc_info=True)
+            return {}
+
+    async def update_stats(self, data: dict):
+        try:
+            await self.patch('stats', data)
+        except Exception as e:
+            logger.error(f"Error updating stats: {str(e)}")
+            raise
+
+    async def increment_stats(self, **deltas):
+        try:
+            updates = stats_increment_updates(deltas)
+            if updates:
+                await self.patch('', updates)
+        except Exception as e:
+            logger.error(f"Error incrementing stats: {str(e)}")
+            raise
+
+    # ------------------- سجل الاستخدام -------------------
+    async def get_usage_history(self, hours: int = 24, days: int = 7) -> dict:
+        """قراءة مرتبة بالمفتاح لكل نوع حاوية تبدأ من أقدم حاوية مطلوبة"""
+        now = time.time()
+        history = {HOURLY: {}, DAILY: {}}
+        try:
+            if hours > 0:
+                history[HOURLY] = await self.get(
+                    f"usage/{HOURLY}", orderBy='$key', startAt=hour_key(now - (hours - 1) * 3600)
+                ) or {}
+            if days > 0:
+                history[DAILY] = await self.get(
+                    f"usage/{DAILY}", orderBy='$key', startAt=day_key(now - (days - 1) * 86400)
+                ) or {}
+        except Exception as e:
+            logger.error(f"Error getting usage history: {str(e)}")
+        return history
+
+    async def prune_usage_history(self) -> int:
+        """حذف الحاويات القديمة على دفعات (endAt قبل أول مفتاح محفوظ) بتحديث متعدد المسارات"""
+        hour_cutoff, day_cutoff = retention_cutoffs(
+            time.time(), Config.USAGE_HOURLY_RETENTION_DAYS, Config.USAGE_DAILY_RETENTION_DAYS
+        )
+        deleted = 0
+        for period, cutoff in ((HOURLY, hour_cutoff), (DAILY, day_cutoff)):
+            while True:
+                old = await self.get(
+                    f"usage/{period}", orderBy='$key', endAt=cutoff, limitToFirst=Config.USER_PAGE_SIZE
+                ) or {}
+                old.pop(cutoff, None)
+                if not old:
+                    break
+                await self.patch('', {f"usage/{period}/{key}": None for key in old})
+                deleted += len(old)
+        return deleted
+
+    async def prune_user_changes(self) -> int:
+        """حذف أختام user_changes القديمة حتى تبقى لقطة الاستماع الأولى صغيرة
+
+        العقدة فيها ختم واحد لكل مستخدم (يُستبدل عند كل كتابة)، وبعد USER_CACHE_TTL تكون أي نسخة
+        مخزنة من سجله قد انتهت صلاحيتها فلا حاجة لإبطالها. الاستعلام المرتب بالقيمة يحتاج
+        ".indexOn": ".value" على user_changes، وبدونه نمر على العقدة صفحات مرتبة بالمفتاح.
+        """
+        cutoff = time.time() - max(Config.USER_CHANGES_RETENTION_HOURS * 3600, Config.USER_CACHE_TTL)
+        deleted = 0
+        try:
+            while True:
+                old = await self.get(
+                    'user_changes', orderBy='$value', endAt=cutoff, limitToFirst=Config.USER_PAGE_SIZE
+                ) or {}
+                if not old:
+                    return deleted
+                await self.patch('', {f"user_changes/{user_id}": None for user_id in old})
+                deleted += len(old)
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"Indexed user_changes query failed, scanning by key: {str(e)}")
+
+        last_key = None
+        while True:
+            query = {'orderBy': '$key', 'limitToFirst': Config.USER_PAGE_SIZE + (last_key is not None)}
+            if last_key is not None:
+                query['startAt'] = last_key
+            page = await self.get('user_changes', **query) or {}
+            page.pop(last_key, None)
+            if not page:
+                return deleted
+            old = [user_id for user_id, stamp in page.items() if isinstance(stamp, (int, float)) and stamp < cutoff]
+            if old:
+                await self.patch('', {f"user_changes/{user_id}": None for user_id in old})
+                deleted += len(old)
+            last_key = max(page, key=firebase_key_order)
+
+    async def count_users(self) -> int:
+        try:
+            users = await self.get('users', shallow=True)
+            return len(users) if users else 0
+        except Exception as e:
+            logger.error(f"Error counting users: {str(e)}")
+            return 0
+
+    async def flagged_premium_ids(self) -> list:
+        try:
+            users = await self.get('users', orderBy='is_premium', equalTo=True)
+            return list((users or {}).keys())
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"Indexed premium query failed, scanning users: {str(e)}")
+        return [str(user_id) async for user_id, user in self.iter_users() if user.get('is_premium', False)]
+
+    async def count_premium_users(self) -> int:
+        try:
+            return len(await self.flagged_premium_ids())
+        except Exception as e:
+            logger.error(f"Error counting premium users: {str(e)}")
+            return 0
+
+    async def reconcile_user_counts(self) -> dict:
+        premium_ids = await self.flagged_premium_ids()
+        premium_index.replace_flags(premium_ids)
+        counts = {'total_users': await self.count_users(), 'premium_users': len(premium_ids)}
+        stored = await self.get('stats') or {}
+        drift = {name: counts[name] - stored.get(name, 0) for name in counts}
+        if any(drift.values()):
+            logger.warning(f"Stats counters drifted by {drift}, correcting")
+            await self.patch('stats', counts)
+        return {**counts, 'drift': drift}
+
+    async def initialize_stats(self):
+        try:
+            if not await self.get('stats', shallow=True):
+                await self.put('stats', {
+                    'total_users': await self.count_users(),
+                    'premium_users': await self.count_premium_users(),
+                    'total_requests': 0
+                })
+        except Exception as e:
+            logger.error(f"Error initializing stats: {str(e)}")
+            raise
+
+    # ------------------- الإعدادات -------------------
+    async def get_settings(self) -> dict:
+        try:
+            settings = await self.get('settings') or {}
+            if not settings:
+                settings = live_settings.current._asdict()
+                await self.put('settings', settings)
+            return settings
+        except Exception as e:
+            logger.error(f"Error getting settings: {str(e)}")
+            return {}
+
+    async def update_settings(self, new_settings: dict):
+        try:
+            await self.patch('settings', new_settings)
+            live_settings.apply(new_settings)
+        except Exception as e:
+            logger.error(f"Error updating settings: {str(e)}")
+            raise
+
+    # ------------------- دورة الحياة -------------------
+    async def check_connection(self):
+        stamp = int(time.time())
+        await self.put('connection_test', stamp)
+        logger.info(f"✅ Firebase test write successful. Timestamp: {await self.get('connection_test')}")
+
+    async def load_state(self):
+        """التحميل الأولي عبر REST، ثم الاستماع للتغييرات عبر firebase_admin في خيط منفصل"""
+        live_settings.apply(await self.get_settings(), replace=True)
+        try:
+            banned_users.replace((await self.get('banned_users', shallow=True) or {}).keys())
+        except Exception as e:
+            logger.error(f"Error loading banned users: {str(e)}")
+        try:
+            premium_index.replace_flags(await self.flagged_premium_ids())
+        except Exception as e:
+            logger.error(f"Error loading premium flags: {str(e)}")
+
+        from firebase_db import start_listeners
+        await asyncio.to_thread(start_listeners)
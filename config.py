@@ -21,12 +21,25 @@ class Config:
     if not CHANNEL_USERNAME:
         raise ValueError("يجب تعيين متغير CHANNEL_USERNAME في إعدادات Render")
 
+    ##############################################
+    #               إعدادات التخزين               #
+    ##############################################
+
+    # firebase أو sql (SQLite/PostgreSQL حسب SQL_DATABASE_URL)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase").strip().lower()
+    SQL_DATABASE_URL = os.getenv("SQL_DATABASE_URL", "sqlite:///bot.sqlite3")
+    SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "10"))
+
+    # المرور على المستخدمين (البث، إعادة العد، الترحيل) على صفحات بدل تحميل الشجرة كاملة
+    USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", "500"))
+    USER_PAGE_PREFETCH = int(os.getenv("USER_PAGE_PREFETCH", "1"))
+
     ##############################################
     #            إعدادات Firebase                #
     ##############################################
 
     FIREBASE_DATABASE_URL = os.getenv("FIREBASE_DATABASE_URL")
-    if not FIREBASE_DATABASE_URL:
+    if not FIREBASE_DATABASE_URL and STORAGE_BACKEND == "firebase":
         raise ValueError("يجب تعيين متغير FIREBASE_DATABASE_URL في إعدادات Render")
 
     FIREBASE_SERVICE_ACCOUNT = None
@@ -38,6 +51,20 @@ class Config:
         logging.error(f"خطأ في تحليل بيانات Firebase: {str(e)}")
         raise ValueError("تكوين Firebase غير صالح")
 
+    # عميل REST غير المتزامن لقاعدة البيانات
+    FIREBASE_MAX_CONNECTIONS = int(os.getenv("FIREBASE_MAX_CONNECTIONS", "20"))
+    FIREBASE_TIMEOUT = float(os.getenv("FIREBASE_TIMEOUT", "10"))
+
+    # إعادة عد المستخدمين دورياً لتصحيح العدادات المحفوظة (0 = تعطيل)
+    STATS_RECONCILE_HOURS = float(os.getenv("STATS_RECONCILE_HOURS", "24"))
+
+    # كاش سجلات المستخدمين (يُبطل عبر الاستماع إلى عقدة user_changes)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "5000"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+    USER_CACHE_LISTEN = os.getenv("USER_CACHE_LISTEN", "true").lower() == "true"
+    # أختام user_changes الأقدم من هذه المدة تُحذف مع تنظيف سجل الاستخدام (لا تقل عن USER_CACHE_TTL)
+    USER_CHANGES_RETENTION_HOURS = float(os.getenv("USER_CHANGES_RETENTION_HOURS", "24"))
+
     ##############################################
     #             حدود الاستخدام                 #
     ##############################################
@@ -46,8 +73,8 @@ class Config:
     PREMIUM_CHAR_LIMIT = int(os.getenv("PREMIUM_CHAR_LIMIT", "500"))
     REQUEST_LIMIT = int(os.getenv("REQUEST_LIMIT", "10"))
     PREMIUM_REQUEST_LIMIT = int(os.getenv("PREMIUM_REQUEST_LIMIT", "50"))
-    RESET_HOURS = int(os.getenv("RESET_HOURS", "24"))
-    PREMIUM_RESET_HOURS = int(os.getenv("PREMIUM_RESET_HOURS", "24"))
+    RESET_HOURS = float(os.getenv("RESET_HOURS", "24"))
+    PREMIUM_RESET_HOURS = float(os.getenv("PREMIUM_RESET_HOURS", "24"))
     ##############################################
     #            إعدادات المشرفين                #
     ##############################################
@@ -83,6 +110,107 @@ class Config:
     ##############################################
     OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "gpt-3.5-turbo")
 
+    ##############################################
+    #          إعدادات اتصال OpenRouter           #
+    ##############################################
+    # لاختبارات الحمل: http://127.0.0.1:8089/api/v1 مع python -m utils.fake_openrouter
+    OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+    OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+    OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+    OPENROUTER_MAX_INFLIGHT = int(os.getenv("OPENROUTER_MAX_INFLIGHT", "10"))
+    OPENROUTER_HTTP2 = os.getenv("OPENROUTER_HTTP2", "true").lower() == "true"
+
+    # طلبات احتياطية (hedging) لنماذج بديلة عند تأخر النموذج الأساسي
+    OPENROUTER_FALLBACK_MODELS = [m.strip() for m in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(',') if m.strip()]
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1"))
+    HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", "30"))
+
+    # حد تزامن متكيف (AIMD) وقاطع دائرة لكل مفتاح API
+    ADAPTIVE_INITIAL_LIMIT = int(os.getenv("ADAPTIVE_INITIAL_LIMIT", "4"))
+    ADAPTIVE_MIN_LIMIT = int(os.getenv("ADAPTIVE_MIN_LIMIT", "1"))
+    ADAPTIVE_MAX_LIMIT = int(os.getenv("ADAPTIVE_MAX_LIMIT", str(OPENROUTER_MAX_INFLIGHT)))
+    ADAPTIVE_LATENCY_FACTOR = float(os.getenv("ADAPTIVE_LATENCY_FACTOR", "3"))
+    ADAPTIVE_QUEUE_TIMEOUT = float(os.getenv("ADAPTIVE_QUEUE_TIMEOUT", "15"))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+    CIRCUIT_PROBE_RETRY = float(os.getenv("CIRCUIT_PROBE_RETRY", "5"))
+
+    # كاش التحقق من مفاتيح API الشخصية
+    KEY_HASH_SALT = os.getenv("KEY_HASH_SALT", "")
+    KEY_CACHE_SIZE = int(os.getenv("KEY_CACHE_SIZE", "10000"))
+    KEY_VALID_TTL = int(os.getenv("KEY_VALID_TTL", "3600"))
+    KEY_INVALID_TTL = int(os.getenv("KEY_INVALID_TTL", "300"))
+    KEY_REFRESH_MARGIN = int(os.getenv("KEY_REFRESH_MARGIN", "600"))
+    KEY_REVALIDATE_INTERVAL = int(os.getenv("KEY_REVALIDATE_INTERVAL", "60"))
+
+    # عرض الرد تدريجياً أثناء وصوله مع تجميع التعديلات لاحترام حد تيليجرام
+    STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+    STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "20"))
+
+    ##############################################
+    #            كاش نتائج المعالجة               #
+    ##############################################
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+    CACHE_TTL = int(os.getenv("CACHE_TTL", "86400"))
+    CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "result_cache.sqlite3")
+    CACHE_DISK_TTL = int(os.getenv("CACHE_DISK_TTL", str(7 * 86400)))
+    CACHE_HITS_COUNT_QUOTA = os.getenv("CACHE_HITS_COUNT_QUOTA", "true").lower() == "true"
+
+    ##############################################
+    #        تجميع النصوص القصيرة في دفعات         #
+    ##############################################
+    BATCH_ENABLED = os.getenv("BATCH_ENABLED", "false").lower() == "true"
+    BATCH_MODES = [mode.strip() for mode in os.getenv("BATCH_MODES", "correct,spelling").split(',') if mode.strip()]
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "8"))
+    BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "100"))
+    BATCH_MAX_CHARS = int(os.getenv("BATCH_MAX_CHARS", str(CHAR_LIMIT)))
+
+    ##############################################
+    #           جدولة طلبات المعالجة              #
+    ##############################################
+    SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", str(OPENROUTER_MAX_INFLIGHT)))
+    QUEUE_UPDATE_INTERVAL = float(os.getenv("QUEUE_UPDATE_INTERVAL", "2.0"))
+
+    ##############################################
+    #        تقسيم النصوص الطويلة إلى أجزاء        #
+    ##############################################
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+    CHUNK_CHARS_PER_TOKEN = float(os.getenv("CHUNK_CHARS_PER_TOKEN", "3"))
+    CHUNK_MAX_PARALLEL = int(os.getenv("CHUNK_MAX_PARALLEL", "4"))
+
+    # ذاكرة جمل آخر نص لكل مستخدم (إعادة إرسال الجمل المعدلة فقط)
+    MEMO_MAX_USERS = int(os.getenv("MEMO_MAX_USERS", "10000"))
+    MEMO_TTL = int(os.getenv("MEMO_TTL", "3600"))
+    # أقل تشابه (difflib) بين الجملة وناتجها حتى يُعد الناتج تصحيحاً لها
+    MEMO_MIN_SIMILARITY = float(os.getenv("MEMO_MIN_SIMILARITY", "0.6"))
+
+    ##############################################
+    #          الفحص الإملائي المحلي المسبق         #
+    ##############################################
+    # يُجيب محلياً في وضع التدقيق الإملائي فقط؛ التصحيح النحوي يمر دائماً على النموذج
+    SPELL_PREPASS_ENABLED = os.getenv("SPELL_PREPASS_ENABLED", "true").lower() == "true"
+    SPELL_LEXICON_PATH = os.getenv("SPELL_LEXICON_PATH", "data/arabic_lexicon.txt")
+    SPELL_WORKERS = int(os.getenv("SPELL_WORKERS", "1"))
+
+    ##############################################
+    #        الكتابة المؤجلة لعدادات الاستخدام       #
+    ##############################################
+    # أقصى ما قد يضيع عند توقف مفاجئ: طلبات آخر USAGE_FLUSH_INTERVAL_MS أو USAGE_FLUSH_MAX_EVENTS طلباً
+    USAGE_FLUSH_INTERVAL_MS = int(os.getenv("USAGE_FLUSH_INTERVAL_MS", "2000"))
+    USAGE_FLUSH_MAX_EVENTS = int(os.getenv("USAGE_FLUSH_MAX_EVENTS", "50"))
+
+    # سجل الاستخدام في حاويات ساعية ويومية (UTC) مع مدة احتفاظ لكل نوع
+    USAGE_HOURLY_RETENTION_DAYS = float(os.getenv("USAGE_HOURLY_RETENTION_DAYS", "7"))
+    USAGE_DAILY_RETENTION_DAYS = float(os.getenv("USAGE_DAILY_RETENTION_DAYS", "365"))
+    USAGE_PRUNE_HOURS = float(os.getenv("USAGE_PRUNE_HOURS", "6"))
+
     ##############################################
     #              التحقق من الإعدادات            #
     ##############################################
@@ -93,12 +221,13 @@ class Config:
             'BOT_TOKEN': 'توكن البوت',
             'WEBHOOK_URL': 'رابط Webhook',
             'PORT': 'منفذ التشغيل',
-            'FIREBASE_DATABASE_URL': 'رابط قاعدة بيانات Firebase',
-            'FIREBASE_SERVICE_ACCOUNT': 'بيانات اعتماد Firebase',
             'ADMIN_USERNAMES': 'قائمة المشرفين',
             'CHANNEL_USERNAME': 'اسم قناة العرض',
             'OPENROUTER_API_KEY': 'مفتاح OpenRouter'
         }
+        if cls.STORAGE_BACKEND == "firebase":
+            required_vars['FIREBASE_DATABASE_URL'] = 'رابط قاعدة بيانات Firebase'
+            required_vars['FIREBASE_SERVICE_ACCOUNT'] = 'بيانات اعتماد Firebase'
 
         missing = []
         for var, desc in required_vars.items():
@@ -0,0 +1,145 @@
+from cachetools import TTLCache
+from config import Config
+from storage import STAT_COUNTERS
+import logging
+import threading
+import time
+
+# أدوات مشتركة بين AsyncFirebaseDB (REST) ومستمعي firebase_db، بلا اعتماد على firebase_admin
+
+logger = logging.getLogger(__name__)
+
+
+def firebase_key_order(key: str) -> tuple:
+    """ترتيب Firebase للمفاتيح: الأعداد الصحيحة (32 بت) أولاً رقمياً ثم النصوص"""
+    if key.lstrip('-').isdigit() and -2 ** 31 <= int(key) < 2 ** 31:
+        return (0, int(key), '')
+    return (1, 0, key)
+
+
+class UserCache:
+    """كاش مشترك لسجلات المستخدمين (LRU مع مدة صلاحية) يُبطل عند تغير المستخدم في أي نسخة من البوت
+
+    كل كتابة على مستخدم تسجل وقتها في user_changes/<id> ضمن نفس التحديث،
+    ونستمع لتلك العقدة الصغيرة بدل الاستماع لشجرة /users كاملة.
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+        self._lock = threading.Lock()
+        self._own_writes = {}
+        self._listener = None
+        self.last_event_at = None
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'stale_age_total': 0.0, 'max_stale_age': 0.0}
+
+    def get(self, user_id: int) -> dict:
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            age = time.time() - entry[1]
+            self.stats['stale_age_total'] += age
+            self.stats['max_stale_age'] = max(self.stats['max_stale_age'], age)
+            return dict(entry[0])
+
+    def put(self, user_id: int, data: dict):
+        with self._lock:
+            self._cache[user_id] = (dict(data), time.time())
+
+    def merge(self, user_id: int, data: dict):
+        """تطبيق كتابتنا على النسخة المخزنة إن وجدت (write-through)"""
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                entry[0].update(data)
+
+    def add(self, user_id: int, field: str, delta):
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                entry[0][field] = entry[0].get(field, 0) + delta
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._cache.pop(user_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def mark_own_write(self, user_id: int, stamp: float):
+        # بدون مستمع لن يصل الصدى الذي يحذف الختم
+        if self._listener is not None:
+            self._own_writes[str(user_id)] = stamp
+
+    def start(self, root_ref):
+        """بدء الاستماع لعقدة user_changes (مرة واحدة لكل العملية)"""
+        if self._listener is not None or not Config.USER_CACHE_LISTEN:
+            return
+        try:
+            self._listener = root_ref.child('user_changes').listen(self._on_event)
+        except Exception as e:
+            logger.error(f"Error starting user cache listener: {str(e)}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _on_event(self, event):
+        """أحداث الاستماع تصل في خيط منفصل من firebase_admin"""
+        self.last_event_at = time.time()
+        path = event.path.strip('/')
+        if not path:
+            # أول حدث هو لقطة العقدة كاملة عند الاتصال: نبطل كل ما قد يكون فاتنا
+            if event.event_type == 'put':
+                with self._lock:
+                    self._cache.clear()
+                return
+            changes = event.data or {}
+        else:
+            changes = {path.split('/')[0]: event.data}
+
+        for user_id, stamp in changes.items():
+            # صدى كتاباتنا نحن: النسخة المخزنة محدثة بالفعل
+            if stamp is not None and self._own_writes.get(user_id) == stamp:
+                self._own_writes.pop(user_id, None)
+                continue
+            if user_id.lstrip('-').isdigit():
+                self.invalidate(int(user_id))
+
+    def get_stats(self) -> dict:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'size': len(self._cache),
+            'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+            'avg_stale_age': self.stats['stale_age_total'] / self.stats['hits'] if self.stats['hits'] else 0.0,
+            'listening': self._listener is not None,
+            'last_event_ago': time.time() - self.last_event_at if self.last_event_at else None
+        }
+
+
+user_cache = UserCache()
+
+
+def server_increment(value: int) -> dict:
+    """قيمة خادم تزيد الحقل ذرياً بدل قراءته ثم كتابته"""
+    return {'.sv': {'increment': value}}
+
+
+def stats_increment_updates(deltas: dict) -> dict:
+    """مسارات تحديث متعدد تزيد عدادات الإحصاءات (للدمج مع كتابات أخرى)"""
+    updates = {}
+    for name, delta in deltas.items():
+        if name not in STAT_COUNTERS:
+            raise ValueError(f"Unknown stats counter: {name}")
+        if delta:
+            updates[f"stats/{name}"] = server_increment(delta)
+    return updates
+
+
+def user_change_updates(user_id: int) -> dict:
+    """مسار سجل التغييرات الذي يُضاف لكل كتابة على المستخدم حتى تُبطل النسخ الأخرى كاشها"""
+    stamp = time.time()
+    user_cache.mark_own_write(user_id, stamp)
+    return {f"user_changes/{user_id}": stamp}
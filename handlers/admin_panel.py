@@ -3,10 +3,25 @@ from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from config import Config
-from firebase_db import FirebaseDB
+from firebase_common import user_cache
+from utils.bans import banned_users
+from utils.batching import micro_batcher
+from utils.cache import result_cache
+from utils.circuit_breaker import upstream_guards
+from utils.hedging import hedge_policy
+from utils.incremental import sentence_memo
+from utils.limits import limiter
+from utils.openrouter import key_validator
+from utils.premium_index import premium_index
+from utils.prepass import spell_prepass
+from utils.request_context import request_stats
+from utils.scheduler import request_scheduler
+from utils.settings import live_settings
+from utils.singleflight import llm_flights
+from utils.usage_history import sparkline, summarize
 
 logger = logging.getLogger(__name__)
-db = FirebaseDB()
+db = limiter.db
 
 def is_admin(username: str) -> bool:
     """التحقق من صلاحية المشرف"""
@@ -14,6 +29,12 @@ def is_admin(username: str) -> bool:
         return False
     return username.lower() in [admin.lower() for admin in Config.ADMIN_USERNAMES]
 
+MAINTENANCE_MESSAGE = "🚧 البوت في وضع الصيانة حالياً، يرجى المحاولة لاحقاً."
+
+def blocked_by_maintenance(username: str) -> bool:
+    """وضع الصيانة يوقف المعالجة لغير المشرفين (يُقرأ من الإعدادات في الذاكرة)"""
+    return live_settings.current.maintenance_mode and not is_admin(username)
+
 async def check_admin(update: Update):
     """تحقق أساسي من صلاحية المشرف"""
     if not is_admin(update.effective_user.username):
@@ -31,6 +52,8 @@ async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     📊 /admin_stats - عرض إحصاءات البوت
     🔎 /admin_check - فحص البيانات الحية
+    🗄 /admin_cache - إحصاءات كاش النتائج
+    ⚙️ /admin_perf - مؤشرات أداء المعالجة
     🔍 /admin_find [user_id] - البحث عن مستخدم
     ⭐ /admin_promote [user_id] - ترقية مستخدم
     🔓 /admin_demote [user_id] - إلغاء ترقية
@@ -53,9 +76,9 @@ async def admin_check_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        stats = db.get_stats()
-        users_count = db.count_users()
-        premium_count = db.count_premium_users()
+        stats = await db.get_stats()
+        users_count = await db.count_users()
+        premium_count = await db.count_premium_users()
 
         message = (
             f"📊 البيانات الحية:\n"
@@ -74,13 +97,10 @@ async def admin_test_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        # تحديث الإحصاءات يدوياً
-        db.update_stats({
-            'total_users': db.count_users(),
-            'premium_users': db.count_premium_users()
-        })
+        # إعادة عد المستخدمين وتصحيح العدادات يدوياً
+        await db.reconcile_user_counts()
         
-        stats = db.get_stats()
+        stats = await db.get_stats()
         await update.message.reply_text(f"✅ تم تحديث الإحصاءات يدويًا\n{stats}")
     except Exception as e:
         logger.error(f"Test stats error: {str(e)}")
@@ -92,24 +112,161 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        stats = db.get_stats()
+        stats = await db.get_stats()
         if not stats:
             await update.message.reply_text("⚠️ لا توجد إحصاءات متاحة حالياً")
             return
 
+        # حاويات الساعات والأيام (قراءة لكل نوع) بدل عداد يومي يُصفّر
+        usage = summarize(await db.get_usage_history(hours=24, days=7))
+        hourly = usage['hourly']
+        modes = "، ".join(f"{mode}: {count}" for mode, count in sorted(usage['modes'].items())) or "—"
+        days = "\n".join(f"   {key[:4]}-{key[4:6]}-{key[6:]}: {count}" for key, count in usage['daily'])
+
         message = (
             f"📊 إحصائيات البوت (آخر تحديث: {datetime.now().strftime('%Y-%m-%d %H:%M')})\n\n"
             f"👥 إجمالي المستخدمين: {stats.get('total_users', 0)}\n"
             f"⭐ المستخدمون المميزون: {stats.get('premium_users', 0)}\n"
-            f"📨 الطلبات اليومية: {stats.get('daily_requests', 0)}\n"
-            f"📬 إجمالي الطلبات: {stats.get('total_requests', 0)}\n"
-            f"⏳ آخر تجديد: {datetime.fromtimestamp(stats.get('last_reset', 0)).strftime('%Y-%m-%d %H:%M')}"
+            f"📨 طلبات اليوم (UTC): {usage['today'] + limiter.usage.pending_today()}\n"
+            f"📬 إجمالي الطلبات: {stats.get('total_requests', 0)}\n\n"
+            f"🕐 آخر 24 ساعة: {sum(hourly)} (الذروة {max(hourly, default=0)}/ساعة)\n"
+            f"   {sparkline(hourly)}\n"
+            f"👤 حسب الفئة: مميز {usage['tiers']['premium']}، مجاني {usage['tiers']['free']}\n"
+            f"🛠 حسب النوع: {modes}\n\n"
+            f"📅 آخر 7 أيام:\n{days}"
         )
         await update.message.reply_text(message)
     except Exception as e:
         logger.error(f"Error in admin_stats: {str(e)}")
         await update.message.reply_text("⚠️ حدث خطأ أثناء جلب الإحصاءات")
 
+async def admin_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض إحصاءات كاش النتائج"""
+    if not await check_admin(update):
+        return
+
+    try:
+        stats = result_cache.get_stats()
+        disk_size = result_cache.disk_size() if result_cache.disk_path else 0
+
+        message = (
+            f"🗄 كاش النتائج:\n"
+            f"⚡ إصابات الذاكرة: {stats['memory_hits']}\n"
+            f"💾 إصابات القرص: {stats['disk_hits']}\n"
+            f"❌ الإخفاقات: {stats['misses']}\n"
+            f"📈 نسبة الإصابة: {stats['hit_rate']:.1%}\n"
+            f"🧠 عناصر الذاكرة: {stats['memory_size']}\n"
+            f"📦 عناصر القرص: {disk_size}\n"
+            f"🔗 طلبات مدمجة مع طلب جارٍ: {llm_flights.stats['followers']}"
+        )
+        await update.message.reply_text(message)
+    except Exception as e:
+        logger.error(f"Error in admin_cache_stats: {str(e)}")
+        await update.message.reply_text("⚠️ حدث خطأ أثناء جلب إحصاءات الكاش")
+
+async def admin_perf_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """عرض مؤشرات أداء مسار المعالجة"""
+    if not await check_admin(update):
+        return
+
+    try:
+        batch = micro_batcher.get_stats()
+        queue = request_scheduler.get_stats()
+
+        message = (
+            f"⚙️ مؤشرات الأداء:\n\n"
+            f"🚦 الجدولة (حد التزامن {request_scheduler.max_concurrent}):\n"
+            f"- قيد التنفيذ: {queue['active']}\n"
+            f"- في الطابور: {queue['queued_premium']} مميز / {queue['queued_free']} عادي\n"
+            f"- متوسط زمن الخدمة: {queue['avg_service_time']:.1f} ث\n"
+            f"- متوسط الانتظار: {queue['avg_queue_wait']:.1f} ث\n\n"
+            f"📦 الدفعات ({'مفعلة' if Config.BATCH_ENABLED else 'معطلة'}, "
+            f"{Config.BATCH_MAX_ITEMS} نص / {Config.BATCH_WINDOW_MS} ms):\n"
+            f"- عدد الدفعات: {batch['batches']}\n"
+            f"- متوسط حجم الدفعة: {batch['avg_batch_size']:.1f}\n"
+            f"- متوسط الانتظار في الدفعة: {batch['avg_queue_wait_ms']:.0f} ms\n"
+            f"- متوسط زمن الدفعة: {batch['avg_batch_latency_ms']:.0f} ms\n"
+            f"- الرجوع للطلبات الفردية: {batch['fallbacks']}"
+        )
+
+        kinds = {'chat': 'كامل', 'stream': 'أول جزء'}
+        latency_lines = [
+            f"- {model} ({kinds.get(kind, kind)}): "
+            f"p50 {h.percentile(50):.1f}ث / p95 {h.percentile(95):.1f}ث / p99 {h.percentile(99):.1f}ث "
+            f"(مهلة التحوط {hedge_policy.deadline(model, kind):.1f}ث، {h.total} عينة)"
+            for (model, kind), h in hedge_policy.histograms.items()
+        ]
+        message += (
+            f"\n\n⏱ زمن الاستجابة لكل نموذج (الرد الكامل / أول جزء متدفق):\n"
+            + ("\n".join(latency_lines) or "- لا توجد عينات بعد") +
+            f"\n- طلبات احتياطية: {hedge_policy.stats['hedges']} "
+            f"(فاز منها {hedge_policy.stats['hedge_wins']})\n"
+            f"- تحويل فوري بعد خطأ: {hedge_policy.stats['failovers']}"
+        )
+
+        states = {'closed': 'مغلق', 'half_open': 'تجريبي', 'open': 'مفتوح'}
+        guard_lines = []
+        for name, guard in upstream_guards.items():
+            g = guard.get_stats()
+            line = (
+                f"- {name}: القاطع {states[g['state']]}"
+                + (f" ({g['open_for']:.0f}ث)" if g['state'] == 'open' else "")
+                + f"، الحد {g['limit']:.1f}، قيد التنفيذ {g['inflight']}، ضغط {g['overload']}، "
+                + f"أخطاء {g['errors']}، مرفوض {g['rejected']}"
+                + (f"، تمهل {g['throttled']}" if g['throttled'] else "")
+                + "".join(
+                    f"\n   {model}: {states[state]}" for model, state in g['circuits'].items() if state != 'closed'
+                )
+            )
+            guard_lines.append(line)
+        message += "\n\n🛡 حماية OpenRouter:\n" + ("\n".join(guard_lines) or "- لا توجد طلبات بعد")
+
+        users = user_cache.get_stats()
+        message += (
+            f"\n\n👤 كاش المستخدمين ({'متصل' if users['listening'] else 'بدون استماع'}):\n"
+            f"- الحجم: {users['size']}، نسبة الإصابة: {users['hit_rate']:.0%}\n"
+            f"- عمر البيانات عند القراءة: متوسط {users['avg_stale_age']:.1f}ث، أقصى {users['max_stale_age']:.0f}ث\n"
+            f"- إبطال: {users['invalidations']}"
+            + (f"، آخر حدث قبل {users['last_event_ago']:.0f}ث" if users['last_event_ago'] is not None else "")
+        )
+
+        premium = premium_index.get_stats()
+        message += (
+            f"\n\n⭐ فهرس التميز: علامات {premium['flagged']}، منح {premium['granted']} "
+            f"(منتهية {premium['expired']})، API شخصي {premium['api_users']}"
+        )
+        if request_stats['updates']:
+            message += (
+                f"\n\n🔁 طلبات الشبكة لكل تحديث: متوسط "
+                f"{request_stats['round_trips'] / request_stats['updates']:.1f}، أقصى {request_stats['max_round_trips']} "
+                f"({request_stats['updates']} تحديث)"
+            )
+        message += f"\n\n⛔ المحظورون في الذاكرة: {len(banned_users)}، تحديثات مرفوضة: {banned_users.stats['blocked']}"
+
+        keys = key_validator.stats
+        message += (
+            f"\n\n🔑 التحقق من المفاتيح الشخصية:\n"
+            f"- من الكاش: {keys['hits']}، من OpenRouter: {keys['misses']}\n"
+            f"- إعادة تحقق في الخلفية: {keys['revalidated']}، ملغاة: {keys['revoked']}"
+        )
+
+        spell = spell_prepass.stats
+        message += (
+            f"\n\n🔤 الفحص الإملائي المحلي ({'مفعل' if spell_prepass.enabled else 'معطل'}):\n"
+            f"- نصوص سليمة: {spell['clean']}\n"
+            f"- تصحيح محلي: {spell['fixed']}\n"
+            f"- أُرسلت للنموذج: {spell['suspicious']}"
+        )
+        message += (
+            f"\n\n✏️ إعادة التصحيح التدريجي:\n"
+            f"- جمل أُعيد استخدامها: {sentence_memo.stats['reused']}\n"
+            f"- جمل معدلة أُرسلت: {sentence_memo.stats['sent']}"
+        )
+        await update.message.reply_text(message)
+    except Exception as e:
+        logger.error(f"Error in admin_perf_stats: {str(e)}")
+        await update.message.reply_text("⚠️ حدث خطأ أثناء جلب مؤشرات الأداء")
+
 async def admin_find_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """البحث عن مستخدم"""
     if not await check_admin(update):
@@ -121,14 +278,14 @@ async def admin_find_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         user_id = int(context.args[0])
-        user_data = db.get_user(user_id)
+        user_data = await db.get_user(user_id)
         
         if not user_data:
             await update.message.reply_text("❌ المستخدم غير موجود")
             return
 
         is_premium = user_data.get('is_premium', False)
-        is_banned = db.is_banned(user_id)
+        is_banned = await db.is_banned(user_id)
         
         message = (
             f"👤 معلومات المستخدم:\n"
@@ -140,6 +297,9 @@ async def admin_find_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(message)
     except ValueError:
         await update.message.reply_text("⚠️ معرف المستخدم يجب أن يكون رقماً")
+    except Exception as e:
+        logger.error(f"Error finding user: {str(e)}")
+        await update.message.reply_text("❌ تعذرت قراءة بيانات المستخدم")
 
 async def admin_manage_user(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
     """إدارة المستخدمين (ترقية/حظر/إلخ)"""
@@ -152,23 +312,23 @@ async def admin_manage_user(update: Update, context: ContextTypes.DEFAULT_TYPE,
 
     try:
         user_id = int(context.args[0])
-        user_data = db.get_user(user_id)
+        user_data = await db.get_user(user_id)
         
         if not user_data:
             await update.message.reply_text("❌ المستخدم غير موجود")
             return
 
         if action == "promote":
-            db.update_user(user_id, {'is_premium': True})
+            await db.set_premium_flag(user_id, True)
             await update.message.reply_text(f"✅ تم ترقية المستخدم {user_id}")
         elif action == "demote":
-            db.update_user(user_id, {'is_premium': False})
+            await db.set_premium_flag(user_id, False)
             await update.message.reply_text(f"🔓 تم إلغاء ترقية المستخدم {user_id}")
         elif action == "ban":
-            db.ban_user(user_id, "حظر من المشرف")
+            await db.ban_user(user_id, "حظر من المشرف")
             await update.message.reply_text(f"⛔ تم حظر المستخدم {user_id}")
         elif action == "unban":
-            db.unban_user(user_id)
+            await db.unban_user(user_id)
             await update.message.reply_text(f"✅ تم إلغاء حظر المستخدم {user_id}")
             
     except ValueError:
@@ -187,14 +347,14 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     message = " ".join(context.args)
-    users = db.get_all_users()
-    total = len(users)
+    total = await db.count_users()
     success = 0
     failed = 0
 
     progress_msg = await update.message.reply_text(f"⏳ جاري الإرسال... 0/{total}")
 
-    for user_id in users:
+    # المرور على المستخدمين صفحة صفحة بدل تحميل شجرة /users كاملة
+    async for user_id in db.iter_user_ids():
         try:
             await context.bot.send_message(
                 chat_id=user_id,
@@ -227,16 +387,16 @@ async def admin_maintenance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if not context.args:
-        current = db.is_maintenance_mode()
+        current = await db.is_maintenance_mode()
         await update.message.reply_text(f"🚧 وضع الصيانة: {'مفعل' if current else 'معطل'}")
         return
 
     mode = context.args[0].lower()
     if mode in ['on', '1', 'true']:
-        db.update_settings({'maintenance_mode': True})
+        await db.update_settings({'maintenance_mode': True})
         await update.message.reply_text("✅ تم تفعيل وضع الصيانة")
     elif mode in ['off', '0', 'false']:
-        db.update_settings({'maintenance_mode': False})
+        await db.update_settings({'maintenance_mode': False})
         await update.message.reply_text("✅ تم تعطيل وضع الصيانة")
     else:
         await update.message.reply_text("⚠️ استخدم /admin_maintenance [on/off]")
@@ -256,12 +416,12 @@ async def admin_set_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'premium_char_limit': int(context.args[1]),
             'request_limit': int(context.args[2]),
             'premium_request_limit': int(context.args[3]),
-            'reset_hours': int(context.args[4])
+            'reset_hours': float(context.args[4])
         }
-        db.update_settings(new_limits)
+        await db.update_settings(new_limits)
         await update.message.reply_text("✅ تم تحديث الحدود بنجاح!")
     except ValueError:
-        await update.message.reply_text("⚠️ جميع القيم يجب أن تكون أرقاماً صحيحة")
+        await update.message.reply_text("⚠️ الحدود يجب أن تكون أرقاماً صحيحة والساعات رقماً (مثل 1.5)")
     except Exception as e:
         logger.error(f"Error setting limits: {str(e)}")
         await update.message.reply_text("❌ حدث خطأ أثناء تحديث الحدود")
@@ -272,6 +432,8 @@ def setup_admin_commands(application):
     application.add_handler(CommandHandler("admin_stats", admin_stats))
     application.add_handler(CommandHandler("admin_find", admin_find_user))
     application.add_handler(CommandHandler("admin_check", admin_check_data))
+    application.add_handler(CommandHandler("admin_cache", admin_cache_stats))
+    application.add_handler(CommandHandler("admin_perf", admin_perf_stats))
     # إدارة المستخدمين
     application.add_handler(CommandHandler("admin_promote", 
         lambda u, c: admin_manage_user(u, c, "promote")))
@@ -1,12 +1,17 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from utils.limits import limiter
-from utils.openrouter import validate_user_api
-from config import Config
+from utils.openrouter import key_validator, validate_user_api
+from utils.settings import live_settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+API_KEY_REVOKED_MESSAGE = (
+    "🔑 تم إلغاء مفتاح API الخاص بك في OpenRouter، فأُعيد حسابك إلى الحساب العادي.\n"
+    "لاستخدام مفتاح جديد أرسل: /setapi مفتاحك_الجديد"
+)
+
 async def set_api(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = update.effective_user.id
@@ -22,11 +27,12 @@ async def set_api(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         api_key = context.args[0]
         if await validate_user_api(api_key):
-            limiter.set_premium_user(user_id, api_key)
+            await limiter.set_premium_user(user_id, api_key)
+            key_validator.track(api_key)
             await update.message.reply_text(
                 "✅ تم تفعيل API الخاص بنجاح!\n"
-                f"📊 الآن لديك {Config.PREMIUM_REQUEST_LIMIT} طلباً يومياً\n"
-                f"📝 وحد أقصى {Config.PREMIUM_CHAR_LIMIT} حرفاً للنص"
+                f"📊 الآن لديك {live_settings.current.premium_request_limit} طلباً يومياً\n"
+                f"📝 وحد أقصى {live_settings.current.premium_char_limit} حرفاً للنص"
             )
         else:
             await update.message.reply_text("❌ مفتاح API غير صالح!")
@@ -38,8 +44,9 @@ async def set_api(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def unset_api(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         user_id = update.effective_user.id
-        if limiter.is_premium_user(user_id):
-            del limiter.premium_users[user_id]
+        if user_id in limiter.premium_users:
+            key_validator.untrack(limiter.premium_users[user_id]['api_key'])
+            await limiter.remove_premium_user(user_id)
             await update.message.reply_text("✅ تم إلغاء تفعيل API الخاص بك.")
         else:
             await update.message.reply_text("⚠️ لم يكن لديك API مفعل.")
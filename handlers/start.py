@@ -1,38 +1,38 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler, MessageHandler, filters
-from utils.limits import limiter
-from utils.openrouter import query_openrouter
+from utils.circuit_breaker import UpstreamBusyError
+from utils.key_validation import ApiKeyRevokedError
+from utils.openrouter import revoke_user_api
+from utils.pipeline import TextJob
+from utils.request_context import current_request, request_scoped
+from utils.settings import live_settings
+from utils.streaming import StreamingMessage
+from handlers.admin_panel import MAINTENANCE_MESSAGE, blocked_by_maintenance
+from handlers.premium import API_KEY_REVOKED_MESSAGE
 from handlers.subscription import check_subscription, send_subscription_message
-from config import Config
+import html
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+@request_scoped
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        user_id = update.effective_user.id
-
         if not await check_subscription(update, context):
             await send_subscription_message(update, context)
             return
 
-        is_premium = limiter.is_premium_user(user_id)
-        user_data = limiter.db.get_user(user_id) or {}
-
-        # إذا المستخدم جديد (أي لا يوجد له بيانات)
-        if not user_data:
-            limiter.db.update_stats({
-                'total_users': limiter.db.count_users(),
-                'premium_users': limiter.db.count_premium_users()
-            })
+        # المستخدم الجديد يُسجل عند نهاية التحديث (RequestContext.commit)
+        request = current_request()
+        user_data = await request.load()
 
         current_time = time.time()
-        request_limit = Config.PREMIUM_REQUEST_LIMIT if is_premium else Config.REQUEST_LIMIT
-        char_limit = Config.PREMIUM_CHAR_LIMIT if is_premium else Config.CHAR_LIMIT
-        reset_hours = Config.PREMIUM_RESET_HOURS if is_premium else Config.RESET_HOURS
+        request_limit = request.request_limit
+        char_limit = request.char_limit
+        reset_hours = request.reset_hours
 
-        request_count = user_data.get('request_count', 0)
+        request_count = request.request_count
         reset_time = user_data.get('reset_time', current_time + (reset_hours * 3600))
 
         try:
@@ -41,9 +41,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except (TypeError, ValueError) as e:
             logger.error(f"Error calculating time left: {str(e)}")
             time_left = reset_hours * 3600
-            hours_left = reset_hours
+            hours_left = int(reset_hours)
             reset_time = current_time + time_left
-            limiter.db.update_user(user_id, {'reset_time': reset_time})
+            request.update(reset_time=reset_time)
 
         remaining_uses = max(0, request_limit - request_count)
 
@@ -105,15 +105,20 @@ async def show_normal_usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error in normal usage guide: {str(e)}")
         await query.edit_message_text("⚠️ حدث خطأ في عرض الإرشادات")
 
+@request_scoped
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
+        if blocked_by_maintenance(update.effective_user.username):
+            await update.message.reply_text(MAINTENANCE_MESSAGE)
+            return
+
         user_id = update.effective_user.id
-        is_premium = limiter.is_premium_user(user_id)
+        request = current_request()
         user_text = update.message.text
         
         # تحديد الحدود بناءً على نوع المستخدم
-        char_limit = Config.PREMIUM_CHAR_LIMIT if is_premium else Config.CHAR_LIMIT
-        request_limit = Config.PREMIUM_REQUEST_LIMIT if is_premium else Config.REQUEST_LIMIT
+        char_limit = request.char_limit
+        request_limit = request.request_limit
         
         if not user_text or len(user_text.strip()) == 0:
             await update.message.reply_text("⚠️ يرجى إرسال نص صالح للمعالجة")
@@ -126,8 +131,8 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        user_data = limiter.db.get_user(user_id) or {}
-        if user_data.get('request_count', 0) >= request_limit:
+        await request.load()
+        if request.request_count >= request_limit:
             await update.message.reply_text(
     f"⚠️ عذراً، الحد الأقصى المسموح به هو {char_limit} حرفاً.\n"
     f"عدد أحرف نصك: {len(user_text)}"
@@ -151,13 +156,23 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error handling text input: {str(e)}")
         await update.message.reply_text("⚠️ حدث خطأ أثناء معالجة النص")
 
+@request_scoped
 async def handle_correction_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         query = update.callback_query
         await query.answer()
+
+        if blocked_by_maintenance(query.from_user.username):
+            await query.edit_message_text(MAINTENANCE_MESSAGE)
+            return
         
         user_id = int(query.data.split('_')[1])
-        is_premium = limiter.is_premium_user(user_id)
+        request = current_request(user_id)
+        if request is None:
+            # الزر من رسالة مستخدم آخر: لا نحسب الطلب على حصته
+            await query.edit_message_text("⚠️ هذا الخيار لا يخصك.")
+            return
+        is_premium = request.is_premium
         user_text = context.user_data.get('last_text', '')
         
         if not user_text:
@@ -167,33 +182,52 @@ async def handle_correction_choice(update: Update, context: ContextTypes.DEFAULT
         await query.edit_message_text("⏳ جاري تصحيح الأخطاء النحوية...")
         
         # استدعاء OpenRouter للتصحيح
-        prompt = f"صحح الأخطاء النحوية والإملائية في النص التالي بدون ذكر النص الأصلي:\n{user_text}"
-        corrected_text = query_openrouter(prompt, user_id if is_premium else None)
+        streamer = StreamingMessage(query.edit_message_text, header="🛠 النص المصحح:\n",
+                                    send_func=query.message.reply_text)
+        job = TextJob("correct", user_text, user_id, is_premium=is_premium, on_queued=streamer.show_queue)
+        corrected_text = await streamer.consume(job.stream())
         
-        # تحديث عدد الطلبات
-        current_user_data = limiter.db.get_user(user_id) or {}
-        new_count = current_user_data.get('request_count', 0) + 1
-        limiter.db.update_user(user_id, {
-            'request_count': new_count,
-            'reset_time': current_user_data.get('reset_time', time.time() + (Config.PREMIUM_RESET_HOURS * 3600 if is_premium else Config.RESET_HOURS * 3600))
-        })
+        # تحديث عدد الطلبات (يُكتب مرة واحدة عند نهاية التحديث)
+        current_user_data = await request.load()
+        if job.counts_against_quota:
+            request.record_usage(job.mode)
+            if 'reset_time' not in current_user_data:
+                request.update(reset_time=time.time() + request.reset_hours * 3600)
+        new_count = request.request_count
         
-        await query.edit_message_text(
-            f"🛠 <b>النص المصحح:</b>\n{corrected_text}",
+        request_limit = request.request_limit
+        await streamer.finalize(
+            f"🛠 <b>النص المصحح:</b>\n{html.escape(corrected_text)}\n\n"
+            f"📊 المتبقي من طلباتك: {max(0, request_limit - new_count)}/{request_limit}",
             parse_mode="HTML"
         )
         
+    except UpstreamBusyError as e:
+        await query.edit_message_text(f"⏳ الخدمة مشغولة حالياً، يرجى المحاولة بعد {max(1, round(e.retry_after))} ثانية.")
+    except ApiKeyRevokedError as e:
+        await revoke_user_api(e.user_id)
+        await query.edit_message_text(API_KEY_REVOKED_MESSAGE)
     except Exception as e:
         logger.error(f"Error in correction handler: {str(e)}")
         await query.edit_message_text("⚠️ حدث خطأ أثناء تصحيح النص")
 
+@request_scoped
 async def handle_paraphrase_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         query = update.callback_query
         await query.answer()
+
+        if blocked_by_maintenance(query.from_user.username):
+            await query.edit_message_text(MAINTENANCE_MESSAGE)
+            return
         
         user_id = int(query.data.split('_')[1])
-        is_premium = limiter.is_premium_user(user_id)
+        request = current_request(user_id)
+        if request is None:
+            # الزر من رسالة مستخدم آخر: لا نحسب الطلب على حصته
+            await query.edit_message_text("⚠️ هذا الخيار لا يخصك.")
+            return
+        is_premium = request.is_premium
         user_text = context.user_data.get('last_text', '')
         
         if not user_text:
@@ -203,22 +237,31 @@ async def handle_paraphrase_choice(update: Update, context: ContextTypes.DEFAULT
         await query.edit_message_text("⏳ جاري إعادة صياغة النص...")
         
         # استدعاء OpenRouter لإعادة الصياغة
-        prompt = f"أعد صياغة النص التالي بلغة عربية سليمة بدون ذكر النص الأصلي:\n{user_text}"
-        paraphrased_text = query_openrouter(prompt, user_id if is_premium else None)
+        streamer = StreamingMessage(query.edit_message_text, header="🔄 النص المعاد صياغته:\n",
+                                    send_func=query.message.reply_text)
+        job = TextJob("paraphrase", user_text, user_id, is_premium=is_premium, on_queued=streamer.show_queue)
+        paraphrased_text = await streamer.consume(job.stream())
         
-        # تحديث عدد الطلبات
-        current_user_data = limiter.db.get_user(user_id) or {}
-        new_count = current_user_data.get('request_count', 0) + 1
-        limiter.db.update_user(user_id, {
-            'request_count': new_count,
-            'reset_time': current_user_data.get('reset_time', time.time() + (Config.PREMIUM_RESET_HOURS * 3600 if is_premium else Config.RESET_HOURS * 3600))
-        })
+        # تحديث عدد الطلبات (يُكتب مرة واحدة عند نهاية التحديث)
+        current_user_data = await request.load()
+        if job.counts_against_quota:
+            request.record_usage(job.mode)
+            if 'reset_time' not in current_user_data:
+                request.update(reset_time=time.time() + request.reset_hours * 3600)
+        new_count = request.request_count
         
-        await query.edit_message_text(
-            f"🔄 <b>النص المعاد صياغته:</b>\n{paraphrased_text}",
+        request_limit = request.request_limit
+        await streamer.finalize(
+            f"🔄 <b>النص المعاد صياغته:</b>\n{html.escape(paraphrased_text)}\n\n"
+            f"📊 المتبقي من طلباتك: {max(0, request_limit - new_count)}/{request_limit}",
             parse_mode="HTML"
         )
         
+    except UpstreamBusyError as e:
+        await query.edit_message_text(f"⏳ الخدمة مشغولة حالياً، يرجى المحاولة بعد {max(1, round(e.retry_after))} ثانية.")
+    except ApiKeyRevokedError as e:
+        await revoke_user_api(e.user_id)
+        await query.edit_message_text(API_KEY_REVOKED_MESSAGE)
     except Exception as e:
         logger.error(f"Error in paraphrase handler: {str(e)}")
         await query.edit_message_text("⚠️ حدث خطأ أثناء إعادة صياغة النص")
@@ -238,8 +281,8 @@ async def show_api_usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
    <code>/setapi مفتاحك_السري</code>
 
 3. المميزات التي ستحصل عليها:
-   - {Config.PREMIUM_REQUEST_LIMIT} طلب يومياً
-   - حد {Config.PREMIUM_CHAR_LIMIT} حرفاً للنص
+   - {live_settings.current.premium_request_limit} طلب يومياً
+   - حد {live_settings.current.premium_char_limit} حرفاً للنص
    - أولوية في المعالجة
 
 📬 للاستفسارات: @info_all_tech
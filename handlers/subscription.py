@@ -2,6 +2,7 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from telegram.error import BadRequest
 from config import Config
+from utils.request_context import count_round_trip, current_request, request_scoped
 
 async def check_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     # Skip check if channel not configured
@@ -11,7 +12,18 @@ async def check_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
     if not user:
         return False
-    
+
+    # نتيجة واحدة لكل تحديث مهما تكرر الفحص
+    request = current_request(user.id)
+    if request is not None:
+        if request.subscribed is None:
+            request.subscribed = await _fetch_subscription(update, context)
+        return request.subscribed
+    return await _fetch_subscription(update, context)
+
+async def _fetch_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    user = update.effective_user
+    count_round_trip()
     try:
         # Try to get chat member (works for public channels)
         chat_member = await context.bot.get_chat_member(
@@ -49,6 +61,7 @@ async def send_subscription_message(update: Update, context: ContextTypes.DEFAUL
     else:
         await update.message.reply_text(message, reply_markup=keyboard)
 
+@request_scoped
 async def verify_subscription_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
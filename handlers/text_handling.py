@@ -1,19 +1,31 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, MessageHandler, filters, CallbackQueryHandler
-from config import Config
+from utils.circuit_breaker import UpstreamBusyError
+from utils.key_validation import ApiKeyRevokedError
 from utils.limits import limiter
-from utils.openrouter import query_openrouter
+from utils.openrouter import revoke_user_api
+from utils.pipeline import TextJob
+from utils.prompts import PROMPTS
+from utils.request_context import current_request, request_scoped
+from utils.streaming import StreamingMessage
+from .admin_panel import MAINTENANCE_MESSAGE, blocked_by_maintenance, is_admin
+from .premium import API_KEY_REVOKED_MESSAGE
 from .subscription import check_subscription, send_subscription_message
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+@request_scoped
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # استثناء رسائل المشرفين
     if is_admin(update.effective_user.username) and not context.user_data.get('processing_text'):
         return
     try:
+        if blocked_by_maintenance(update.effective_user.username):
+            await update.message.reply_text(MAINTENANCE_MESSAGE)
+            return
+
         # التحقق من الاشتراك
         if not await check_subscription(update, context):
             await send_subscription_message(update, context)
@@ -23,8 +35,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         
         # تحديد الحدود حسب نوع المستخدم
-        is_premium = limiter.is_premium_user(user_id)
-        char_limit = Config.PREMIUM_CHAR_LIMIT if is_premium else Config.CHAR_LIMIT
+        char_limit = current_request().char_limit
         
         # التحقق من حد الحروف
         if len(user_text) > char_limit:
@@ -35,7 +46,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # التحقق من الحدود اليومية
-        allowed, time_left, _ = limiter.check_limits(user_id)
+        allowed, time_left, _ = await limiter.check_limits(user_id)
         if not allowed:
             hours_left = max(0, int(time_left // 3600)) if time_left else 0
             await update.message.reply_text(
@@ -52,6 +63,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [
                 InlineKeyboardButton("🛠 تصحيح نحوي", callback_data="correct"),
                 InlineKeyboardButton("🔄 إعادة صياغة", callback_data="rewrite")
+            ],
+            [
+                InlineKeyboardButton("🔤 تدقيق إملائي", callback_data="spelling")
             ]
         ]
         
@@ -64,10 +78,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error in handle_message: {str(e)}", exc_info=True)
         await update.message.reply_text("⚠️ حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.")
 
+@request_scoped
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         query = update.callback_query
         await query.answer()
+
+        if blocked_by_maintenance(query.from_user.username):
+            await query.edit_message_text(MAINTENANCE_MESSAGE)
+            return
         
         # التحقق من الاشتراك
         if not await check_subscription(update, context):
@@ -84,7 +103,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # التحقق من الحدود
-        allowed, time_left, _ = limiter.check_limits(user_id)
+        allowed, time_left, _ = await limiter.check_limits(user_id)
         if not allowed:
             hours_left = max(0, int(time_left // 3600)) if time_left else 0
             await query.edit_message_text(
@@ -93,40 +112,35 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # إعداد الأمر حسب الاختيار
-        if action == "correct":
-            prompt = (
-                "صحح الأخطاء النحوية والإملائية في النص التالي مع الحفاظ على نفس المعنى:\n\n"
-                f"{user_text}\n\n"
-                "الرجاء إرسال النص المصحح فقط دون أي تعليقات إضافية."
-            )
-        elif action == "rewrite":
-            prompt = (
-                "أعد صياغة النص التالي بلغة عربية فصحى سليمة مع الحفاظ على نفس المعنى:\n\n"
-                f"{user_text}\n\n"
-                "الرجاء إرسال النص المعاد صياغته فقط دون أي تعليقات إضافية."
-            )
-        else:
+        if action not in PROMPTS:
             await query.edit_message_text("⚠️ أمر غير معروف")
             return
         
         # معالجة الطلب
         await query.edit_message_text("⏳ جاري المعالجة...")
-        result = query_openrouter(prompt, user_id)
-        limiter.increment_usage(user_id)
-        
-        # إرسال النتيجة
-        user_data = limiter.db.get_user(user_id)
-        is_premium = limiter.is_premium_user(user_id)
-        request_limit = Config.PREMIUM_REQUEST_LIMIT if is_premium else Config.REQUEST_LIMIT
-        remaining_uses = request_limit - user_data.get('request_count', 0)
-        
-        await query.edit_message_text(
+        streamer = StreamingMessage(query.edit_message_text, header="✅ النتيجة:\n\n",
+                                    send_func=query.message.reply_text)
+        job = TextJob(action, user_text, user_id, on_queued=streamer.show_queue)
+        result = await streamer.consume(job.stream())
+        request = current_request()
+        if job.counts_against_quota:
+            request.record_usage(job.mode)
+        
+        # إرسال النتيجة (من سياق التحديث دون قراءات إضافية)
+        request_limit = request.request_limit
+        remaining_uses = request.remaining()
+        
+        await streamer.finalize(
             f"✅ النتيجة:\n\n{result}\n\n"
             f"📊 المتبقي من طلباتك: {remaining_uses}/{request_limit}",
             parse_mode="Markdown"
         )
         
+    except UpstreamBusyError as e:
+        await query.edit_message_text(f"⏳ الخدمة مشغولة حالياً، يرجى المحاولة بعد {max(1, round(e.retry_after))} ثانية.")
+    except ApiKeyRevokedError as e:
+        await revoke_user_api(e.user_id)
+        await query.edit_message_text(API_KEY_REVOKED_MESSAGE)
     except Exception as e:
         logger.error(f"Error in handle_callback: {str(e)}", exc_info=True)
         await query.edit_message_text("❌ حدث خطأ أثناء معالجة طلبك. يرجى المحاولة لاحقاً.")
@@ -134,4 +148,4 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def setup_text_handlers(application):
     """إعداد معالجات النصوص والردود"""
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    application.add_handler(CallbackQueryHandler(handle_callback, pattern="^(correct|rewrite)$"))
+    application.add_handler(CallbackQueryHandler(handle_callback, pattern="^(correct|rewrite|spelling)$"))
@@ -1,13 +1,16 @@
 import asyncio
 import json
-import time
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
-    ContextTypes
+    ApplicationHandlerStop,
+    ContextTypes,
+    TypeHandler
 )
 from config import Config
-from firebase_db import FirebaseDB
+from storage import Storage
+from utils.bans import banned_users
+from utils.premium_index import premium_index
 import logging
 import sys
 
@@ -39,6 +42,13 @@ def check_firebase_credentials():
         logger.critical(f"❌ Invalid Firebase credentials: {str(e)}")
         return False
 
+async def drop_banned_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """يعمل قبل كل المعالجات: تحديثات المحظورين تتوقف هنا دون أي عمل آخر"""
+    user = update.effective_user
+    if user and user.id in banned_users:
+        banned_users.stats['blocked'] += 1
+        raise ApplicationHandlerStop
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Error: {context.error}", exc_info=True)
     if update and update.effective_message:
@@ -50,10 +60,12 @@ async def initialize_system():
         Config.validate_config()
         logger.info("✅ Configuration validated successfully")
         
-        logger.info("Initializing Firebase...")
-        db = FirebaseDB()  # تغيير هنا لاستخدام الفئة مباشرة
-        db.initialize_stats()
-        logger.info("✅ Firebase initialized successfully")
+        logger.info(f"Initializing {Config.STORAGE_BACKEND} storage...")
+        from utils.limits import limiter
+        db = limiter.db  # نفس التخزين الذي يستخدمه مسار الطلبات ولوحة المشرف
+        await db.initialize_stats()
+        await db.load_state()
+        logger.info("✅ Storage initialized successfully")
         
         logger.info(f"🔑 Admin usernames: {Config.ADMIN_USERNAMES}")
         return db  # إرجاع كائن db لاستخدامه لاحقاً
@@ -62,6 +74,33 @@ async def initialize_system():
         logger.critical(f"❌ System initialization failed: {str(e)}")
         return None
 
+async def reconcile_stats_periodically(db: Storage):
+    """إعادة عد المستخدمين دورياً في الخلفية لتصحيح أي انحراف في العدادات"""
+    while True:
+        await asyncio.sleep(Config.STATS_RECONCILE_HOURS * 3600)
+        try:
+            result = await db.reconcile_user_counts()
+            logger.info(f"📊 Stats reconciled: {result}")
+        except Exception as e:
+            logger.error(f"Stats reconciliation failed: {str(e)}")
+
+async def prune_usage_periodically(db: Storage):
+    """حذف حاويات الاستخدام وأختام user_changes الأقدم من مدة الاحتفاظ دورياً"""
+    while True:
+        try:
+            deleted = await db.prune_usage_history()
+            if deleted:
+                logger.info(f"🧹 Pruned {deleted} usage buckets")
+        except Exception as e:
+            logger.error(f"Usage history pruning failed: {str(e)}")
+        try:
+            deleted = await db.prune_user_changes()
+            if deleted:
+                logger.info(f"🧹 Pruned {deleted} user_changes entries")
+        except Exception as e:
+            logger.error(f"user_changes pruning failed: {str(e)}")
+        await asyncio.sleep(Config.USAGE_PRUNE_HOURS * 3600)
+
 def setup_handlers(application):
     """Register all bot handlers"""
     try:
@@ -70,7 +109,8 @@ def setup_handlers(application):
         from handlers.text_handling import setup_text_handlers
         from handlers.subscription import setup_subscription_handlers
         from handlers.premium import setup_premium_handlers
-        
+
+        application.add_handler(TypeHandler(Update, drop_banned_updates), group=-1)
         setup_admin_commands(application)
         setup_start_handlers(application)
         setup_text_handlers(application)
@@ -86,7 +126,7 @@ def setup_handlers(application):
 async def run_bot():
     """Run the bot in webhook mode"""
     # 1. التحقق من بيانات Firebase أولاً
-    if not check_firebase_credentials():
+    if Config.STORAGE_BACKEND == "firebase" and not check_firebase_credentials():
         sys.exit(1)
 
     # 2. تهيئة النظام والحصول على كائن db
@@ -94,17 +134,17 @@ async def run_bot():
     if not db:
         sys.exit(1)
 
-    # 3. اختبار اتصال Firebase
+    # 3. اختبار اتصال التخزين
     try:
-        test_ref = db.root_ref.child('connection_test')
-        test_ref.set(int(time.time()))
-        logger.info(f"✅ Firebase test write successful. Timestamp: {test_ref.get()}")
+        await db.check_connection()
     except Exception as e:
-        logger.critical(f"❌ Firebase connection test failed: {str(e)}", exc_info=True)
+        logger.critical(f"❌ Storage connection test failed: {str(e)}", exc_info=True)
         sys.exit(1)
 
     # 4. تهيئة البوت
     application = None
+    reconcile_task = None
+    prune_task = None
     try:
         application = ApplicationBuilder().token(Config.BOT_TOKEN).build()
         
@@ -130,6 +170,11 @@ async def run_bot():
         )
         
         logger.info("🤖 Bot is now running and ready to handle updates...")
+
+        if Config.STATS_RECONCILE_HOURS > 0:
+            reconcile_task = asyncio.create_task(reconcile_stats_periodically(db))
+        if Config.USAGE_PRUNE_HOURS > 0:
+            prune_task = asyncio.create_task(prune_usage_periodically(db))
         
         while True:
             await asyncio.sleep(3600)
@@ -139,9 +184,26 @@ async def run_bot():
     except Exception as e:
         logger.critical(f"🔥 Bot crashed: {str(e)}")
     finally:
+        if reconcile_task:
+            reconcile_task.cancel()
+        if prune_task:
+            prune_task.cancel()
         if application and application.running:
             await application.stop()
             logger.info("🛑 Bot has been stopped successfully")
+        from firebase_common import user_cache
+        from utils.limits import limiter
+        from utils.openrouter import client as openrouter_client
+        from utils.prepass import spell_prepass
+        from utils.settings import live_settings
+        await limiter.usage.aclose()
+        await limiter.db.aclose()
+        user_cache.stop()
+        live_settings.stop()
+        banned_users.stop()
+        premium_index.stop()
+        await openrouter_client.aclose()
+        spell_prepass.shutdown()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,53 @@
+"""ترحيل بيانات Firebase إلى تخزين SQL مرة واحدة
+
+    python migrate_to_sql.py --sql-url sqlite:////var/data/bot.sqlite3 --page-size 1000
+
+تُقرأ شجرة /users على صفحات مرتبة بالمفتاح (AsyncFirebaseDB.iter_user_pages) مع جلب الصفحة
+التالية أثناء كتابة الحالية، فلا تُحمّل كاملة في الذاكرة، ثم تُنسخ العقد الصغيرة ويُعاد عد المستخدمين.
+التشغيل مرة ثانية آمن (upsert)، ويُفضل إيقاف البوت أثناء الترحيل.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from async_firebase_db import AsyncFirebaseDB
+from config import Config
+from sql_db import SQLStorage
+from storage import prefetched
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate(sql_url: str, page_size: int):
+    if not Config.FIREBASE_DATABASE_URL or not Config.FIREBASE_SERVICE_ACCOUNT:
+        raise SystemExit("الترحيل يحتاج FIREBASE_DATABASE_URL و FIREBASE_SERVICE_ACCOUNT_JSON")
+    source = AsyncFirebaseDB()
+    target = SQLStorage(sql_url)
+    started = time.monotonic()
+    try:
+        migrated = 0
+        async for page in prefetched(source.iter_user_pages(page_size)):
+            migrated += await target.import_users(page)
+            logger.info(f"Migrated {migrated} users ({time.monotonic() - started:.1f}s)")
+
+        await target.import_nodes(
+            bans=await source.get('banned_users'),
+            premium=await source.get('premium_users'),
+            stats=await source.get('stats'),
+            settings=await source.get('settings'),
+            usage=await source.get('usage') or {}
+        )
+        await target.initialize_stats()
+        result = await target.reconcile_user_counts()
+        logger.info(f"✅ Migration finished: {migrated} users in {time.monotonic() - started:.1f}s, stats {result}")
+    finally:
+        await source.aclose()
+        await target.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ترحيل بيانات Firebase إلى SQLite/PostgreSQL")
+    parser.add_argument("--sql-url", default=Config.SQL_DATABASE_URL)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.sql_url, args.page_size))
@@ -0,0 +1,715 @@
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from storage import STAT_COUNTERS, Storage
+from utils.bans import banned_users
+from utils.premium_index import parse_expiry, premium_index
+from utils.request_context import count_round_trip
+from utils.settings import live_settings
+from utils.usage_history import DAILY, HOURLY, daily_rollup, day_key, hour_key, retention_cutoffs
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL اختياري: psycopg2-binary موجود في requirements.txt لكنه غير مطلوب مع SQLite
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+# أعمدة سجل المستخدم؛ أي حقل آخر يُحفظ في extra كـ JSON
+USER_COLUMNS = ('request_count', 'reset_time', 'last_request', 'last_activity', 'joined_at', 'is_premium')
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users ("
+    "user_id BIGINT PRIMARY KEY, request_count INTEGER NOT NULL DEFAULT 0, "
+    "reset_time DOUBLE PRECISION, last_request DOUBLE PRECISION, last_activity DOUBLE PRECISION, "
+    "joined_at DOUBLE PRECISION, is_premium BOOLEAN NOT NULL DEFAULT FALSE, extra TEXT)",
+    # فهرس جزئي صغير: المميزون فقط
+    "CREATE INDEX IF NOT EXISTS users_premium_idx ON users (user_id) WHERE is_premium",
+    "CREATE TABLE IF NOT EXISTS banned_users ("
+    "user_id BIGINT PRIMARY KEY, reason TEXT, banned_at DOUBLE PRECISION)",
+    "CREATE TABLE IF NOT EXISTS premium_users ("
+    "user_id BIGINT PRIMARY KEY, expires_at DOUBLE PRECISION)",
+    "CREATE TABLE IF NOT EXISTS stats ("
+    "name TEXT PRIMARY KEY, value DOUBLE PRECISION NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS settings ("
+    "name TEXT PRIMARY KEY, value TEXT)",
+    # حاويات الاستخدام: مفاتيح UTC نصية (YYYYMMDDHH أو YYYYMMDD) فالترتيب النصي زمني
+    "CREATE TABLE IF NOT EXISTS usage_buckets ("
+    "period TEXT NOT NULL, bucket TEXT NOT NULL, field TEXT NOT NULL, value INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (period, bucket, field))",
+)
+
+# استعلامات مسار الطلبات؛ تُجهز مرة لكل اتصال على PostgreSQL
+# (ويخزن sqlite3 الاستعلامات المترجمة لكل اتصال تلقائياً)
+STATEMENTS = {
+    'get_user': (
+        "SELECT request_count, reset_time, last_request, last_activity, joined_at, is_premium, extra "
+        "FROM users WHERE user_id = ?"
+    ),
+    'register_user': (
+        "INSERT INTO users (user_id, joined_at, last_activity) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id) DO NOTHING RETURNING user_id"
+    ),
+    'add_usage': (
+        "INSERT INTO users (user_id, request_count, last_request, last_activity) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET request_count = users.request_count + excluded.request_count, "
+        "last_request = excluded.last_request, last_activity = excluded.last_activity "
+        "RETURNING request_count"
+    ),
+    'set_premium': (
+        "UPDATE users SET is_premium = ? WHERE user_id = ? AND is_premium <> ? RETURNING user_id"
+    ),
+    'insert_premium': (
+        "INSERT INTO users (user_id, is_premium, last_activity) VALUES (?, TRUE, ?) "
+        "ON CONFLICT (user_id) DO NOTHING RETURNING user_id"
+    ),
+    'increment_stat': "UPDATE stats SET value = value + ? WHERE name = ? RETURNING value",
+    'set_stat': (
+        "INSERT INTO stats (name, value) VALUES (?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET value = excluded.value"
+    ),
+    'seed_stat': "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT (name) DO NOTHING",
+    'get_stats': "SELECT name, value FROM stats",
+    'add_bucket': (
+        "INSERT INTO usage_buckets (period, bucket, field, value) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (period, bucket, field) DO UPDATE SET value = usage_buckets.value + excluded.value"
+    ),
+    'usage_since': "SELECT bucket, field, value FROM usage_buckets WHERE period = ? AND bucket >= ?",
+    # ترقيم بالمفتاح (keyset) عبر المفتاح الأساسي بدل OFFSET
+    'user_page': (
+        "SELECT user_id, request_count, reset_time, last_request, last_activity, joined_at, is_premium, extra "
+        "FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+    ),
+    'count_users': "SELECT COUNT(*) FROM users",
+    'count_premium': "SELECT COUNT(*) FROM users WHERE is_premium",
+}
+
+
+class ConnectionPool:
+    """مجمع اتصالات محدود لـ SQLite (sqlite:///path) أو PostgreSQL (postgresql://...)"""
+
+    def __init__(self, url: str, size: int = None):
+        self.url = url
+        self.size = size or Config.SQL_POOL_SIZE
+        self.dialect = 'postgres' if url.startswith(('postgres://', 'postgresql://')) else 'sqlite'
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._prepared = set()
+        if self.dialect == 'postgres':
+            if psycopg2 is None:
+                raise RuntimeError("psycopg2 غير مثبت: pip install psycopg2-binary")
+            self._pg = psycopg2.pool.ThreadedConnectionPool(1, self.size, url)
+        else:
+            # sqlite:///bot.sqlite3 مسار نسبي، sqlite:////var/data/bot.sqlite3 مسار مطلق
+            self.path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+            self._idle = queue.LifoQueue()
+
+    def _connect_sqlite(self) -> sqlite3.Connection:
+        # isolation_level=None: نتحكم بالمعاملات صراحة (BEGIN IMMEDIATE للكتابة)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30,
+                               isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            if self.dialect == 'postgres':
+                return self._pg.getconn()
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect_sqlite()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if self.dialect == 'postgres':
+                self._pg.putconn(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def prepare(self, conn):
+        """تجهيز STATEMENTS على اتصال PostgreSQL جديد (مرة واحدة لكل اتصال)"""
+        if id(conn) in self._prepared:
+            return
+        with conn.cursor() as cur:
+            for name, sql in STATEMENTS.items():
+                cur.execute(f"PREPARE {name} AS {numbered_placeholders(sql)}")
+        self._prepared.add(id(conn))
+
+    def close(self):
+        if self.dialect == 'postgres':
+            self._pg.closeall()
+            return
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def numbered_placeholders(sql: str) -> str:
+    """تحويل ? إلى $1, $2 ... لصيغة PREPARE في PostgreSQL"""
+    parts = sql.split('?')
+    return parts[0] + ''.join(f"${index}{part}" for index, part in enumerate(parts[1:], start=1))
+
+
+class SQLStorage(Storage):
+    """تخزين محلي على SQLite أو PostgreSQL بجداول مفهرسة وعدادات ذرية (UPDATE ... RETURNING)
+
+    القراءات استعلامات مفهرسة قريبة فلا تمر عبر كاش المستخدمين، ولا يوجد استماع للتغييرات:
+    الحظر والتميز والإعدادات تُحمّل في الذاكرة عند بدء التشغيل وتُحدَّث مع كل كتابة من هذه النسخة.
+    """
+
+    def __init__(self, url: str = None, pool_size: int = None):
+        self.pool = ConnectionPool(url or Config.SQL_DATABASE_URL, pool_size)
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    # ------------------- الاتصال والاستعلام -------------------
+    @contextmanager
+    def _cursor(self, write: bool = False):
+        """مؤشر داخل معاملة واحدة: commit عند النجاح وrollback عند أي خطأ"""
+        self._ensure_schema()
+        count_round_trip()
+        conn = self.pool.acquire()
+        try:
+            if self.pool.dialect == 'sqlite' and write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn.cursor()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.release(conn)
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn = self.pool.acquire()
+            try:
+                cur = conn.cursor()
+                for statement in SCHEMA:
+                    cur.execute(statement)
+                conn.commit()
+            finally:
+                self.pool.release(conn)
+            self._schema_ready = True
+
+    def _execute(self, cur, name: str, params: tuple = ()):
+        """تنفيذ استعلام مسمى من STATEMENTS (جاهز مسبقاً على PostgreSQL)"""
+        if self.pool.dialect == 'postgres':
+            self.pool.prepare(cur.connection)
+            args = f" ({', '.join(['%s'] * len(params))})" if params else ""
+            cur.execute(f"EXECUTE {name}{args}", params)
+        else:
+            cur.execute(STATEMENTS[name], params)
+        return cur
+
+    def _query(self, cur, sql: str, params: tuple = ()):
+        """استعلام غير مسمى بعلامات ? في كلا النوعين"""
+        if self.pool.dialect == 'postgres':
+            sql = sql.replace('?', '%s')
+        cur.execute(sql, params)
+        return cur
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    # ------------------- تحويل السجلات -------------------
+    @staticmethod
+    def _row_to_user(row) -> dict:
+        request_count, reset_time, last_request, last_activity, joined_at, is_premium, extra = row
+        user = json.loads(extra) if extra else {}
+        values = {
+            'request_count': request_count,
+            'reset_time': reset_time,
+            'last_request': last_request,
+            'last_activity': last_activity,
+            'joined_at': joined_at
+        }
+        user.update({key: value for key, value in values.items() if value is not None})
+        if is_premium:
+            user['is_premium'] = True
+        return user
+
+    @staticmethod
+    def _split_user(data: dict) -> tuple:
+        columns = {key: value for key, value in data.items() if key in USER_COLUMNS}
+        extra = {key: value for key, value in data.items() if key not in USER_COLUMNS}
+        return columns, extra
+
+    # ------------------- إدارة المستخدمين -------------------
+    async def get_user(self, user_id: int) -> dict:
+        def read():
+            with self._cursor() as cur:
+                return self._execute(cur, 'get_user', (user_id,)).fetchone()
+
+        try:
+            row = await self._run(read)
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {str(e)}")
+            raise
+        user_data = self._row_to_user(row) if row else {}
+        premium_index.set_flag(user_id, bool(user_data.get('is_premium', False)))
+        return user_data
+
+    def _write_user(self, cur, user_id: int, data: dict):
+        """upsert للأعمدة المعطاة ودمج الحقول الإضافية في extra (None يحذف الحقل كما في Firebase)"""
+        columns, extra = self._split_user(data)
+        if extra:
+            lock = " FOR UPDATE" if self.pool.dialect == 'postgres' else ""
+            row = self._query(cur, f"SELECT extra FROM users WHERE user_id = ?{lock}", (user_id,)).fetchone()
+            merged = json.loads(row[0]) if row and row[0] else {}
+            merged.update(extra)
+            columns['extra'] = json.dumps(
+                {key: value for key, value in merged.items() if value is not None}, ensure_ascii=False
+            )
+        names = list(columns)
+        self._query(
+            cur,
+            f"INSERT INTO users (user_id, {', '.join(names)}) VALUES ({', '.join(['?'] * (len(names) + 1))}) "
+            f"ON CONFLICT (user_id) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in names)}",
+            (user_id, *columns.values())
+        )
+
+    async def update_user(self, user_id: int, data: dict):
+        def write():
+            with self._cursor(write=True) as cur:
+                self._write_user(cur, user_id, data)
+
+        try:
+            data = dict(data)
+            data.setdefault('last_activity', time.time())
+            await self._run(write)
+        except Exception as e:
+            logger.error(f"Error updating user {user_id}: {str(e)}")
+            raise
+
+    async def register_user(self, user_id: int) -> bool:
+        """إدراج السجل وزيادة total_users في نفس المعاملة عند الإنشاء فقط"""
+        def create():
+            now = time.time()
+            with self._cursor(write=True) as cur:
+                created = self._execute(cur, 'register_user', (user_id, now, now)).fetchone() is not None
+                if created:
+                    self._execute(cur, 'increment_stat', (1, 'total_users')).fetchall()
+                return created
+
+        try:
+            return await self._run(create)
+        except Exception as e:
+            logger.error(f"Error registering user {user_id}: {str(e)}")
+            return False
+
+    async def commit_user(self, user_id: int, changes: dict, new_user: bool = False) -> bool:
+        """التسجيل (INSERT ... RETURNING) وكتابة الحقول في معاملة واحدة"""
+        def write():
+            with self._cursor(write=True) as cur:
+                created = False
+                if new_user:
+                    created = self._execute(cur, 'register_user', (user_id, now, now)).fetchone() is not None
+                    if created:
+                        self._execute(cur, 'increment_stat', (1, 'total_users')).fetchall()
+                self._write_user(cur, user_id, data)
+                return created
+
+        now = time.time()
+        data = dict(changes)
+        data.setdefault('last_activity', now)
+        try:
+            return await self._run(write)
+        except Exception as e:
+            logger.error(f"Error committing user {user_id}: {str(e)}")
+            raise
+
+    async def set_premium_flag(self, user_id: int, is_premium: bool) -> bool:
+        """تحديث مشروط: يعيد صفاً فقط إذا تغيرت العلامة، ثم يُعدل premium_users في نفس المعاملة"""
+        def flip():
+            with self._cursor(write=True) as cur:
+                changed = self._execute(cur, 'set_premium', (is_premium, user_id, is_premium)).fetchone() is not None
+                if not changed and is_premium:
+                    changed = self._execute(cur, 'insert_premium', (user_id, time.time())).fetchone() is not None
+                if changed:
+                    self._execute(cur, 'increment_stat', (1 if is_premium else -1, 'premium_users')).fetchall()
+                return changed
+
+        try:
+            changed = await self._run(flip)
+            premium_index.set_flag(user_id, is_premium)
+            return changed
+        except Exception as e:
+            logger.error(f"Error setting premium flag for user {user_id}: {str(e)}")
+            return False
+
+    async def get_all_users(self) -> dict:
+        def read():
+            with self._cursor() as cur:
+                return self._query(
+                    cur,
+                    "SELECT user_id, request_count, reset_time, last_request, last_activity, joined_at, "
+                    "is_premium, extra FROM users ORDER BY user_id"
+                ).fetchall()
+
+        try:
+            return {str(row[0]): self._row_to_user(row[1:]) for row in await self._run(read)}
+        except Exception as e:
+            logger.error(f"Error getting all users: {str(e)}")
+            return {}
+
+    async def iter_user_pages(self, page_size: int = None):
+        def read(after: int):
+            with self._cursor() as cur:
+                return self._execute(cur, 'user_page', (after, page_size)).fetchall()
+
+        page_size = page_size or Config.USER_PAGE_SIZE
+        after = -2 ** 63
+        while True:
+            rows = await self._run(read, after)
+            if not rows:
+                return
+            yield {str(row[0]): self._row_to_user(row[1:]) for row in rows}
+            after = rows[-1][0]
+
+    async def apply_usage(self, users: dict, total: int, hourly: dict):
+        """كل زيادات الدفعة في معاملة واحدة بعدادات ذرية"""
+        def write():
+            with self._cursor(write=True) as cur:
+                for user_id, pending in users.items():
+                    self._execute(cur, 'add_usage', (
+                        user_id, pending['count'], pending['last_request'], pending['last_request']
+                    )).fetchall()
+                if total:
+                    self._execute(cur, 'increment_stat', (total, 'total_requests')).fetchall()
+                self._add_buckets(cur, hourly)
+
+        await self._run(write)
+
+    def _add_buckets(self, cur, hourly: dict):
+        for period, buckets in ((HOURLY, hourly), (DAILY, daily_rollup(hourly))):
+            for key, fields in buckets.items():
+                for field, delta in fields.items():
+                    self._execute(cur, 'add_bucket', (period, key, field, delta))
+
+    # ------------------- الحظر والتميز -------------------
+    async def ban_user(self, user_id: int, reason: str = ""):
+        def write():
+            with self._cursor(write=True) as cur:
+                self._query(
+                    cur,
+                    "INSERT INTO banned_users (user_id, reason, banned_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET reason = excluded.reason, banned_at = excluded.banned_at",
+                    (user_id, reason, time.time())
+                )
+
+        try:
+            await self._run(write)
+            banned_users.add(user_id)
+        except Exception as e:
+            logger.error(f"Error banning user {user_id}: {str(e)}")
+            raise
+
+    async def unban_user(self, user_id: int):
+        def write():
+            with self._cursor(write=True) as cur:
+                self._query(cur, "DELETE FROM banned_users WHERE user_id = ?", (user_id,))
+
+        try:
+            await self._run(write)
+            banned_users.discard(user_id)
+        except Exception as e:
+            logger.error(f"Error unbanning user {user_id}: {str(e)}")
+            raise
+
+    async def get_premium_users(self) -> dict:
+        def read():
+            with self._cursor() as cur:
+                return self._query(cur, "SELECT user_id, expires_at FROM premium_users").fetchall()
+
+        try:
+            return {str(user_id): {'expires_at': expires_at} for user_id, expires_at in await self._run(read)}
+        except Exception as e:
+            logger.error(f"Error getting premium users: {str(e)}")
+            return {}
+
+    # ------------------- الإحصاءات -------------------
+    @staticmethod
+    def _stats_from_rows(rows) -> dict:
+        return {name: (int(value) if name in STAT_COUNTERS else value) for name, value in rows}
+
+    async def get_stats(self) -> dict:
+        def read():
+            with self._cursor() as cur:
+                return self._execute(cur, 'get_stats').fetchall()
+
+        try:
+            stats = self._stats_from_rows(await self._run(read))
+            if not stats:
+                await self.initialize_stats()
+                stats = self._stats_from_rows(await self._run(read))
+            return stats
+        except Exception as e:
+            logger.error(f"Error getting stats: {str(e)}", exc_info=True)
+            return {}
+
+    async def increment_stats(self, **deltas):
+        for name in deltas:
+            if name not in STAT_COUNTERS:
+                raise ValueError(f"Unknown stats counter: {name}")
+
+        def write():
+            with self._cursor(write=True) as cur:
+                for name, delta in deltas.items():
+                    if delta:
+                        self._execute(cur, 'increment_stat', (delta, name)).fetchall()
+
+        try:
+            await self._run(write)
+        except Exception as e:
+            logger.error(f"Error incrementing stats: {str(e)}")
+            raise
+
+    # ------------------- سجل الاستخدام -------------------
+    async def get_usage_history(self, hours: int = 24, days: int = 7) -> dict:
+        def read():
+            now = time.time()
+            ranges = ((HOURLY, hours, hour_key(now - (hours - 1) * 3600)), (DAILY, days, day_key(now - (days - 1) * 86400)))
+            history = {HOURLY: {}, DAILY: {}}
+            with self._cursor() as cur:
+                for period, span, start in ranges:
+                    if span <= 0:
+                        continue
+                    for bucket, field, value in self._execute(cur, 'usage_since', (period, start)).fetchall():
+                        history[period].setdefault(bucket, {})[field] = value
+            return history
+
+        try:
+            return await self._run(read)
+        except Exception as e:
+            logger.error(f"Error getting usage history: {str(e)}")
+            return {HOURLY: {}, DAILY: {}}
+
+    async def prune_usage_history(self) -> int:
+        hour_cutoff, day_cutoff = retention_cutoffs(
+            time.time(), Config.USAGE_HOURLY_RETENTION_DAYS, Config.USAGE_DAILY_RETENTION_DAYS
+        )
+
+        def delete():
+            with self._cursor(write=True) as cur:
+                deleted = 0
+                for period, cutoff in ((HOURLY, hour_cutoff), (DAILY, day_cutoff)):
+                    deleted += self._query(
+                        cur, "DELETE FROM usage_buckets WHERE period = ? AND bucket < ?", (period, cutoff)
+                    ).rowcount
+                return deleted
+
+        return await self._run(delete)
+
+    def _count(self, name: str) -> int:
+        with self._cursor() as cur:
+            return self._execute(cur, name).fetchone()[0]
+
+    async def count_users(self) -> int:
+        try:
+            return await self._run(self._count, 'count_users')
+        except Exception as e:
+            logger.error(f"Error counting users: {str(e)}")
+            return 0
+
+    async def count_premium_users(self) -> int:
+        try:
+            return await self._run(self._count, 'count_premium')
+        except Exception as e:
+            logger.error(f"Error counting premium users: {str(e)}")
+            return 0
+
+    async def reconcile_user_counts(self) -> dict:
+        def reconcile():
+            with self._cursor(write=True) as cur:
+                premium_ids = [row[0] for row in self._query(cur, "SELECT user_id FROM users WHERE is_premium").fetchall()]
+                counts = {
+                    'total_users': self._execute(cur, 'count_users').fetchone()[0],
+                    'premium_users': len(premium_ids)
+                }
+                stored = self._stats_from_rows(self._execute(cur, 'get_stats').fetchall())
+                for name, value in counts.items():
+                    self._execute(cur, 'set_stat', (name, value))
+                return premium_ids, counts, stored
+
+        premium_ids, counts, stored = await self._run(reconcile)
+        premium_index.replace_flags(premium_ids)
+        drift = {name: counts[name] - stored.get(name, 0) for name in counts}
+        if any(drift.values()):
+            logger.warning(f"Stats counters drifted by {drift}, corrected")
+        return {**counts, 'drift': drift}
+
+    async def initialize_stats(self):
+        """إنشاء صفوف العدادات الناقصة فقط (لا يمس القيم الموجودة)"""
+        def seed():
+            with self._cursor(write=True) as cur:
+                initial = {
+                    'total_users': self._execute(cur, 'count_users').fetchone()[0],
+                    'premium_users': self._execute(cur, 'count_premium').fetchone()[0],
+                    'total_requests': 0
+                }
+                for name, value in initial.items():
+                    self._execute(cur, 'seed_stat', (name, value))
+
+        try:
+            await self._run(seed)
+        except Exception as e:
+            logger.error(f"Error initializing stats: {str(e)}")
+            raise
+
+    # ------------------- الإعدادات -------------------
+    def _read_settings(self) -> dict:
+        with self._cursor() as cur:
+            rows = self._query(cur, "SELECT name, value FROM settings").fetchall()
+        return {name: json.loads(value) for name, value in rows}
+
+    def _write_settings(self, new_settings: dict):
+        with self._cursor(write=True) as cur:
+            for name, value in new_settings.items():
+                self._query(
+                    cur,
+                    "INSERT INTO settings (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                    (name, json.dumps(value))
+                )
+
+    async def get_settings(self) -> dict:
+        try:
+            settings = await self._run(self._read_settings)
+            if not settings:
+                settings = live_settings.current._asdict()
+                await self._run(self._write_settings, settings)
+            return settings
+        except Exception as e:
+            logger.error(f"Error getting settings: {str(e)}")
+            return {}
+
+    async def update_settings(self, new_settings: dict):
+        try:
+            await self._run(self._write_settings, new_settings)
+            live_settings.apply(new_settings)
+        except Exception as e:
+            logger.error(f"Error updating settings: {str(e)}")
+            raise
+
+    # ------------------- دورة الحياة -------------------
+    async def check_connection(self):
+        def ping():
+            with self._cursor() as cur:
+                return self._query(cur, "SELECT 1").fetchone()[0]
+
+        await self._run(ping)
+        logger.info(f"✅ SQL storage ready ({self.pool.dialect})")
+
+    async def load_state(self):
+        def read():
+            with self._cursor() as cur:
+                bans = [row[0] for row in self._query(cur, "SELECT user_id FROM banned_users").fetchall()]
+                flagged = [row[0] for row in self._query(cur, "SELECT user_id FROM users WHERE is_premium").fetchall()]
+            return bans, flagged
+
+        live_settings.apply(await self.get_settings(), replace=True)
+        bans, flagged = await self._run(read)
+        banned_users.replace(bans)
+        premium_index.replace_flags(flagged)
+        premium_index.replace_grants(await self.get_premium_users())
+        logger.info(f"Loaded {len(bans)} bans and {len(flagged)} premium flags from SQL storage")
+
+    async def aclose(self):
+        self.pool.close()
+
+    # ------------------- الترحيل -------------------
+    async def import_users(self, users: dict) -> int:
+        """إدراج صفحة من شجرة /users كما هي (upsert)؛ تُستخدم في أداة الترحيل"""
+        rows = []
+        for user_id, user in users.items():
+            if not str(user_id).lstrip('-').isdigit() or not isinstance(user, dict):
+                continue
+            columns, extra = self._split_user(user)
+            rows.append((
+                int(user_id),
+                int(columns.get('request_count') or 0),
+                columns.get('reset_time'),
+                columns.get('last_request'),
+                columns.get('last_activity'),
+                columns.get('joined_at'),
+                bool(columns.get('is_premium', False)),
+                json.dumps(extra, ensure_ascii=False) if extra else None
+            ))
+
+        def write():
+            with self._cursor(write=True) as cur:
+                sql = (
+                    "INSERT INTO users (user_id, request_count, reset_time, last_request, last_activity, "
+                    "joined_at, is_premium, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET request_count = excluded.request_count, "
+                    "reset_time = excluded.reset_time, last_request = excluded.last_request, "
+                    "last_activity = excluded.last_activity, joined_at = excluded.joined_at, "
+                    "is_premium = excluded.is_premium, extra = excluded.extra"
+                )
+                if self.pool.dialect == 'postgres':
+                    sql = sql.replace('?', '%s')
+                cur.executemany(sql, rows)
+
+        if rows:
+            await self._run(write)
+        return len(rows)
+
+    async def import_nodes(self, bans: dict, premium: dict, stats: dict, settings: dict, usage: dict = None):
+        """نسخ العقد الصغيرة (المحظورون، المنح، الإحصاءات، حاويات الاستخدام، الإعدادات) في معاملة واحدة"""
+        def write():
+            with self._cursor(write=True) as cur:
+                for user_id, entry in (bans or {}).items():
+                    if not str(user_id).lstrip('-').isdigit():
+                        continue
+                    entry = entry if isinstance(entry, dict) else {}
+                    self._query(
+                        cur,
+                        "INSERT INTO banned_users (user_id, reason, banned_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (user_id) DO UPDATE SET reason = excluded.reason, banned_at = excluded.banned_at",
+                        (int(user_id), entry.get('reason', ''), entry.get('timestamp'))
+                    )
+                for user_id, entry in (premium or {}).items():
+                    if entry is None or entry is False or not str(user_id).lstrip('-').isdigit():
+                        continue
+                    self._query(
+                        cur,
+                        "INSERT INTO premium_users (user_id, expires_at) VALUES (?, ?) "
+                        "ON CONFLICT (user_id) DO UPDATE SET expires_at = excluded.expires_at",
+                        (int(user_id), parse_expiry(entry))
+                    )
+                for name in STAT_COUNTERS:
+                    if name in (stats or {}):
+                        self._execute(cur, 'set_stat', (name, float(stats[name])))
+                if usage is not None:
+                    # استبدال كامل حتى لا تتضاعف الحاويات عند إعادة الترحيل
+                    self._query(cur, "DELETE FROM usage_buckets")
+                    for period in (HOURLY, DAILY):
+                        for key, fields in (usage.get(period) or {}).items():
+                            for field, value in (fields or {}).items():
+                                self._execute(cur, 'add_bucket', (period, key, field, int(value)))
+
+        await self._run(write)
+        if settings:
+            await self._run(self._write_settings, settings)
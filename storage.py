@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from config import Config
+from utils.bans import banned_users
+from utils.settings import live_settings
+
+logger = logging.getLogger(__name__)
+
+# عدادات الإحصاءات التي تُزاد ذرياً في كل تخزين
+STAT_COUNTERS = ('total_users', 'premium_users', 'total_requests')
+
+
+class Storage(ABC):
+    """واجهة التخزين التي يستخدمها مسار الطلبات ولوحة المشرف (غير متزامنة)
+
+    التنفيذات: AsyncFirebaseDB (Realtime Database) وSQLStorage (SQLite/PostgreSQL).
+    الحظر والتميز والإعدادات تُقرأ من الذاكرة، والتنفيذ مسؤول عن تعبئتها في load_state.
+    """
+
+    # ------------------- إدارة المستخدمين -------------------
+    @abstractmethod
+    async def get_user(self, user_id: int) -> dict:
+        """سجل المستخدم ({} إن لم يوجد)؛ يرفع استثناء عند فشل القراءة حتى لا يُعامل كمستخدم جديد"""
+
+    @abstractmethod
+    async def update_user(self, user_id: int, data: dict):
+        """كتابة الحقول المعطاة فقط من سجل المستخدم"""
+
+    @abstractmethod
+    async def register_user(self, user_id: int) -> bool:
+        """إنشاء السجل عند أول ظهور؛ True إذا أُنشئ الآن (ويُزاد total_users مرة واحدة)"""
+
+    @abstractmethod
+    async def commit_user(self, user_id: int, changes: dict, new_user: bool = False) -> bool:
+        """كتابة تعديلات تحديث واحد، مع تسجيل المستخدم إن بدا جديداً؛ True إذا سُجل الآن
+
+        التسجيل مشروط بعدم وجود السجل (قد يسبقنا تحديث آخر)، فلا يُستبدل joined_at ولا يُزاد total_users مرتين.
+        """
+
+    @abstractmethod
+    async def set_premium_flag(self, user_id: int, is_premium: bool) -> bool:
+        """تغيير علامة is_premium؛ True إذا تغيرت فعلاً (ويُعدل premium_users)"""
+
+    @abstractmethod
+    async def get_all_users(self) -> dict:
+        """كل المستخدمين {معرف نصي: سجل} (للبيانات الصغيرة فقط؛ للمرور على الجميع استخدم iter_users)"""
+
+    @abstractmethod
+    def iter_user_pages(self, page_size: int = None):
+        """مولد غير متزامن لصفحات {معرف نصي: سجل} مرتبة بالمفتاح"""
+
+    async def iter_users(self, page_size: int = None, prefetch: int = None):
+        """(user_id, سجل) لكل المستخدمين بذاكرة ثابتة، مع جلب الصفحة التالية أثناء معالجة الحالية"""
+        pages = prefetched(self.iter_user_pages(page_size), Config.USER_PAGE_PREFETCH if prefetch is None else prefetch)
+        async for page in pages:
+            for user_id, user in page.items():
+                if str(user_id).lstrip('-').isdigit():
+                    yield int(user_id), user if isinstance(user, dict) else {}
+
+    async def iter_user_ids(self, page_size: int = None):
+        async for user_id, _ in self.iter_users(page_size):
+            yield user_id
+
+    @abstractmethod
+    async def apply_usage(self, users: dict, total: int, hourly: dict):
+        """كتابة دفعة من زيادات الاستخدام في عملية ذرية واحدة
+
+        users: {user_id: {'count', 'last_request'}}، hourly: {مفتاح ساعة: {حقل: زيادة}}
+        تُزاد حاويات الساعات وتجميعها اليومي (daily_rollup) معاً.
+        """
+
+    # ------------------- الحظر والتميز -------------------
+    @abstractmethod
+    async def ban_user(self, user_id: int, reason: str = ""):
+        pass
+
+    @abstractmethod
+    async def unban_user(self, user_id: int):
+        pass
+
+    async def is_banned(self, user_id: int) -> bool:
+        return user_id in banned_users
+
+    @abstractmethod
+    async def get_premium_users(self) -> dict:
+        """المنح اليدوية للتميز {معرف نصي: {'expires_at': ...}}"""
+
+    # ------------------- الإحصاءات -------------------
+    @abstractmethod
+    async def get_stats(self) -> dict:
+        pass
+
+    @abstractmethod
+    async def increment_stats(self, **deltas):
+        """زيادة ذرية لعدادات STAT_COUNTERS"""
+
+    @abstractmethod
+    async def get_usage_history(self, hours: int = 24, days: int = 7) -> dict:
+        """حاويات آخر hours ساعة وآخر days يوم: {'hourly': {...}, 'daily': {...}} (قراءة لكل نوع)"""
+
+    @abstractmethod
+    async def prune_usage_history(self) -> int:
+        """حذف الحاويات الأقدم من مدة الاحتفاظ؛ يعيد عدد المحذوف"""
+
+    async def prune_user_changes(self) -> int:
+        """حذف أختام إبطال الكاش القديمة (user_changes في Firebase)؛ يعيد عدد المحذوف"""
+        return 0
+
+    @abstractmethod
+    async def count_users(self) -> int:
+        pass
+
+    @abstractmethod
+    async def count_premium_users(self) -> int:
+        pass
+
+    @abstractmethod
+    async def reconcile_user_counts(self) -> dict:
+        """إعادة العد وتصحيح العدادات المحفوظة؛ يعيد الأعداد والانحراف"""
+
+    @abstractmethod
+    async def initialize_stats(self):
+        pass
+
+    # ------------------- الإعدادات -------------------
+    @abstractmethod
+    async def get_settings(self) -> dict:
+        pass
+
+    @abstractmethod
+    async def update_settings(self, new_settings: dict):
+        pass
+
+    async def is_maintenance_mode(self) -> bool:
+        return live_settings.current.maintenance_mode
+
+    # ------------------- دورة الحياة -------------------
+    @abstractmethod
+    async def check_connection(self):
+        """كتابة وقراءة اختبارية عند بدء التشغيل (ترفع استثناء عند الفشل)"""
+
+    @abstractmethod
+    async def load_state(self):
+        """تعبئة الإعدادات والمحظورين وفهرس التميز في الذاكرة عند بدء التشغيل"""
+
+    @abstractmethod
+    async def aclose(self):
+        pass
+
+
+async def prefetched(pages, depth: int = 1):
+    """تمرير صفحات مولد غير متزامن مع قراءة حتى depth صفحات مسبقاً في مهمة خلفية
+
+    الذاكرة محدودة بـ depth + 2 صفحة مهما كان عدد المستخدمين، وdepth=0 يعطل الجلب المسبق.
+    """
+    if depth <= 0:
+        async for page in pages:
+            yield page
+        return
+
+    queue = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def produce():
+        try:
+            async for page in pages:
+                await queue.put(page)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+        await pages.aclose()
+
+
+def create_storage() -> Storage:
+    """إنشاء التخزين حسب STORAGE_BACKEND (firebase أو sql)"""
+    backend = Config.STORAGE_BACKEND
+    if backend == "sql":
+        from sql_db import SQLStorage
+        return SQLStorage(Config.SQL_DATABASE_URL)
+    if backend != "firebase":
+        logger.warning(f"Unknown storage backend {backend!r}, using firebase")
+    from async_firebase_db import AsyncFirebaseDB
+    return AsyncFirebaseDB()
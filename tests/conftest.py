@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+# config.py يتحقق من المتغيرات المطلوبة عند الاستيراد: قيم اختبار وتخزين SQLite مؤقت
+_TMP = tempfile.mkdtemp(prefix="grammar-bot-tests-")
+for name, value in {
+    'BOT_TOKEN': 'test-token',
+    'WEBHOOK_URL': 'https://example.invalid',
+    'CHANNEL_USERNAME': 'test_channel',
+    'ADMIN_USERNAMES': 'admin',
+    'OPENROUTER_API_KEY': 'test-key',
+    'STORAGE_BACKEND': 'sql',
+    'SQL_DATABASE_URL': f"sqlite:///{os.path.join(_TMP, 'bot.sqlite3')}",
+    'CACHE_DB_PATH': os.path.join(_TMP, 'result_cache.sqlite3'),
+    'SPELL_PREPASS_ENABLED': 'false',
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def sql_storage(tmp_path):
+    from sql_db import SQLStorage
+    storage = SQLStorage(f"sqlite:///{tmp_path / 'storage.sqlite3'}")
+    yield storage
+    storage.pool.close()
@@ -0,0 +1,43 @@
+import asyncio
+import time
+import pytest
+from utils.key_validation import ApiKeyRevokedError, hash_api_key
+from utils.limits import limiter
+from utils.openrouter import get_user_api_key, key_validator, revoke_user_api
+from utils.pipeline import TextJob
+from utils.premium_index import premium_index
+
+
+@pytest.fixture
+def revoked_user():
+    user_id, api_key = 4242, 'sk-or-revoked'
+    limiter.premium_users[user_id] = {'api_key': api_key, 'count': 0, 'reset_time': time.time() + 3600}
+    premium_index.set_api_user(user_id, True)
+    key_validator._tracked[hash_api_key(api_key)] = api_key
+    key_validator._cache[hash_api_key(api_key)] = {'valid': False, 'expires_at': time.time() + 60}
+    yield user_id, api_key
+    limiter.premium_users.pop(user_id, None)
+    premium_index.set_api_user(user_id, False)
+    key_validator._tracked.pop(hash_api_key(api_key), None)
+    key_validator._cache.pop(hash_api_key(api_key), None)
+
+
+def test_revoked_key_is_not_replaced_by_the_bot_key(revoked_user):
+    user_id, _ = revoked_user
+    with pytest.raises(ApiKeyRevokedError):
+        get_user_api_key(user_id)
+
+    async def main():
+        return [delta async for delta in TextJob("paraphrase", "نص للمعالجة", user_id).stream()]
+
+    with pytest.raises(ApiKeyRevokedError):
+        asyncio.run(main())
+
+
+def test_revoke_user_api_demotes_and_untracks(revoked_user):
+    user_id, api_key = revoked_user
+    asyncio.run(revoke_user_api(user_id))
+    assert user_id not in limiter.premium_users
+    assert not premium_index.is_premium(user_id)
+    assert hash_api_key(api_key) not in key_validator._tracked
+    assert get_user_api_key(user_id) is None
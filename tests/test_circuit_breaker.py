@@ -0,0 +1,118 @@
+import asyncio
+import json
+import httpx
+import pytest
+from config import Config
+from utils import openrouter
+from utils.circuit_breaker import GuardRegistry, UpstreamBusyError, UpstreamGuard
+from utils.hedging import HedgePolicy
+
+
+def _status_error(status: int, headers: dict = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://openrouter.invalid/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+async def _fail(error):
+    raise error
+
+
+def test_5xx_decreases_the_limit(monkeypatch):
+    monkeypatch.setattr(Config, 'CIRCUIT_FAILURE_THRESHOLD', 100)
+    guard = UpstreamGuard('shared')
+    limit = guard.limit
+
+    async def main():
+        with pytest.raises(httpx.HTTPStatusError):
+            await guard.call(lambda: _fail(_status_error(502)), 'primary')
+
+    asyncio.run(main())
+    assert guard.limit == max(Config.ADAPTIVE_MIN_LIMIT, limit / 2)
+    assert guard.stats['errors'] == 1 and guard.stats['overload'] == 0
+
+
+def test_4xx_client_errors_keep_the_limit():
+    guard = UpstreamGuard('shared')
+    limit = guard.limit
+
+    async def main():
+        with pytest.raises(httpx.HTTPStatusError):
+            await guard.call(lambda: _fail(_status_error(400)), 'primary')
+
+    asyncio.run(main())
+    assert guard.limit == limit
+    assert guard.get_stats()['circuits'] == {'primary': 'closed'}
+
+
+def test_429_and_timeouts_decrease_the_limit():
+    guard = UpstreamGuard('shared')
+    limit = guard.limit
+
+    async def main():
+        with pytest.raises(httpx.HTTPStatusError):
+            await guard.call(lambda: _fail(_status_error(429)), 'a')
+        with pytest.raises(httpx.ReadTimeout):
+            await guard.call(lambda: _fail(httpx.ReadTimeout("slow")), 'b')
+
+    asyncio.run(main())
+    assert guard.limit == max(Config.ADAPTIVE_MIN_LIMIT, limit / 4)
+    assert guard.stats['overload'] == 2
+
+
+def test_retry_after_opens_only_that_model():
+    guard = UpstreamGuard('shared')
+
+    async def ok():
+        return "ok"
+
+    async def main():
+        with pytest.raises(httpx.HTTPStatusError):
+            await guard.call(lambda: _fail(_status_error(429, {'Retry-After': '30'})), 'primary')
+        with pytest.raises(UpstreamBusyError):
+            await guard.call(ok, 'primary')
+        return await guard.call(ok, 'fallback')
+
+    assert asyncio.run(main()) == "ok"
+    assert guard.get_stats()['circuits'] == {'primary': 'open', 'fallback': 'closed'}
+
+
+def test_exhausted_credit_blocks_every_model():
+    guard = UpstreamGuard('key')
+    guard.apply_key_info({'valid': True, 'limit_remaining': 0})
+
+    async def ok():
+        return "ok"
+
+    with pytest.raises(UpstreamBusyError):
+        asyncio.run(guard.call(ok, 'any-model'))
+
+
+def test_failover_to_fallback_model_after_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(Config, 'OPENROUTER_MODEL', 'primary')
+    monkeypatch.setattr(Config, 'OPENROUTER_FALLBACK_MODELS', ['fallback'])
+    monkeypatch.setattr(openrouter, 'upstream_guards', GuardRegistry())
+    monkeypatch.setattr(openrouter, 'hedge_policy', HedgePolicy())
+    requests = []
+
+    def handler(request):
+        model = json.loads(request.content)['model']
+        requests.append(model)
+        if model == 'primary':
+            return httpx.Response(429, headers={'Retry-After': '30'})
+        return httpx.Response(200, json={'choices': [{'message': {'content': 'من النموذج البديل'}}]})
+
+    client = openrouter.OpenRouterClient(base_url='https://openrouter.invalid/api/v1')
+    monkeypatch.setattr(openrouter, 'client', client)
+
+    async def main():
+        client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+        try:
+            # الطلب الثاني يجد قاطع النموذج الأساسي مفتوحاً فيذهب للبديل مباشرة
+            return [await openrouter.query_openrouter_async("نص") for _ in range(2)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(main()) == ['من النموذج البديل'] * 2
+    assert requests == ['primary', 'fallback', 'fallback']
+    assert openrouter.hedge_policy.stats['failovers'] == 2
@@ -0,0 +1,101 @@
+import asyncio
+import httpx
+import pytest
+from utils.fake_openrouter import PROFILES, FakeOpenRouter, Profile
+from utils.loadtest import run_load
+from utils.openrouter import OpenRouterClient
+
+PROMPT = "صحح النص التالي:\n\nانا ذهبت الى المدرسه\n\nأعد النص المصحح فقط."
+EXPECTED = "أنا ذهبت إلى المدرسة"
+
+
+def _run(profile, scenario, **server_kwargs):
+    """تشغيل سيناريو على عميل حقيقي متصل بالخادم الوهمي عبر loopback"""
+    async def run():
+        async with FakeOpenRouter(profile, seed=1, **server_kwargs) as server:
+            base_url = await server.start()
+            async with OpenRouterClient(base_url=base_url, max_connections=4, max_inflight=4) as client:
+                return await scenario(client), server.stats
+
+    return asyncio.run(run())
+
+
+def test_chat_over_a_single_kept_alive_connection():
+    async def scenario(client):
+        return [await client.chat(PROMPT) for _ in range(3)]
+
+    replies, stats = _run(PROFILES['instant'], scenario)
+    assert replies == [EXPECTED] * 3
+    assert stats['requests'] == 3
+    assert stats['connections'] == 1
+
+
+def test_stream_chat_yields_tokens_until_done():
+    async def scenario(client):
+        return [[delta async for delta in client.stream_chat(PROMPT)] for _ in range(2)]
+
+    streams, stats = _run(Profile(ttft_median_ms=1, ttft_sigma=0, tokens_per_second=0, chars_per_token=2), scenario)
+    assert all(len(deltas) > 1 and "".join(deltas) == EXPECTED for deltas in streams)
+    assert stats['streamed'] == 2
+    assert stats['connections'] == 1
+
+
+def test_stream_error_chunk_raises():
+    async def scenario(client):
+        received = []
+        with pytest.raises(RuntimeError, match="Provider disconnected"):
+            async for delta in client.stream_chat(PROMPT):
+                received.append(delta)
+        return received
+
+    received, stats = _run(Profile(ttft_median_ms=1, ttft_sigma=0, tokens_per_second=0, stream_error_rate=1), scenario)
+    assert received and "".join(received) != EXPECTED
+    assert stats['stream_errors'] == 1
+
+
+def test_rate_limit_returns_429_with_retry_after():
+    async def scenario(client):
+        with pytest.raises(httpx.HTTPStatusError) as info:
+            await client.chat(PROMPT)
+        return info.value.response
+
+    response, stats = _run(Profile(ttft_median_ms=1, ttft_sigma=0, rate_429=1, retry_after=2), scenario)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == "2"
+    assert stats['429'] == 1
+
+
+def test_auth_key_reports_limits_and_rejects_revoked_keys():
+    async def scenario(client):
+        valid = await client.get_key_info("sk-or-valid-1234")
+        revoked = await client.get_key_info("sk-or-revoked")
+        return valid, revoked
+
+    (valid, revoked), stats = _run(PROFILES['instant'], scenario, revoked_keys={"sk-or-revoked"},
+                                   key_rate_limit=20, key_credit=5.0)
+    assert valid.status_code == 200
+    data = valid.json()['data']
+    assert data['label'] == "fake-1234"
+    assert data['rate_limit'] == {'requests': 20, 'interval': '10s'}
+    assert data['limit_remaining'] == 5.0
+    assert revoked.status_code == 401
+    assert stats['auth_errors'] == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_load_benchmark_reuses_pooled_connections(stream):
+    result = asyncio.run(run_load('instant', requests=40, concurrency=4, stream=stream, seed=1))
+    assert result['ok'] == 40 and not result['errors']
+    assert result['server']['requests'] == 40
+    assert result['server']['connections'] <= 4
+    assert result['p50'] <= result['p95'] <= result['p99']
+
+
+def test_load_benchmark_counts_upstream_errors():
+    profile = Profile(ttft_median_ms=1, ttft_sigma=0, tokens_per_second=0, rate_429=0.3, rate_5xx=0.2)
+    result = asyncio.run(run_load(profile, requests=30, concurrency=5, stream=True, seed=3))
+    server = result['server']
+    assert result['ok'] + sum(result['errors'].values()) == 30
+    assert result['errors'].get(429, 0) == server['429']
+    assert result['errors'].get(502, 0) == server['5xx']
+    assert server['429'] and server['5xx']
@@ -0,0 +1,37 @@
+import pytest
+from firebase_common import firebase_key_order, stats_increment_updates, user_change_updates
+
+
+def test_firebase_key_order_puts_32bit_integers_first():
+    keys = ['b', '10', '-3', '2', str(2 ** 31), 'a']
+    assert sorted(keys, key=firebase_key_order) == ['-3', '2', '10', str(2 ** 31), 'a', 'b']
+
+
+def test_stats_increment_updates_skips_zero_and_rejects_unknown():
+    assert stats_increment_updates({'total_requests': 3, 'total_users': 0}) == {
+        'stats/total_requests': {'.sv': {'increment': 3}}
+    }
+    with pytest.raises(ValueError):
+        stats_increment_updates({'visits': 1})
+
+
+def test_user_change_updates_uses_one_path_per_user():
+    updates = user_change_updates(77)
+    assert list(updates) == ['user_changes/77']
+
+
+def test_own_write_stamps_are_dropped_on_echo():
+    from types import SimpleNamespace
+    from firebase_common import UserCache
+
+    cache = UserCache()
+    cache._listener = object()
+    cache.put(5, {'request_count': 1})
+    cache.mark_own_write(5, 100.0)
+    cache._on_event(SimpleNamespace(path='/5', data=100.0, event_type='put'))
+    assert cache._own_writes == {}
+    assert cache.get(5) == {'request_count': 1}
+
+    # ختم من نسخة أخرى يبطل النسخة المخزنة
+    cache._on_event(SimpleNamespace(path='/5', data=101.0, event_type='put'))
+    assert cache.get(5) is None
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+
+pytest.importorskip("google.oauth2")
+
+from async_firebase_db import AsyncFirebaseDB
+from config import Config
+
+
+class FakeRealtimeDatabase:
+    """محاكاة صغيرة لـ REST API في Realtime Database: GET (مع الترتيب والحدود) وPATCH وPUT"""
+
+    def __init__(self, tree: dict = None, value_index: bool = True, failing_reads: set = ()):
+        self.tree = tree or {}
+        self.value_index = value_index
+        self.failing_reads = set(failing_reads)
+        self.requests = []
+
+    def _node(self, path: str):
+        node = self.tree
+        for part in filter(None, path.split('/')):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def _set(self, path: str, value):
+        parts = [part for part in path.split('/') if part]
+        node = self.tree
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if isinstance(value, dict) and '.sv' in value:
+            value = (node.get(parts[-1]) or 0) + value['.sv']['increment']
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _query(self, node: dict, params) -> dict:
+        order = json.loads(params['orderBy'])
+        if order == '$value' and not self.value_index:
+            raise LookupError('Index not defined, add ".indexOn": ".value"')
+        sort_key = (lambda item: item[1]) if order == '$value' else (lambda item: int(item[0]))
+        items = sorted(node.items(), key=sort_key)
+        if 'startAt' in params:
+            items = [item for item in items if sort_key(item) >= sort_key((json.loads(params['startAt']),) * 2)]
+        if 'endAt' in params:
+            items = [item for item in items if sort_key(item) <= sort_key((json.loads(params['endAt']),) * 2)]
+        if 'limitToFirst' in params:
+            items = items[:json.loads(params['limitToFirst'])]
+        return dict(items)
+
+    def _etag(self, path: str) -> str:
+        return str(hash(json.dumps(self._node(path), sort_keys=True)))
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path[:-len('.json')]
+        self.requests.append((request.method, path))
+        if request.method == 'GET':
+            if path in self.failing_reads:
+                return httpx.Response(503, json={'error': 'unavailable'})
+            node = self._node(path)
+            if request.headers.get('X-Firebase-ETag'):
+                return httpx.Response(200, content=json.dumps(node), headers={'ETag': self._etag(path)})
+            if 'orderBy' in request.url.params:
+                try:
+                    node = self._query(node or {}, request.url.params)
+                except LookupError as e:
+                    return httpx.Response(400, json={'error': str(e)})
+            return httpx.Response(200, content=json.dumps(node))
+        body = json.loads(request.content)
+        if request.method == 'PATCH':
+            for key, value in body.items():
+                self._set(f"{path}/{key}", value)
+        elif request.method == 'PUT':
+            if 'if-match' in request.headers and request.headers['if-match'] != self._etag(path):
+                return httpx.Response(412, content=json.dumps(self._node(path)), headers={'ETag': self._etag(path)})
+            self._set(path, body)
+        return httpx.Response(200, json=body)
+
+
+def _storage(fake: FakeRealtimeDatabase, monkeypatch) -> AsyncFirebaseDB:
+    storage = AsyncFirebaseDB(database_url='https://bot.invalid', service_account_info={})
+
+    async def token():
+        return 'token'
+
+    monkeypatch.setattr(storage, '_get_token', token)
+    storage._client = httpx.AsyncClient(base_url=storage.database_url, transport=httpx.MockTransport(fake.handler))
+    return storage
+
+
+@pytest.mark.parametrize('value_index', [True, False])
+def test_prune_user_changes_keeps_recent_stamps(monkeypatch, value_index):
+    monkeypatch.setattr(Config, 'USER_PAGE_SIZE', 2)
+    now = time.time()
+    old = now - Config.USER_CHANGES_RETENTION_HOURS * 3600 - 60
+    fake = FakeRealtimeDatabase({'user_changes': {
+        '1': old, '2': now, '3': old - 10, '4': old, '5': now - 5, '6': old
+    }}, value_index=value_index)
+    storage = _storage(fake, monkeypatch)
+
+    async def main():
+        try:
+            return await storage.prune_user_changes()
+        finally:
+            await storage.aclose()
+
+    assert asyncio.run(main()) == 4
+    assert sorted(fake.tree['user_changes']) == ['2', '5']
+
+
+def test_cached_request_commits_in_one_round_trip(monkeypatch):
+    from firebase_common import user_cache
+    from utils.limits import UsageLimiter
+    from utils.request_context import using_request
+    from utils.usage_buffer import UsageBuffer
+
+    fake = FakeRealtimeDatabase({'users': {'31': {'request_count': 1}}, 'stats': {'total_users': 1}})
+    storage = _storage(fake, monkeypatch)
+    limiter = UsageLimiter()
+    limiter.db = storage
+    limiter.usage = UsageBuffer(storage)
+    user_cache.put(31, {'request_count': 1})
+
+    async def handle(user_id: int):
+        async with using_request(user_id, limiter) as request:
+            await limiter.check_limits(user_id)
+            request.update(last_mode='correct')
+            await limiter.increment_usage(user_id, 'correct')
+        return request.round_trips
+
+    async def main():
+        try:
+            return await handle(31), await handle(32)
+        finally:
+            await storage.aclose()
+
+    try:
+        cached, new_user = asyncio.run(main())
+    finally:
+        user_cache.invalidate(31)
+        user_cache.invalidate(32)
+
+    assert cached == 1
+    # مستخدم جديد: قراءة السجل، ثم معاملة joined_at (قراءة وكتابة مشروطة)، ثم PATCH واحد
+    assert new_user == 4
+    assert fake.requests[-1] == ('PATCH', '/')
+    assert fake.tree['users']['31']['last_mode'] == 'correct'
+    assert fake.tree['users']['32']['joined_at'] and fake.tree['stats']['total_users'] == 2
+
+
+def _limiter_on(storage):
+    from utils.limits import UsageLimiter
+    from utils.usage_buffer import UsageBuffer
+
+    limiter = UsageLimiter()
+    limiter.db = storage
+    limiter.usage = UsageBuffer(storage)
+    return limiter
+
+
+def test_failed_read_is_not_treated_as_a_new_user(monkeypatch):
+    from utils.request_context import using_request
+
+    existing = {'joined_at': 1000.0, 'request_count': 7}
+    fake = FakeRealtimeDatabase({'users': {'41': dict(existing)}, 'stats': {'total_users': 1}},
+                                failing_reads={'/users/41'})
+    storage = _storage(fake, monkeypatch)
+    limiter = _limiter_on(storage)
+
+    async def main():
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                async with using_request(41, limiter) as request:
+                    await request.load()
+            return request
+        finally:
+            await storage.aclose()
+
+    request = asyncio.run(main())
+    assert request.user is None
+    assert fake.tree['users']['41'] == existing
+    assert fake.tree['stats']['total_users'] == 1
+
+
+def test_commit_for_a_user_created_meanwhile_keeps_joined_at(monkeypatch):
+    fake = FakeRealtimeDatabase({'users': {'42': {'joined_at': 1000.0}}, 'stats': {'total_users': 1}})
+    storage = _storage(fake, monkeypatch)
+
+    async def main():
+        try:
+            # سجل أنشأته نسخة أخرى بعد قراءتنا له فارغاً
+            return await storage.commit_user(42, {'last_mode': 'correct'}, new_user=True)
+        finally:
+            await storage.aclose()
+
+    try:
+        created = asyncio.run(main())
+    finally:
+        from firebase_common import user_cache
+        user_cache.invalidate(42)
+
+    assert created is False
+    assert fake.tree['users']['42']['joined_at'] == 1000.0
+    assert fake.tree['users']['42']['last_mode'] == 'correct'
+    assert fake.tree['stats']['total_users'] == 1
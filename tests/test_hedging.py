@@ -0,0 +1,36 @@
+import asyncio
+from config import Config
+from utils.hedging import CHAT, STREAM, HedgePolicy
+
+
+def test_chat_and_stream_latency_have_separate_deadlines(monkeypatch):
+    monkeypatch.setattr(Config, 'HEDGE_MIN_SAMPLES', 5)
+    monkeypatch.setattr(Config, 'HEDGE_MIN_DELAY', 0.1)
+    policy = HedgePolicy()
+    for _ in range(10):
+        policy.record('m', 0.2, STREAM)
+        policy.record('m', 10, CHAT)
+
+    assert policy.deadline('m', STREAM) == 0.2
+    assert policy.deadline('m', CHAT) == 10
+
+
+def test_stream_samples_do_not_shorten_the_chat_deadline(monkeypatch):
+    monkeypatch.setattr(Config, 'HEDGE_MIN_SAMPLES', 5)
+    monkeypatch.setattr(Config, 'HEDGE_MIN_DELAY', 0.01)
+    monkeypatch.setattr(Config, 'OPENROUTER_FALLBACK_MODELS', ['fallback'])
+    policy = HedgePolicy()
+    for _ in range(10):
+        policy.record('primary', 0.01, STREAM)
+
+    async def call(model):
+        await asyncio.sleep(0.05)
+        return model
+
+    async def main():
+        return await policy.chat(call, primary='primary')
+
+    # بدون عينات chat كافية تُستخدم المهلة الافتراضية، فلا يُرسل طلب احتياطي
+    assert asyncio.run(main()) == 'primary'
+    assert policy.stats['hedges'] == 0
+    assert ('primary', CHAT) in policy.histograms
@@ -0,0 +1,39 @@
+from utils.incremental import SentenceMemo
+
+TEXT = "انا ذهبت الى المدرسه. كان الجو جميلا جدا. ثم عدت الى البيت مساء."
+CORRECTED = "أنا ذهبت إلى المدرسة. كان الجو جميلاً جداً. ثم عدت إلى البيت مساءً."
+EDITED = "انا ذهبت الى المدرسه. كان الجو باردا جدا. ثم عدت الى البيت مساء."
+
+
+def test_aligned_output_is_reused_for_unchanged_sentences():
+    memo = SentenceMemo()
+    memo.remember(1, "correct", TEXT, CORRECTED)
+
+    segments, gaps = memo.plan(1, "correct", EDITED)
+    assert segments == [
+        ("انا ذهبت الى المدرسه.", "أنا ذهبت إلى المدرسة."),
+        ("كان الجو باردا جدا.", None),
+        ("ثم عدت الى البيت مساء.", "ثم عدت إلى البيت مساءً."),
+    ]
+    assert memo.stats == {'reused': 2, 'sent': 1}
+
+
+def test_misaligned_output_with_the_same_sentence_count_is_not_cached():
+    # النموذج دمج أول جملتين وقسم الأخيرة: العدد نفسه لكن الجمل لا تقابل أصولها
+    merged = "أنا ذهبت إلى المدرسة وكان الجو جميلاً جداً. ثم عدت. وصلت إلى البيت مساءً."
+    memo = SentenceMemo()
+    memo.remember(1, "correct", TEXT, merged)
+    assert memo.plan(1, "correct", EDITED) is None
+
+
+def test_misaligned_output_drops_the_previous_memo():
+    memo = SentenceMemo()
+    memo.remember(1, "correct", TEXT, CORRECTED)
+    memo.remember(1, "correct", TEXT, "نص مختلف تماماً. لا علاقة له. بالأصل أبداً.")
+    assert memo.plan(1, "correct", EDITED) is None
+
+
+def test_rewrite_results_are_not_remembered():
+    memo = SentenceMemo()
+    memo.remember(1, "rewrite", TEXT, CORRECTED)
+    assert memo.plan(1, "rewrite", EDITED) is None
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import httpx
+import pytest
+from config import Config
+from utils import openrouter
+from utils.openrouter import OpenRouterClient
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    """كل AsyncClient ينشئه OpenRouterClient يمر عبر MockTransport مع تسجيل معاملات الإنشاء"""
+    state = {'handler': None, 'created': [], 'requests': []}
+    real_client = httpx.AsyncClient
+
+    def handler(request):
+        state['requests'].append(request)
+        return state['handler'](request)
+
+    def factory(**kwargs):
+        state['created'].append(kwargs)
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(openrouter.httpx, 'AsyncClient', factory)
+    return state
+
+
+def _completion(content):
+    return httpx.Response(200, json={'choices': [{'message': {'content': content}}]})
+
+
+def _sse(*events):
+    body = "".join(f"{event}\n\n" for event in events)
+    return httpx.Response(200, headers={'Content-Type': 'text/event-stream'}, content=body.encode('utf-8'))
+
+
+def test_client_is_reused_across_requests(mock_upstream):
+    mock_upstream['handler'] = lambda request: _completion("تم")
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1", max_connections=7)
+
+    async def run():
+        first = await client.chat("أ")
+        second = await client.chat("ب")
+        reused = client._get_client()
+        await client.aclose()
+        return first, second, reused
+
+    first, second, reused = asyncio.run(run())
+    assert first == second == "تم"
+    assert len(mock_upstream['created']) == 1
+    assert reused.is_closed
+    limits = mock_upstream['created'][0]['limits']
+    assert limits.max_connections == limits.max_keepalive_connections == 7
+    assert limits.keepalive_expiry == 60
+    assert [str(r.url) for r in mock_upstream['requests']] == ["https://upstream.invalid/api/v1/chat/completions"] * 2
+
+
+def test_client_is_recreated_after_close(mock_upstream):
+    mock_upstream['handler'] = lambda request: _completion("تم")
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+
+    async def run():
+        await client.chat("أ")
+        await client.aclose()
+        await client.chat("ب")
+        await client.aclose()
+
+    asyncio.run(run())
+    assert len(mock_upstream['created']) == 2
+
+
+def test_falls_back_to_http1_without_h2(mock_upstream, monkeypatch):
+    monkeypatch.setattr(Config, 'OPENROUTER_HTTP2', True)
+    monkeypatch.setattr(openrouter, 'HTTP2_AVAILABLE', False)
+    mock_upstream['handler'] = lambda request: _completion("تم")
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+
+    async def run():
+        async with client:
+            return await client.chat("أ")
+
+    # httpx يرفض http2=True دون حزمة h2، فالعودة إلى HTTP/1.1 تُبقي العميل صالحاً
+    assert asyncio.run(run()) == "تم"
+    assert client.http2 is False
+    assert mock_upstream['created'][0]['http2'] is False
+
+
+def test_http2_requested_when_h2_is_available(monkeypatch):
+    monkeypatch.setattr(Config, 'OPENROUTER_HTTP2', True)
+    monkeypatch.setattr(openrouter, 'HTTP2_AVAILABLE', True)
+    assert OpenRouterClient().http2 is True
+    monkeypatch.setattr(Config, 'OPENROUTER_HTTP2', False)
+    assert OpenRouterClient().http2 is False
+
+
+@pytest.mark.parametrize("status", [401, 429, 502])
+def test_error_status_raises_http_status_error(mock_upstream, status):
+    mock_upstream['handler'] = lambda request: httpx.Response(
+        status, headers={'Retry-After': '3'}, json={'error': {'code': status, 'message': 'fail'}}
+    )
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+
+    async def run(stream):
+        async with client:
+            if stream:
+                return [delta async for delta in client.stream_chat("أ")]
+            return await client.chat("أ")
+
+    for stream in (False, True):
+        with pytest.raises(httpx.HTTPStatusError) as info:
+            asyncio.run(run(stream))
+        assert info.value.response.status_code == status
+        assert info.value.response.headers['Retry-After'] == '3'
+
+
+def test_stream_parses_sse_and_maps_error_chunks(mock_upstream):
+    chunk = lambda text: "data: " + json.dumps({'choices': [{'delta': {'content': text}}]}, ensure_ascii=False)
+    responses = iter([
+        _sse(": OPENROUTER PROCESSING", chunk("مر"), "data: {not json", chunk("حبا"), "data: [DONE]", chunk("بعد")),
+        _sse(chunk("مر"), "data: " + json.dumps({'error': {'code': 502, 'message': 'Provider disconnected'}})),
+    ])
+    mock_upstream['handler'] = lambda request: next(responses)
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+    received = []
+
+    async def run():
+        async with client:
+            async for delta in client.stream_chat("أ"):
+                received.append(delta)
+            async for delta in client.stream_chat("أ"):
+                received.append(delta)
+
+    with pytest.raises(RuntimeError, match="Provider disconnected"):
+        asyncio.run(run())
+    assert received == ["مر", "حبا", "مر"]
+    assert json.loads(mock_upstream['requests'][0].content)['stream'] is True
+
+
+def test_headers_use_personal_key_or_bot_key(mock_upstream):
+    mock_upstream['handler'] = lambda request: _completion("تم")
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+
+    async def run():
+        async with client:
+            await client.chat("أ", api_key="sk-personal")
+            await client.chat("أ")
+
+    asyncio.run(run())
+    personal, shared = (request.headers for request in mock_upstream['requests'])
+    assert personal['Authorization'] == "Bearer sk-personal"
+    assert 'HTTP-Referer' not in personal and 'X-Title' not in personal
+    assert shared['Authorization'] == f"Bearer {Config.OPENROUTER_API_KEY}"
+    assert shared['X-Title'] == Config.SITE_TITLE
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.exhausted = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        self.exhausted = True
+
+
+def test_stream_body_is_read_to_the_end_after_done(mock_upstream):
+    # ما بعد [DONE] (نهاية الترميز المجزأ) يُقرأ حتى يعود الاتصال إلى المجمع
+    body = _TrackedStream([b'data: {"choices": [{"delta": {"content": "\xd8\xaa\xd9\x85"}}]}\n\n',
+                           b"data: [DONE]\n\n", b": trailing\n\n"])
+    mock_upstream['handler'] = lambda request: httpx.Response(
+        200, headers={'Content-Type': 'text/event-stream'}, stream=body
+    )
+    client = OpenRouterClient(base_url="https://upstream.invalid/api/v1")
+
+    async def run():
+        async with client:
+            return [delta async for delta in client.stream_chat("أ")]
+
+    assert asyncio.run(run()) == ["تم"]
+    assert body.exhausted
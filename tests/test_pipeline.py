@@ -0,0 +1,96 @@
+import asyncio
+import time
+import pytest
+from utils.limits import limiter
+from utils.pipeline import TextJob
+from utils.premium_index import premium_index
+
+
+@pytest.fixture
+def personal_key_user():
+    user_id = 5151
+    limiter.premium_users[user_id] = {'api_key': 'sk-or-personal', 'count': 0, 'reset_time': time.time() + 3600}
+    premium_index.set_api_user(user_id, True)
+    yield user_id
+    limiter.premium_users.pop(user_id, None)
+    premium_index.set_api_user(user_id, False)
+
+
+def _fake_upstream(monkeypatch, calls: list):
+    async def call(self, prompt):
+        calls.append(self.api_key)
+        await asyncio.sleep(0.05)
+        yield f"ناتج {self.api_key}"
+
+    monkeypatch.setattr(TextJob, '_call', call)
+
+
+def test_same_text_on_different_keys_does_not_coalesce(monkeypatch, personal_key_user):
+    calls = []
+    _fake_upstream(monkeypatch, calls)
+    text = "نص منتشر يرسله كثيرون في نفس اللحظة"
+
+    async def run(job):
+        return "".join([delta async for delta in job.stream()])
+
+    async def main():
+        jobs = [TextJob("rewrite", text, personal_key_user, incremental=False),
+                TextJob("rewrite", text, 6262, incremental=False)]
+        return jobs, await asyncio.gather(*(run(job) for job in jobs))
+
+    jobs, results = asyncio.run(main())
+    assert sorted(calls, key=str) == [None, 'sk-or-personal']
+    assert results == ["ناتج sk-or-personal", "ناتج None"]
+    assert not any(job.coalesced for job in jobs)
+
+
+def test_same_text_on_same_key_coalesces(monkeypatch):
+    calls = []
+    _fake_upstream(monkeypatch, calls)
+
+    async def run(job):
+        return "".join([delta async for delta in job.stream()])
+
+    async def main():
+        jobs = [TextJob("rewrite", "نص مشترك آخر", user_id, incremental=False) for user_id in (7001, 7002)]
+        await asyncio.gather(*(run(job) for job in jobs))
+        return jobs
+
+    jobs = asyncio.run(main())
+    assert calls == [None]
+    assert [job.coalesced for job in jobs] == [False, True]
+
+
+def _local_prepass(monkeypatch):
+    import os
+    from utils.prepass import spell_prepass
+    from utils.spellcheck import SpellChecker
+
+    checker = SpellChecker.from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'arabic_lexicon.txt'))
+
+    async def check(text):
+        return checker.check(text)
+
+    monkeypatch.setattr(spell_prepass, 'check', check)
+
+
+@pytest.mark.parametrize('mode, text, local', [
+    # كل الكلمات في القاموس لكن التذكير والتأنيث خطأ نحوي لا يراه الفحص المحلي
+    ('correct', "هذا البنت جميل", False),
+    ('spelling', "i has a apple, he go to school yesterday", False),
+    ('spelling', "هذه الرساله جميله", True),
+])
+def test_only_spelling_mode_on_arabic_text_is_answered_locally(monkeypatch, mode, text, local):
+    calls = []
+    _fake_upstream(monkeypatch, calls)
+    _local_prepass(monkeypatch)
+
+    async def main():
+        job = TextJob(mode, text, incremental=False)
+        return job, "".join([delta async for delta in job.stream()])
+
+    job, result = asyncio.run(main())
+    assert job.local is local
+    assert (calls == []) is local
+    if local:
+        assert result == "هذه الرسالة جميلة"
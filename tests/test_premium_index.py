@@ -0,0 +1,28 @@
+import time
+from utils.premium_index import PremiumIndex, parse_expiry
+
+
+def test_parse_expiry():
+    assert parse_expiry({'expires_at': '2000000000'}) == 2e9
+    assert parse_expiry({'until': None}) is None
+    assert parse_expiry(True) is None
+    assert parse_expiry(2e9) == 2e9
+
+
+def test_grant_expires_without_any_write():
+    index = PremiumIndex()
+    index.replace_grants({'1': {'expires_at': time.time() + 3600}, '2': {'expires_at': time.time() - 1}, '3': True})
+    assert index.is_premium(1)
+    assert not index.is_premium(2)
+    assert index.is_premium(3)
+    assert index.get_stats()['expired'] == 1
+
+
+def test_sources_are_independent():
+    index = PremiumIndex()
+    index.set_api_user(5, True)
+    index.set_flag(6, True)
+    assert index.is_premium(5) and index.is_premium(6)
+    index.set_api_user(5, False)
+    index.replace_flags([])
+    assert not index.is_premium(5) and not index.is_premium(6)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from utils.limits import UsageLimiter
+from utils.premium_index import premium_index
+from utils.request_context import using_request
+from utils.usage_buffer import UsageBuffer
+
+
+def _limiter(storage) -> UsageLimiter:
+    limiter = UsageLimiter()
+    limiter.db = storage
+    limiter.usage = UsageBuffer(storage)
+    return limiter
+
+
+def test_grant_and_api_premium_are_not_persisted_as_admin_flag(sql_storage):
+    limiter = _limiter(sql_storage)
+    premium_index.replace_grants({'8': {'expires_at': time.time() + 3600}})
+
+    async def main():
+        await sql_storage.initialize_stats()
+        await limiter.set_premium_user(7, 'sk-personal')
+        for user_id in (7, 8):
+            async with using_request(user_id, limiter) as request:
+                assert request.is_premium
+                await limiter.check_limits(user_id)
+                await limiter.increment_usage(user_id, 'correct')
+        await limiter.usage.flush()
+        return [await sql_storage.get_user(user_id) for user_id in (7, 8)], await sql_storage.get_stats()
+
+    try:
+        users, stats = asyncio.run(main())
+    finally:
+        premium_index.set_api_user(7, False)
+        premium_index.replace_grants({})
+
+    assert [user.get('is_premium', False) for user in users] == [False, False]
+    assert [user['request_count'] for user in users] == [1, 1]
+    assert stats['premium_users'] == 0
+
+
+def test_commit_registers_and_writes_in_one_round_trip(sql_storage):
+    limiter = _limiter(sql_storage)
+
+    async def handle(user_id: int, **fields):
+        async with using_request(user_id, limiter) as request:
+            await limiter.check_limits(user_id)
+            request.update(**fields)
+            await limiter.increment_usage(user_id, 'correct')
+        return request.round_trips
+
+    async def main():
+        await sql_storage.initialize_stats()
+        trips = [await handle(9), await handle(9, last_mode='correct')]
+        await limiter.usage.flush()
+        return trips, await sql_storage.get_user(9), await sql_storage.get_stats()
+
+    trips, user, stats = asyncio.run(main())
+    # قراءة السجل ثم كتابة واحدة (SQL بلا كاش مستخدمين)
+    assert trips == [2, 2]
+    assert user['last_mode'] == 'correct' and user['joined_at'] and user['request_count'] == 2
+    assert stats['total_users'] == 1
+
+
+def test_failed_read_does_not_register_or_reset_the_user(sql_storage, monkeypatch):
+    import pytest
+    limiter = _limiter(sql_storage)
+
+    async def main():
+        await sql_storage.initialize_stats()
+        await sql_storage.commit_user(12, {'request_count': 3}, new_user=True)
+        joined_at = (await sql_storage.get_user(12))['joined_at']
+
+        def unavailable():
+            raise ConnectionError("database unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(sql_storage.pool, 'acquire', unavailable)
+            with pytest.raises(ConnectionError):
+                async with using_request(12, limiter) as request:
+                    await request.load()
+        assert request.user is None and not request._new_user
+        return joined_at, await sql_storage.get_user(12), await sql_storage.get_stats()
+
+    joined_at, user, stats = asyncio.run(main())
+    assert user['joined_at'] == joined_at and user['request_count'] == 3
+    assert stats['total_users'] == 1
@@ -0,0 +1,102 @@
+import asyncio
+from config import Config
+from utils.scheduler import PRIORITY_FREE, PRIORITY_PREMIUM, RequestScheduler
+
+
+def test_positions_follow_priority_and_round_robin(monkeypatch):
+    monkeypatch.setattr(Config, 'QUEUE_UPDATE_INTERVAL', 0.01)
+    scheduler = RequestScheduler(max_concurrent=1)
+    served = []
+    positions = {}
+
+    async def job(name, user_id, priority, hold):
+        async def on_wait(position, eta):
+            positions.setdefault(name, position)
+
+        async with scheduler.slot(user_id, priority, on_wait=on_wait):
+            served.append(name)
+            await hold.wait()
+
+    async def main():
+        hold = asyncio.Event()
+        first = asyncio.create_task(job('running', 1, PRIORITY_FREE, hold))
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(job('free-a1', 2, PRIORITY_FREE, hold)),
+            asyncio.create_task(job('free-a2', 2, PRIORITY_FREE, hold)),
+            asyncio.create_task(job('free-b1', 3, PRIORITY_FREE, hold)),
+            asyncio.create_task(job('premium', 4, PRIORITY_PREMIUM, hold)),
+        ]
+        await asyncio.sleep(0.05)
+        hold.set()
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(main())
+    assert served == ['running', 'premium', 'free-a1', 'free-b1', 'free-a2']
+    assert positions['premium'] == 1
+
+
+def test_waiting_does_not_rescan_the_queue_every_tick(monkeypatch):
+    monkeypatch.setattr(Config, 'QUEUE_UPDATE_INTERVAL', 0.001)
+    scheduler = RequestScheduler(max_concurrent=1)
+    scans = []
+    dispatch_order = scheduler._dispatch_order
+
+    def counted():
+        scans.append(1)
+        return dispatch_order()
+
+    scheduler._dispatch_order = counted
+
+    async def main():
+        hold = asyncio.Event()
+
+        async def job(user_id):
+            async with scheduler.slot(user_id, PRIORITY_FREE, on_wait=lambda *args: asyncio.sleep(0)):
+                await hold.wait()
+
+        tasks = [asyncio.create_task(job(user_id)) for user_id in range(50)]
+        await asyncio.sleep(0.01)
+        scans_while_queued = len(scans)
+        # عشرات الدورات من الانتظار دون أي تغيير في الطوابير
+        await asyncio.sleep(0.1)
+        assert len(scans) == scans_while_queued
+        hold.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # مرور واحد لكل إضافة ولكل إرسال، لا لكل منتظر في كل دورة
+    assert len(scans) <= 2 * 50
+
+
+def test_cancelled_requests_do_not_skew_the_service_time():
+    scheduler = RequestScheduler(max_concurrent=1)
+
+    async def job(hold):
+        async with scheduler.slot(1):
+            await hold.wait()
+
+    async def main():
+        hold = asyncio.Event()
+        running = asyncio.create_task(job(hold))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(job(hold))
+        await asyncio.sleep(0)
+
+        # المنتظر يُلغى أولاً ثم الطلب الجاري في منتصف تنفيذه فيعطيه مكانه قبل أن يصله الإلغاء
+        waiting.cancel()
+        running.cancel()
+        hold.set()
+        results = await asyncio.gather(running, waiting, return_exceptions=True)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+    asyncio.run(main())
+    assert scheduler.active == 0
+    assert scheduler.avg_service_time == 3.0
+
+    async def completed():
+        async with scheduler.slot(1):
+            pass
+
+    asyncio.run(completed())
+    assert scheduler.avg_service_time < 3.0
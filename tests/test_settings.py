@@ -0,0 +1,21 @@
+from utils.settings import Settings
+
+
+def test_fractional_reset_hours_are_kept():
+    settings = Settings.from_dict({'reset_hours': 1.5, 'premium_reset_hours': '0.25'})
+    assert settings.reset_hours == 1.5
+    assert settings.premium_reset_hours == 0.25
+    assert settings.reset_hours_for(True) == 0.25
+
+
+def test_fields_are_coerced_by_declared_type():
+    settings = Settings.from_dict({'char_limit': '500', 'maintenance_mode': 'false', 'unknown': 1})
+    assert settings.char_limit == 500
+    assert settings.maintenance_mode is False
+    assert Settings.from_dict({'maintenance_mode': 'true'}).maintenance_mode is True
+
+
+def test_invalid_values_fall_back_to_defaults():
+    settings = Settings.from_dict({'request_limit': 'many', 'reset_hours': None})
+    assert settings.request_limit == Settings().request_limit
+    assert settings.reset_hours == Settings().reset_hours
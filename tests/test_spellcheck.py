@@ -0,0 +1,28 @@
+import os
+from utils.spellcheck import SpellChecker
+
+LEXICON = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'arabic_lexicon.txt')
+
+
+def test_taa_marbuta_is_fixed_before_accepting_a_clitic_stem():
+    checker = SpellChecker.from_file(LEXICON)
+    result = checker.check("هذه الرساله جميله")
+    assert result['status'] == 'fixed'
+    assert result['text'] == "هذه الرسالة جميلة"
+    assert ('جميله', 'جميلة') in result['fixes']
+
+
+def test_clitic_suffix_still_known_without_rule_variant():
+    checker = SpellChecker()
+    checker.add_word('كتاب')
+    assert checker.correct_token('كتابه') == (None, [])
+    assert checker.correct_token('كتابي') == (None, [])
+    assert checker.correct_token('وكتابهم') == (None, [])
+
+
+def test_text_that_is_not_mostly_arabic_goes_to_the_model():
+    checker = SpellChecker.from_file(LEXICON)
+    assert checker.check("i has a apple, he go to school yesterday")['status'] == 'suspicious'
+    assert checker.check("123")['status'] == 'suspicious'
+    # رقم داخل نص عربي لا يمنع الفحص المحلي
+    assert checker.check("عندي 3 كتب")['status'] == 'clean'
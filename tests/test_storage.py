@@ -0,0 +1,97 @@
+import asyncio
+import time
+from storage import prefetched
+from utils.usage_history import DAILY, HOURLY, add_fields, day_key, event_fields, hour_key
+
+
+def test_prefetched_reads_at_most_depth_pages_ahead():
+    produced = []
+    consumed = []
+
+    async def pages():
+        for index in range(20):
+            produced.append(index)
+            yield {str(index): {}}
+
+    async def main():
+        async for page in prefetched(pages(), depth=2):
+            # الصفحات المقروءة ولم تُعالج بعد: depth في الطابور + واحدة عند المنتج
+            assert len(produced) - len(consumed) <= 2 + 2
+            consumed.append(page)
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert len(consumed) == 20
+
+
+def test_prefetched_propagates_errors_and_closes_source():
+    closed = []
+
+    async def pages():
+        try:
+            yield {'1': {}}
+            raise RuntimeError("boom")
+        finally:
+            closed.append(True)
+
+    async def main():
+        seen = []
+        try:
+            async for page in prefetched(pages(), depth=1):
+                seen.append(page)
+        except RuntimeError as e:
+            return seen, str(e)
+
+    seen, error = asyncio.run(main())
+    assert seen == [{'1': {}}] and error == "boom" and closed
+
+
+def test_sql_register_usage_and_counts(sql_storage):
+    async def main():
+        await sql_storage.initialize_stats()
+        assert await sql_storage.register_user(1) is True
+        assert await sql_storage.register_user(1) is False
+        assert await sql_storage.set_premium_flag(1, True) is True
+        assert await sql_storage.set_premium_flag(1, True) is False
+
+        hourly = {}
+        add_fields(hourly, hour_key(time.time()), event_fields('correct', True))
+        await asyncio.gather(*(
+            sql_storage.apply_usage({1: {'count': 1, 'last_request': time.time()}}, 1, hourly) for _ in range(5)
+        ))
+        user = await sql_storage.get_user(1)
+        stats = await sql_storage.get_stats()
+        history = await sql_storage.get_usage_history(hours=1, days=1)
+        return user, stats, history
+
+    user, stats, history = asyncio.run(main())
+    assert user['request_count'] == 5 and user['is_premium'] is True
+    assert stats == {'total_users': 1, 'premium_users': 1, 'total_requests': 5}
+    assert history[HOURLY][hour_key(time.time())]['requests'] == 5
+    assert history[DAILY][day_key(time.time())]['mode_correct'] == 5
+
+
+def test_sql_iter_users_pages_in_key_order(sql_storage):
+    async def main():
+        await sql_storage.import_users({str(user_id): {'request_count': user_id} for user_id in range(1, 8)})
+        return [user_id async for user_id in sql_storage.iter_user_ids(page_size=3)]
+
+    assert asyncio.run(main()) == list(range(1, 8))
+
+
+def test_sql_prune_usage_history(sql_storage):
+    old = time.time() - 30 * 86400
+    hourly = {}
+    add_fields(hourly, hour_key(old), event_fields())
+    add_fields(hourly, hour_key(time.time()), event_fields())
+
+    async def main():
+        await sql_storage.apply_usage({}, 2, hourly)
+        deleted = await sql_storage.prune_usage_history()
+        return deleted, await sql_storage.get_usage_history(hours=24 * 40, days=40)
+
+    deleted, history = asyncio.run(main())
+    # حاوية الساعة القديمة فقط (أقدم من 7 أيام)؛ الحاويات اليومية تبقى سنة
+    assert deleted == len(event_fields())
+    assert list(history[HOURLY]) == [hour_key(time.time())]
+    assert day_key(old) in history[DAILY]
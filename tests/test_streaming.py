@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+
+pytest.importorskip("telegram")
+
+from utils.streaming import MAX_MESSAGE_LENGTH, StreamingMessage, split_message  # noqa: E402
+
+
+def test_split_message_respects_limit_and_line_breaks():
+    text = "\n".join(["سطر طويل " * 40] * 30)
+    parts = split_message(text)
+    assert len(parts) > 1
+    assert all(len(part) <= MAX_MESSAGE_LENGTH for part in parts)
+    assert "".join(parts).replace("\n", "") == text.replace("\n", "")
+
+
+def test_finalize_sends_overflow_as_follow_up_messages():
+    edits, sends = [], []
+
+    async def edit(text, **kwargs):
+        edits.append(text)
+
+    async def send(text, **kwargs):
+        sends.append(text)
+
+    text = "كلمة " * 2000
+    asyncio.run(StreamingMessage(edit, send_func=send).finalize(text))
+    assert len(edits) == 1 and sends
+    assert all(len(part) <= MAX_MESSAGE_LENGTH for part in edits + sends)
+
+
+def test_finalize_truncates_without_send_func():
+    edits = []
+
+    async def edit(text, **kwargs):
+        edits.append(text)
+
+    asyncio.run(StreamingMessage(edit).finalize("x" * 5000))
+    assert len(edits[0]) == MAX_MESSAGE_LENGTH and edits[0].endswith("…")
@@ -0,0 +1,48 @@
+import asyncio
+from utils.usage_buffer import UsageBuffer
+
+
+class RecordingStorage:
+    def __init__(self, fail=0):
+        self.writes = []
+        self.fail = fail
+
+    async def apply_usage(self, users, total, hourly):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("down")
+        self.writes.append((users, total, hourly))
+
+
+def test_flush_writes_all_pending_usage_once():
+    storage = RecordingStorage()
+    buffer = UsageBuffer(storage)
+
+    async def main():
+        buffer.record(1, 'correct', True)
+        buffer.record(1, 'correct', True)
+        buffer.record(2, 'paraphrase')
+        assert buffer.pending_count(1) == 2 and buffer.pending_today() == 3
+        await buffer.aclose()
+
+    asyncio.run(main())
+    assert len(storage.writes) == 1
+    users, total, hourly = storage.writes[0]
+    assert {user_id: pending['count'] for user_id, pending in users.items()} == {1: 2, 2: 1}
+    assert total == 3
+    bucket = next(iter(hourly.values()))
+    assert bucket == {'requests': 3, 'premium': 2, 'free': 1, 'mode_correct': 2, 'mode_paraphrase': 1}
+
+
+def test_failed_flush_keeps_usage_for_the_next_one():
+    storage = RecordingStorage(fail=1)
+    buffer = UsageBuffer(storage)
+
+    async def main():
+        buffer.record(1)
+        await buffer.flush()
+        assert buffer.pending_count(1) == 1 and not storage.writes
+        await buffer.aclose()
+
+    asyncio.run(main())
+    assert storage.writes[0][1] == 1 and buffer.stats['failed_flushes'] == 1
@@ -0,0 +1,47 @@
+import calendar
+from utils.usage_history import (
+    DAILY, HOURLY, add_fields, daily_rollup, day_key, event_fields, hour_key, retention_cutoffs, sparkline, summarize
+)
+
+NOON = calendar.timegm((2026, 10, 18, 12, 30, 0))
+
+
+def test_keys_are_utc_and_sort_chronologically():
+    assert hour_key(NOON) == '2026101812'
+    assert day_key(NOON) == '20261018'
+    assert hour_key(NOON - 13 * 3600) < hour_key(NOON)
+
+
+def test_daily_rollup_sums_hours_of_the_same_day():
+    hourly = {}
+    add_fields(hourly, hour_key(NOON), event_fields('correct', True))
+    add_fields(hourly, hour_key(NOON - 3600), event_fields('paraphrase', False))
+    add_fields(hourly, hour_key(NOON - 86400), event_fields('correct', False))
+
+    daily = daily_rollup(hourly)
+    assert daily['20261018'] == {'requests': 2, 'premium': 1, 'free': 1, 'mode_correct': 1, 'mode_paraphrase': 1}
+    assert daily['20261017'] == {'requests': 1, 'free': 1, 'mode_correct': 1}
+
+
+def test_retention_cutoffs():
+    assert retention_cutoffs(NOON, 7, 365) == (hour_key(NOON - 7 * 86400), day_key(NOON - 365 * 86400))
+
+
+def test_summarize_recent_hours_and_days():
+    history = {
+        HOURLY: {hour_key(NOON): {'requests': 3, 'premium': 1, 'free': 2, 'mode_correct': 3},
+                 hour_key(NOON - 30 * 3600): {'requests': 9, 'free': 9}},
+        DAILY: {day_key(NOON): {'requests': 3}, day_key(NOON - 2 * 86400): {'requests': 5}},
+    }
+    summary = summarize(history, now=NOON, hours=24, days=3)
+
+    assert summary['hourly'][-1] == 3 and sum(summary['hourly']) == 3
+    assert summary['tiers'] == {'premium': 1, 'free': 2}
+    assert summary['modes'] == {'correct': 3}
+    assert summary['daily'] == [('20261016', 5), ('20261017', 0), ('20261018', 3)]
+    assert summary['today'] == 3
+
+
+def test_sparkline():
+    assert sparkline([0, 0]) == '▁▁'
+    assert sparkline([0, 4, 8]) == '▁▅█'
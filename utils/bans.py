@@ -0,0 +1,71 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BanSet:
+    """نسخة في الذاكرة من عقدة banned_users للفحص بزمن ثابت قبل أي معالجة"""
+
+    def __init__(self):
+        self._banned = frozenset()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.stats = {'blocked': 0}
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._banned
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def replace(self, user_ids):
+        with self._lock:
+            self._banned = frozenset(int(user_id) for user_id in user_ids if str(user_id).lstrip('-').isdigit())
+
+    def add(self, user_id: int):
+        with self._lock:
+            self._banned = self._banned | {int(user_id)}
+
+    def discard(self, user_id: int):
+        with self._lock:
+            self._banned = self._banned - {int(user_id)}
+
+    def start(self, root_ref):
+        """الاستماع لعقدة banned_users؛ أول حدث يحمل القائمة كاملة (مرة واحدة لكل العملية)"""
+        if self._listener is not None:
+            return
+        try:
+            self._listener = root_ref.child('banned_users').listen(self._on_event)
+        except Exception as e:
+            logger.error(f"Error starting ban list listener: {str(e)}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _on_event(self, event):
+        path = event.path.strip('/')
+        if not path:
+            if event.event_type == 'put':
+                self.replace((event.data or {}).keys())
+                logger.info(f"Ban list loaded: {len(self)} users")
+                return
+            changes = event.data or {}
+        else:
+            # تغيير حقل داخل سجل الحظر (مثل reason) لا يغير حالة المستخدم إلا إذا حُذف السجل كله
+            if '/' in path:
+                return
+            changes = {path: event.data}
+
+        for user_id, value in changes.items():
+            if not user_id.lstrip('-').isdigit():
+                continue
+            if value is None:
+                self.discard(int(user_id))
+            else:
+                self.add(int(user_id))
+
+
+banned_users = BanSet()
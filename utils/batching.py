@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import re
+import time
+from config import Config
+from utils.openrouter import query_openrouter_async
+from utils.prompts import build_batch_prompt, build_prompt
+
+logger = logging.getLogger(__name__)
+
+_ITEM_MARKER_RE = re.compile(r'^\s*\[(\d+)\]\s*', re.MULTILINE)
+
+
+def parse_batch_response(response: str, count: int) -> list:
+    """تقسيم رد الدفعة حسب الترقيم، وإرجاع None إذا لم يطابق عدد النصوص"""
+    markers = list(_ITEM_MARKER_RE.finditer(response))
+    if [int(m.group(1)) for m in markers] != list(range(1, count + 1)):
+        return None
+
+    results = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(response)
+        item = response[marker.end():end].strip()
+        if not item:
+            return None
+        results.append(item)
+    return results
+
+
+class MicroBatcher:
+    """تجميع طلبات النصوص القصيرة من عدة مستخدمين في طلب OpenRouter واحد"""
+
+    def __init__(self, max_items: int = None, window_ms: int = None):
+        self.max_items = max_items or Config.BATCH_MAX_ITEMS
+        self.window = (window_ms or Config.BATCH_WINDOW_MS) / 1000
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+        self.stats = {
+            'batches': 0,
+            'batched_items': 0,
+            'fallbacks': 0,
+            'queue_wait_total': 0.0,
+            'batch_latency_total': 0.0
+        }
+
+    def accepts(self, mode: str, text: str) -> bool:
+        return Config.BATCH_ENABLED and mode in Config.BATCH_MODES and len(text) <= Config.BATCH_MAX_CHARS
+
+    async def submit(self, mode: str, text: str) -> str:
+        """إضافة نص إلى الدفعة الحالية وانتظار نتيجته"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.setdefault(mode, [])
+        queue.append((text, future, time.monotonic()))
+
+        if len(queue) >= self.max_items:
+            self._flush(mode)
+        elif mode not in self._timers:
+            self._timers[mode] = loop.call_later(self.window, self._flush, mode)
+
+        return await asyncio.shield(future)
+
+    def _flush(self, mode: str):
+        timer = self._timers.pop(mode, None)
+        if timer:
+            timer.cancel()
+        items = self._pending.pop(mode, [])
+        if items:
+            task = asyncio.create_task(self._send(mode, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, mode: str, items: list):
+        started = time.monotonic()
+        self.stats['queue_wait_total'] += sum(started - enqueued for _, _, enqueued in items)
+
+        results = None
+        if len(items) > 1:
+            try:
+                response = await query_openrouter_async(build_batch_prompt(mode, [text for text, _, _ in items]))
+                results = parse_batch_response(response, len(items))
+                if results is None:
+                    logger.warning(f"Could not split batch response for {len(items)} items, falling back")
+            except Exception as e:
+                logger.error(f"Batch request failed: {str(e)}")
+
+        if results is None:
+            if len(items) > 1:
+                self.stats['fallbacks'] += 1
+            await asyncio.gather(*(self._send_single(mode, text, future) for text, future, _ in items))
+        else:
+            for (_, future, _), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+        self.stats['batches'] += 1
+        self.stats['batched_items'] += len(items)
+        self.stats['batch_latency_total'] += time.monotonic() - started
+
+    @staticmethod
+    async def _send_single(mode: str, text: str, future: asyncio.Future):
+        try:
+            result = await query_openrouter_async(build_prompt(mode, text))
+            if not future.done():
+                future.set_result(result)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+
+    def get_stats(self) -> dict:
+        """متوسط حجم الدفعة والتأخير المضاف لقياس المفاضلة بين الزمن والإنتاجية"""
+        batches = self.stats['batches']
+        items = self.stats['batched_items']
+        return {
+            **self.stats,
+            'avg_batch_size': items / batches if batches else 0.0,
+            'avg_queue_wait_ms': self.stats['queue_wait_total'] / items * 1000 if items else 0.0,
+            'avg_batch_latency_ms': self.stats['batch_latency_total'] / batches * 1000 if batches else 0.0
+        }
+
+
+micro_batcher = MicroBatcher()
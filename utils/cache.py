@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from cachetools import TTLCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# التشكيل وعلامات القرآن والتطويل
+_TASHKEEL_RE = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_LETTER_MAP = str.maketrans({
+    '\u0623': '\u0627', '\u0625': '\u0627', '\u0622': '\u0627', '\u0671': '\u0627',  # أ إ آ ٱ → ا
+    '\u0649': '\u064A', '\u06CC': '\u064A',  # ى ی → ي
+    '\u0629': '\u0647'  # ة → ه
+})
+
+
+def normalize_arabic(text: str) -> str:
+    """تطبيع النص العربي لاستخدامه كمفتاح كاش"""
+    text = _TASHKEEL_RE.sub('', text)
+    text = text.translate(_LETTER_MAP)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class ResultCache:
+    """كاش نتائج على مستويين: ذاكرة (LRU + TTL) وقرص (SQLite) يبقى بعد إعادة التشغيل"""
+
+    def __init__(self, max_entries: int = None, ttl: int = None, disk_path: str = None,
+                 disk_ttl: int = None):
+        self.memory = TTLCache(
+            maxsize=max_entries or Config.CACHE_MAX_ENTRIES,
+            ttl=ttl or Config.CACHE_TTL
+        )
+        self.disk_path = disk_path if disk_path is not None else Config.CACHE_DB_PATH
+        self.disk_ttl = disk_ttl or Config.CACHE_DISK_TTL
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(mode: str, model: str, text: str) -> str:
+        raw = f"{mode}\x00{model}\x00{normalize_arabic(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _disk_get(self, key: str):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def _disk_set(self, key: str, value: str):
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.disk_ttl)
+            )
+            conn.commit()
+
+    def purge_expired(self) -> int:
+        """حذف النتائج المنتهية من القرص"""
+        with self._lock:
+            conn = self._get_conn()
+            deleted = conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.commit()
+        return deleted
+
+    def disk_size(self) -> int:
+        with self._lock:
+            return self._get_conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    async def get(self, mode: str, model: str, text: str):
+        """البحث في الذاكرة ثم القرص، وإرجاع None عند عدم الوجود"""
+        if not Config.CACHE_ENABLED:
+            return None
+
+        key = self.make_key(mode, model, text)
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats['memory_hits'] += 1
+            return value
+
+        if self.disk_path:
+            try:
+                value = await asyncio.to_thread(self._disk_get, key)
+            except Exception as e:
+                logger.error(f"Error reading disk cache: {str(e)}")
+                value = None
+            if value is not None:
+                self.stats['disk_hits'] += 1
+                self.memory[key] = value
+                return value
+
+        self.stats['misses'] += 1
+        return None
+
+    async def set(self, mode: str, model: str, text: str, value: str):
+        """حفظ النتيجة في المستويين"""
+        if not Config.CACHE_ENABLED:
+            return
+
+        key = self.make_key(mode, model, text)
+        self.memory[key] = value
+        self.stats['writes'] += 1
+        if self.disk_path:
+            try:
+                await asyncio.to_thread(self._disk_set, key, value)
+            except Exception as e:
+                logger.error(f"Error writing disk cache: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """عدادات الإصابة والإخفاق لعرضها للمشرفين"""
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        lookups = hits + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_size': len(self.memory)
+        }
+
+
+result_cache = ResultCache()
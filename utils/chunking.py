@@ -0,0 +1,51 @@
+import re
+
+# حدود الجمل: بعد علامات الترقيم العربية واللاتينية، وأي سطر جديد (مع المسافات المحيطة)
+_BOUNDARY_RE = re.compile(r'(\s*\n\s*|(?<=[.!?؟،])\s+)')
+
+
+def split_into_chunks(text: str, max_chars: int) -> tuple:
+    """تقسيم النص على حدود الجمل والفقرات إلى أجزاء لا تتجاوز max_chars تقريباً
+
+    تُرجع (chunks, gaps) حيث gaps[i] هو الفاصل الأصلي قبل الجزء i و gaps[-1] ما بعد آخر جزء،
+    بحيث يعيد reassemble النص بنفس المسافات وفواصل الأسطر.
+    """
+    stripped = text.strip()
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):] if stripped else ""
+    if not stripped:
+        return [], [text]
+
+    pieces = _BOUNDARY_RE.split(stripped)
+    sentences = pieces[0::2]
+    separators = pieces[1::2]
+
+    chunks = []
+    gaps = [leading]
+    current = sentences[0]
+    for separator, sentence in zip(separators, sentences[1:]):
+        too_long = len(current) + len(separator) + len(sentence) > max_chars
+        # نفضل القطع عند الفقرات إذا امتلأ الجزء الحالي إلى النصف
+        paragraph_break = '\n' in separator and len(current) >= max_chars // 2
+        if too_long or paragraph_break:
+            chunks.append(current)
+            gaps.append(separator)
+            current = sentence
+        else:
+            current += separator + sentence
+    chunks.append(current)
+    gaps.append(trailing)
+    return chunks, gaps
+
+
+def split_sentences(text: str) -> tuple:
+    """جملة في كل جزء، مع نفس صيغة الفواصل في split_into_chunks"""
+    return split_into_chunks(text, 0)
+
+
+def reassemble(outputs: list, gaps: list) -> str:
+    """إعادة تجميع نتائج الأجزاء بالترتيب مع الفواصل الأصلية"""
+    result = gaps[0]
+    for output, gap in zip(outputs, gaps[1:]):
+        result += output.strip() + gap
+    return result
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from config import Config
+from utils.key_validation import hash_api_key
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamBusyError(Exception):
+    """OpenRouter مشغول أو يرفض طلباتنا حالياً؛ يجب المحاولة بعد retry_after ثانية"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream busy, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(response: httpx.Response) -> float:
+    """قراءة ترويسة Retry-After (ثوانٍ أو تاريخ HTTP)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_overload_error(error: Exception) -> bool:
+    """أخطاء تدل على ضغط على المفتاح (429، انتهاء المهلة)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429
+    return isinstance(error, httpx.TimeoutException)
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """أخطاء المزود التي تخفض حد التزامن وتُحتسب على قاطع الدائرة (الضغط مع 5xx)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or is_overload_error(error)
+    return is_overload_error(error)
+
+
+class Circuit:
+    """قاطع دائرة لنموذج واحد على مفتاح واحد، حتى لا يمنع فتحه التحويل لنموذج بديل"""
+
+    def __init__(self, name: str, stats: dict):
+        self.name = name
+        self.stats = stats
+        self.state = 'closed'
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_inflight = False
+
+    def check(self, probe: bool = True):
+        now = time.monotonic()
+        if self.state == 'open':
+            if now < self.open_until:
+                self.stats['rejected'] += 1
+                raise UpstreamBusyError(self.open_until - now)
+            self.state = 'half_open'
+        if self.state == 'half_open' and probe:
+            # طلب تجريبي واحد فقط حتى نتأكد من تعافي المزود
+            if self.probe_inflight:
+                self.stats['rejected'] += 1
+                raise UpstreamBusyError(Config.CIRCUIT_PROBE_RETRY)
+            self.probe_inflight = True
+
+    def open(self, seconds: float):
+        self.state = 'open'
+        self.open_until = max(self.open_until, time.monotonic() + seconds)
+        self.stats['opened'] += 1
+        logger.warning(f"Circuit for {self.name} opened for {seconds:.0f}s")
+
+    def on_success(self):
+        self.failures = 0
+        if self.state != 'closed':
+            logger.info(f"Circuit for {self.name} closed")
+            self.state = 'closed'
+
+    def on_failure(self, retry_after: float = None):
+        self.failures += 1
+        if retry_after:
+            self.open(retry_after)
+        elif self.state == 'half_open' or self.failures >= Config.CIRCUIT_FAILURE_THRESHOLD:
+            self.open(Config.CIRCUIT_COOLDOWN)
+
+    def open_for(self) -> float:
+        return max(0.0, self.open_until - time.monotonic()) if self.state == 'open' else 0.0
+
+
+class UpstreamGuard:
+    """حد تزامن متكيف (AIMD) ودلو معدل لمفتاح API واحد، مع قاطع دائرة لكل نموذج عليه"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = float(Config.ADAPTIVE_INITIAL_LIMIT)
+        self.inflight = 0
+        self.latency_baseline = None
+        self.stats = {'success': 0, 'overload': 0, 'errors': 0, 'rejected': 0, 'opened': 0, 'throttled': 0}
+        # قاطع المفتاح كله (نفاد الرصيد) وقاطع لكل نموذج (أخطاء المزود)
+        self.circuit = Circuit(name, self.stats)
+        self.circuits = {}
+        self._condition = None
+        # حد معدل المفتاح كما يعلنه /auth/key (دلو رموز)
+        self.rate = None
+        self.capacity = 0.0
+        self.tokens = 0.0
+        self._tokens_at = time.monotonic()
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def circuit_for(self, model: str = None) -> Circuit:
+        if model is None:
+            return self.circuit
+        circuit = self.circuits.get(model)
+        if circuit is None:
+            circuit = self.circuits[model] = Circuit(f"{self.name}/{model}", self.stats)
+        return circuit
+
+    def apply_key_info(self, info: dict):
+        """تطبيق بيانات المفتاح: حد المعدل والرصيد المتبقي"""
+        if not info.get('valid'):
+            return
+        requests = info.get('rate_limit_requests')
+        interval = info.get('rate_limit_interval')
+        if requests and interval:
+            rate = requests / interval
+            if self.rate is None:
+                self.tokens = float(requests)
+            self.rate = rate
+            self.capacity = float(requests)
+        remaining = info.get('limit_remaining')
+        if remaining is not None and remaining <= 0:
+            # الرصيد نفد: لا فائدة من الإرسال لأي نموذج حتى إعادة التحقق
+            self.circuit.open(Config.KEY_REFRESH_MARGIN)
+
+    async def _take_token(self):
+        """انتظار رمز من دلو المعدل، أو رفض سريع إذا طال الانتظار"""
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._tokens_at) * self.rate)
+        self._tokens_at = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return
+        wait = -self.tokens / self.rate
+        if wait > Config.ADAPTIVE_QUEUE_TIMEOUT:
+            self.tokens += 1
+            self.stats['rejected'] += 1
+            raise UpstreamBusyError(wait)
+        self.stats['throttled'] += 1
+        await asyncio.sleep(wait)
+
+    async def _acquire(self, circuit: Circuit):
+        if circuit is not self.circuit:
+            # نفاد الرصيد يوقف كل النماذج على المفتاح؛ نجاح أي نموذج بعد المهلة يغلقه
+            self.circuit.check(probe=False)
+        circuit.check()
+        try:
+            await self._take_token()
+        except BaseException:
+            circuit.probe_inflight = False
+            raise
+        condition = self._get_condition()
+        try:
+            async with condition:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self.inflight < max(1, int(self.limit))),
+                    Config.ADAPTIVE_QUEUE_TIMEOUT
+                )
+                self.inflight += 1
+        except asyncio.TimeoutError:
+            circuit.probe_inflight = False
+            self.stats['rejected'] += 1
+            raise UpstreamBusyError(Config.CIRCUIT_PROBE_RETRY)
+        except BaseException:
+            circuit.probe_inflight = False
+            raise
+
+    async def _release(self, circuit: Circuit, error: Exception = None, latency: float = None):
+        self.inflight -= 1
+        circuit.probe_inflight = False
+        if error is not None:
+            if is_upstream_failure(error):
+                self._on_failure(circuit, error)
+        elif latency is not None:
+            self._on_success(circuit, latency)
+
+        condition = self._get_condition()
+        async with condition:
+            condition.notify_all()
+
+    def _on_success(self, circuit: Circuit, latency: float):
+        self.stats['success'] += 1
+        circuit.on_success()
+        self.circuit.on_success()
+
+        if self.latency_baseline is None:
+            self.latency_baseline = latency
+        if latency > self.latency_baseline * Config.ADAPTIVE_LATENCY_FACTOR:
+            # ارتفاع مفاجئ في الزمن: تخفيض طفيف قبل أن تصل أخطاء 429
+            self.limit = max(Config.ADAPTIVE_MIN_LIMIT, self.limit * 0.9)
+        else:
+            # زيادة خطية: +1 تقريباً لكل دورة كاملة من الطلبات
+            self.limit = min(Config.ADAPTIVE_MAX_LIMIT, self.limit + 1 / self.limit)
+        self.latency_baseline = 0.9 * self.latency_baseline + 0.1 * latency
+
+    def _on_failure(self, circuit: Circuit, error: Exception):
+        # تخفيض مضاعف عند 429 وانتهاء المهلة و5xx؛ الإحصاء يفصل الضغط عن أخطاء المزود
+        self.stats['overload' if is_overload_error(error) else 'errors'] += 1
+        self.limit = max(Config.ADAPTIVE_MIN_LIMIT, self.limit / 2)
+
+        retry_after = None
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = parse_retry_after(error.response)
+        circuit.on_failure(retry_after)
+
+    async def call(self, factory, model: str = None):
+        """تنفيذ factory() -> coroutine تحت حماية هذا المفتاح وقاطع النموذج model"""
+        circuit = self.circuit_for(model)
+        await self._acquire(circuit)
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except Exception as e:
+            await self._release(circuit, error=e)
+            raise
+        except BaseException:
+            # الإلغاء (مثل خسارة سباق التحوط) لا يُحتسب نجاحاً ولا فشلاً
+            await asyncio.shield(self._release(circuit))
+            raise
+        await self._release(circuit, latency=time.monotonic() - started)
+        return result
+
+    async def stream(self, factory, model: str = None):
+        """تمرير أجزاء factory() -> async generator تحت حماية هذا المفتاح وقاطع النموذج model"""
+        circuit = self.circuit_for(model)
+        await self._acquire(circuit)
+        started = time.monotonic()
+        first_token = None
+        try:
+            async for delta in factory():
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                yield delta
+        except Exception as e:
+            await self._release(circuit, error=e)
+            raise
+        except BaseException:
+            await asyncio.shield(self._release(circuit))
+            raise
+        await self._release(circuit, latency=first_token if first_token is not None else time.monotonic() - started)
+
+    def get_stats(self) -> dict:
+        """الحالة المعروضة هي الأسوأ بين قاطع المفتاح وقواطع نماذجه"""
+        severity = {'closed': 0, 'half_open': 1, 'open': 2}
+        circuits = [self.circuit, *self.circuits.values()]
+        return {
+            **self.stats,
+            'state': max((circuit.state for circuit in circuits), key=severity.get),
+            'limit': self.limit,
+            'inflight': self.inflight,
+            'open_for': max(circuit.open_for() for circuit in circuits),
+            'circuits': {name: circuit.state for name, circuit in self.circuits.items()}
+        }
+
+
+class GuardRegistry:
+    """حالة مستقلة للمفتاح المشترك ولكل مفتاح API شخصي"""
+
+    def __init__(self):
+        self._guards = {}
+
+    def for_key(self, api_key: str = None) -> UpstreamGuard:
+        if api_key:
+            name = "key:" + hash_api_key(api_key)[:12]
+        else:
+            name = "shared"
+        guard = self._guards.get(name)
+        if guard is None:
+            guard = self._guards[name] = UpstreamGuard(name)
+        return guard
+
+    def items(self):
+        return self._guards.items()
+
+
+upstream_guards = GuardRegistry()
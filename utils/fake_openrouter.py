@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+
+# خادم محلي يحاكي OpenRouter لاختبارات الحمل وقياس زمن الاستجابة دون استهلاك رصيد أو شبكة.
+# لا يعتمد على Config ولا على حزم خارجية. التشغيل:
+#   python -m utils.fake_openrouter --port 8089 --profile realistic
+# ثم توجيه البوت إليه: OPENROUTER_BASE_URL=http://127.0.0.1:8089/api/v1
+# أو قياس العميل نفسه مقابله: python -m utils.loadtest --profile fast
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/v1"
+
+# "تصحيحات" ثابتة حتى تكون الردود حتمية وقابلة للمقارنة بين التشغيلات
+ECHO_FIXES = {
+    'الى': 'إلى',
+    'انا': 'أنا',
+    'انت': 'أنت',
+    'هذة': 'هذه',
+    'ان': 'أن',
+    'الذى': 'الذي',
+    'فى': 'في',
+    'مدرسه': 'مدرسة',
+    'المدرسه': 'المدرسة',
+}
+_ARABIC_WORD_RE = re.compile(r'[ء-ي]+')
+_BATCH_ITEM_RE = re.compile(r'^\[(\d+)\]\s?', re.MULTILINE)
+
+
+class Profile:
+    """ملف زمن الاستجابة والأخطاء للخادم الوهمي"""
+
+    def __init__(self, ttft_median_ms: float = 300, ttft_sigma: float = 0.5,
+                 tokens_per_second: float = 60, chars_per_token: int = 3,
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, retry_after: float = None,
+                 stream_error_rate: float = 0.0):
+        # زمن أول رمز: توزيع لوغاريتمي طبيعي (الذيل الطويل كما في المزودين الحقيقيين)
+        self.ttft_median_ms = ttft_median_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = chars_per_token
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        # انقطاع الرد المتدفق في منتصفه برسالة خطأ
+        self.stream_error_rate = stream_error_rate
+
+    def sample_ttft(self, rng: random.Random) -> float:
+        return rng.lognormvariate(math.log(self.ttft_median_ms / 1000), self.ttft_sigma)
+
+
+PROFILES = {
+    'instant': Profile(ttft_median_ms=1, ttft_sigma=0, tokens_per_second=0),
+    'fast': Profile(ttft_median_ms=80, ttft_sigma=0.2, tokens_per_second=300),
+    'realistic': Profile(ttft_median_ms=600, ttft_sigma=0.6, tokens_per_second=50),
+    'slow_tail': Profile(ttft_median_ms=500, ttft_sigma=1.2, tokens_per_second=40),
+    'flaky': Profile(ttft_median_ms=400, ttft_sigma=0.6, tokens_per_second=50,
+                     rate_5xx=0.1, stream_error_rate=0.05),
+    'overloaded': Profile(ttft_median_ms=900, ttft_sigma=0.8, tokens_per_second=30,
+                          rate_429=0.3, rate_5xx=0.05, retry_after=2),
+}
+
+
+def echo_correct(text: str) -> str:
+    """تصحيح حتمي بسيط: استبدال كلمات معروفة فقط"""
+    return _ARABIC_WORD_RE.sub(lambda m: ECHO_FIXES.get(m.group(0), m.group(0)), text)
+
+
+def extract_reply(prompt: str) -> str:
+    """استخراج النص من أوامر utils.prompts وإرجاع "تصحيحه" بنفس الصيغة المتوقعة"""
+    items = list(_BATCH_ITEM_RE.finditer(prompt))
+    if items:
+        replies = []
+        for i, item in enumerate(items):
+            end = items[i + 1].start() if i + 1 < len(items) else len(prompt)
+            replies.append(f"[{item.group(1)}] {echo_correct(prompt[item.end():end].strip())}")
+        return "\n".join(replies)
+
+    # الأمر المفرد: سطر تعليمات ثم النص ثم سطر أخير، مفصولة بأسطر فارغة
+    parts = prompt.split("\n\n")
+    text = "\n\n".join(parts[1:-1]) if len(parts) >= 3 else prompt
+    return echo_correct(text)
+
+
+def split_tokens(text: str, chars_per_token: int) -> list:
+    size = max(1, chars_per_token)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeOpenRouter:
+    """خادم HTTP/1.1 بسيط (keep-alive) لمسارات /chat/completions و /auth/key"""
+
+    def __init__(self, profile: Profile = None, seed: int = None, revoked_keys=(),
+                 key_rate_limit: int = 100, key_interval: str = "10s", key_credit: float = None):
+        self.profile = profile or PROFILES['fast']
+        self.rng = random.Random(seed)
+        self.revoked_keys = set(revoked_keys)
+        self.key_rate_limit = key_rate_limit
+        self.key_interval = key_interval
+        self.key_credit = key_credit
+        self._server = None
+        self.stats = {'connections': 0, 'requests': 0, 'streamed': 0, '429': 0, '5xx': 0, 'stream_errors': 0, 'auth_errors': 0}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """بدء الخادم وإرجاع عنوان API الأساسي (المنفذ 0 = منفذ عشوائي)"""
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # ------------------- HTTP -------------------
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                await self._dispatch(method, path.split('?')[0], headers, body, writer)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, status: int, payload: dict, extra_headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Content-Length': str(len(body)), **(extra_headers or {})}
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Status')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _send_chunk(writer, data: str):
+        encoded = data.encode('utf-8')
+        writer.write(f"{len(encoded):x}\r\n".encode('latin-1') + encoded + b"\r\n")
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, headers: dict, body: bytes, writer):
+        api_key = headers.get('authorization', '').removeprefix('Bearer ').strip()
+        if path == f"{API_PREFIX}/auth/key" and method == 'GET':
+            await self._auth_key(api_key, writer)
+        elif path == f"{API_PREFIX}/chat/completions" and method == 'POST':
+            await self._chat(api_key, body, writer)
+        else:
+            await self._send(writer, 404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    # ------------------- المسارات -------------------
+    async def _auth_key(self, api_key: str, writer):
+        if not api_key or api_key in self.revoked_keys:
+            self.stats['auth_errors'] += 1
+            await self._send(writer, 401, {'error': {'code': 401, 'message': 'Invalid API key'}})
+            return
+        await self._send(writer, 200, {'data': {
+            'label': f"fake-{api_key[-4:]}",
+            'usage': 0,
+            'limit': self.key_credit,
+            'limit_remaining': self.key_credit,
+            'is_free_tier': False,
+            'rate_limit': {'requests': self.key_rate_limit, 'interval': self.key_interval}
+        }})
+
+    async def _chat(self, api_key: str, body: bytes, writer):
+        self.stats['requests'] += 1
+        if not api_key or api_key in self.revoked_keys:
+            self.stats['auth_errors'] += 1
+            await self._send(writer, 401, {'error': {'code': 401, 'message': 'Invalid API key'}})
+            return
+        try:
+            request = json.loads(body or b'{}')
+            prompt = request['messages'][-1]['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            await self._send(writer, 400, {'error': {'code': 400, 'message': 'Invalid request body'}})
+            return
+
+        profile = self.profile
+        ttft = profile.sample_ttft(self.rng)
+        roll = self.rng.random()
+        if roll < profile.rate_429:
+            self.stats['429'] += 1
+            await asyncio.sleep(ttft / 10)
+            extra = {'Retry-After': f"{profile.retry_after:g}"} if profile.retry_after else None
+            await self._send(writer, 429, {'error': {'code': 429, 'message': 'Rate limit exceeded'}}, extra)
+            return
+        if roll < profile.rate_429 + profile.rate_5xx:
+            self.stats['5xx'] += 1
+            await asyncio.sleep(ttft)
+            await self._send(writer, 502, {'error': {'code': 502, 'message': 'Provider returned error'}})
+            return
+
+        model = request.get('model', 'fake/model')
+        reply = extract_reply(prompt)
+        tokens = split_tokens(reply, profile.chars_per_token)
+        token_delay = 1 / profile.tokens_per_second if profile.tokens_per_second else 0
+        completion_id = f"gen-{uuid.uuid4().hex[:16]}"
+
+        if not request.get('stream'):
+            await asyncio.sleep(ttft + token_delay * len(tokens))
+            await self._send(writer, 200, {
+                'id': completion_id,
+                'model': model,
+                'created': int(time.time()),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(prompt) // profile.chars_per_token, 'completion_tokens': len(tokens)}
+            })
+            return
+
+        self.stats['streamed'] += 1
+        head = (
+            "HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            "Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1'))
+        # تعليق المعالجة كما يرسله OpenRouter أثناء انتظار المزود
+        await self._send_chunk(writer, ": OPENROUTER PROCESSING\n\n")
+        await asyncio.sleep(ttft)
+
+        fail_at = len(tokens) // 2 if self.rng.random() < profile.stream_error_rate else None
+        for i, token in enumerate(tokens):
+            if i == fail_at:
+                self.stats['stream_errors'] += 1
+                error = {'error': {'code': 502, 'message': 'Provider disconnected'}}
+                await self._send_chunk(writer, f"data: {json.dumps(error)}\n\n")
+                break
+            chunk = {'id': completion_id, 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            await self._send_chunk(writer, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        await self._send_chunk(writer, "data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+            429: 'Too Many Requests', 502: 'Bad Gateway'}
+
+
+async def _serve(args):
+    profile = PROFILES[args.profile]
+    for name in ('rate_429', 'rate_5xx', 'retry_after', 'tokens_per_second', 'stream_error_rate'):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(profile, name, value)
+    if args.ttft_ms is not None:
+        profile.ttft_median_ms = args.ttft_ms
+
+    server = FakeOpenRouter(profile, seed=args.seed, revoked_keys=args.revoked)
+    base_url = await server.start(args.host, args.port)
+    print(f"Fake OpenRouter ({args.profile}) listening on {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(f"Stats: {server.stats}")
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenRouter stand-in for load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='realistic')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--ttft-ms', type=float, default=None)
+    parser.add_argument('--tokens-per-second', type=float, default=None)
+    parser.add_argument('--rate-429', type=float, default=None)
+    parser.add_argument('--rate-5xx', type=float, default=None)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--stream-error-rate', type=float, default=None)
+    parser.add_argument('--revoked', nargs='*', default=[], help="API keys answered with 401")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,164 @@
+import asyncio
+import bisect
+import logging
+import time
+import httpx
+from config import Config
+from utils.circuit_breaker import UpstreamBusyError
+
+logger = logging.getLogger(__name__)
+
+# حدود خانات المدرج بالثواني (تصاعد أسي تقريباً)
+_BUCKETS = [0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 45, 60, 90, 120]
+
+
+class LatencyHistogram:
+    """مدرج زمن الاستجابة لنموذج واحد"""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKETS) + 1)
+        self.total = 0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(_BUCKETS, seconds)] += 1
+        self.total += 1
+
+    def percentile(self, p: float) -> float:
+        """الحد الأعلى للخانة التي تحتوي النسبة المئوية p"""
+        if not self.total:
+            return 0.0
+        target = self.total * p / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return _BUCKETS[index] if index < len(_BUCKETS) else _BUCKETS[-1]
+        return _BUCKETS[-1]
+
+
+def is_failover_error(error: Exception) -> bool:
+    """أخطاء المزود التي تستحق التحويل الفوري لنموذج آخر (429، 5xx، انتهاء المهلة، الشبكة، قاطع مفتوح)"""
+    if isinstance(error, UpstreamBusyError):
+        # قاطع النموذج مفتوح أو حد المفتاح ممتلئ: النموذج البديل له قاطعه الخاص
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+# أنواع الزمن المقاس: الرد كاملاً (chat) أو أول جزء من الرد المتدفق (stream)
+CHAT = 'chat'
+STREAM = 'stream'
+
+
+class HedgePolicy:
+    """سياسة الطلبات الاحتياطية: مهلة مشتقة من مدرج زمن كل نموذج ثم طلب ثانٍ لنموذج بديل
+
+    لكل (نموذج، نوع) مدرج مستقل لأن زمن الرد الكامل أطول بكثير من زمن أول جزء متدفق.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.stats = {'hedges': 0, 'hedge_wins': 0, 'failovers': 0}
+
+    def models(self, primary: str = None) -> list:
+        primary = primary or Config.OPENROUTER_MODEL
+        # بدون نماذج بديلة يُعاد الطلب لنفس النموذج (قد يوجهه OpenRouter لمزود آخر)
+        fallbacks = [m for m in Config.OPENROUTER_FALLBACK_MODELS if m != primary] or [primary]
+        return [primary] + fallbacks
+
+    def record(self, model: str, seconds: float, kind: str = CHAT):
+        self.histograms.setdefault((model, kind), LatencyHistogram()).record(seconds)
+
+    def deadline(self, model: str, kind: str = CHAT) -> float:
+        """المهلة قبل إرسال الطلب الاحتياطي"""
+        histogram = self.histograms.get((model, kind))
+        if not histogram or histogram.total < Config.HEDGE_MIN_SAMPLES:
+            return Config.HEDGE_DEFAULT_DELAY
+        delay = histogram.percentile(Config.HEDGE_PERCENTILE)
+        return min(max(delay, Config.HEDGE_MIN_DELAY), Config.HEDGE_MAX_DELAY)
+
+    async def _race(self, start_attempt, models: list, kind: str):
+        """تشغيل المحاولات بالتتابع مع التحوط، وإرجاع (النموذج، النتيجة) لأول محاولة ناجحة"""
+        pending = {}
+        remaining = list(models)
+        last_error = None
+
+        def launch():
+            model = remaining.pop(0)
+            task = asyncio.create_task(start_attempt(model))
+            pending[task] = (model, time.monotonic())
+            return model
+
+        launch()
+        try:
+            while pending:
+                current_model = list(pending.values())[-1][0]
+                timeout = self.deadline(current_model, kind) if Config.HEDGE_ENABLED and remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # تجاوز المهلة: طلب احتياطي يتسابق مع الأصلي
+                    model = launch()
+                    self.stats['hedges'] += 1
+                    logger.info(f"Hedging request to {model} after {timeout:.1f}s")
+                    continue
+
+                for task in done:
+                    model, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.record(model, time.monotonic() - started, kind)
+                        if model != models[0]:
+                            self.stats['hedge_wins'] += 1
+                        return model, task.result()
+
+                    last_error = error
+                    if not is_failover_error(error):
+                        raise error
+                    logger.warning(f"OpenRouter model {model} failed: {str(error)}")
+                    if remaining:
+                        self.stats['failovers'] += 1
+                        launch()
+
+            raise last_error
+        finally:
+            # إلغاء المحاولات الخاسرة وانتظار انتهائها لتحرير اتصالاتها
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def chat(self, call, primary: str = None) -> str:
+        """call(model) -> coroutine تعيد النص الكامل"""
+        _, result = await self._race(call, self.models(primary), CHAT)
+        return result
+
+    async def stream(self, open_stream, primary: str = None):
+        """open_stream(model) -> async generator؛ الفائز هو أول من يرسل جزءاً من النص"""
+        streams = []
+
+        async def first_delta(model):
+            stream = open_stream(model)
+            streams.append(stream)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, ""
+
+        winner = None
+        try:
+            _, (winner, delta) = await self._race(first_delta, self.models(primary), STREAM)
+        finally:
+            for stream in streams:
+                if stream is not winner:
+                    await stream.aclose()
+
+        if delta:
+            yield delta
+        async for delta in winner:
+            yield delta
+
+
+hedge_policy = HedgePolicy()
@@ -0,0 +1,85 @@
+import difflib
+import logging
+from cachetools import TTLCache
+from config import Config
+from utils.chunking import split_sentences
+
+logger = logging.getLogger(__name__)
+
+
+# الأوضاع التي تصحح كل جملة في مكانها؛ إعادة الصياغة تدمج الجمل وتعيد ترتيبها فلا يُربط ناتجها بأصلها
+MEMO_MODES = ('correct', 'spelling')
+
+
+def aligned(sentences: list, outputs: list) -> bool:
+    """هل الناتج جملة بجملة تصحيح للنص؟ نفس العدد وكل زوج متشابه (دمج جملتين وفصل أخرى يُبقي العدد)"""
+    if len(sentences) != len(outputs):
+        return False
+    return all(
+        difflib.SequenceMatcher(None, sentence, output, autojunk=False).ratio() >= Config.MEMO_MIN_SIMILARITY
+        for sentence, output in zip(sentences, outputs)
+    )
+
+
+class SentenceMemo:
+    """آخر نص عالجه كل مستخدم مع ناتج كل جملة فيه، لإعادة إرسال الجمل المعدلة فقط"""
+
+    def __init__(self, max_users: int = None, ttl: int = None):
+        self._memo = TTLCache(maxsize=max_users or Config.MEMO_MAX_USERS, ttl=ttl or Config.MEMO_TTL)
+        self.stats = {'reused': 0, 'sent': 0}
+
+    def remember(self, user_id: int, mode: str, text: str, result: str):
+        """حفظ نواتج الجمل إذا قابلت كل جملة ناتجاً يشبهها بنفس الترتيب"""
+        if mode not in MEMO_MODES:
+            return
+        sentences, _ = split_sentences(text)
+        outputs, _ = split_sentences(result)
+        if not aligned(sentences, outputs):
+            # لا يمكن ربط الناتج بالجمل، فلا شيء قابل لإعادة الاستخدام
+            self._memo.pop((user_id, mode), None)
+            return
+        self._memo[(user_id, mode)] = (sentences, outputs)
+
+    def plan(self, user_id: int, mode: str, text: str):
+        """تقسيم النص الجديد إلى أجزاء (نص، ناتج محفوظ أو None) مع فواصلها، أو None إذا لم يتغير شيء قابل للاستفادة"""
+        previous = self._memo.get((user_id, mode))
+        if not previous:
+            return None
+        old_sentences, old_outputs = previous
+        sentences, gaps = split_sentences(text)
+        if len(sentences) < 2:
+            return None
+
+        # لكل جملة جديدة: ناتجها السابق إن لم تتغير
+        reused = [None] * len(sentences)
+        matcher = difflib.SequenceMatcher(None, old_sentences, sentences, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                reused[j1:j2] = old_outputs[i1:i2]
+        if not any(reused):
+            return None
+
+        # الجمل المتغيرة المتجاورة تُرسل معاً للحفاظ على السياق
+        segments = []
+        segment_gaps = []
+        index = 0
+        while index < len(sentences):
+            segment_gaps.append(gaps[index])
+            if reused[index] is not None:
+                segments.append((sentences[index], reused[index]))
+                self.stats['reused'] += 1
+                index += 1
+                continue
+            run = sentences[index]
+            self.stats['sent'] += 1
+            index += 1
+            while index < len(sentences) and reused[index] is None:
+                run += gaps[index] + sentences[index]
+                self.stats['sent'] += 1
+                index += 1
+            segments.append((run, None))
+        segment_gaps.append(gaps[-1])
+        return segments, segment_gaps
+
+
+sentence_memo = SentenceMemo()
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import re
+import time
+from cachetools import TTLCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# الملح ثابت إذا ضُبط في الإعدادات، وإلا عشوائي لكل تشغيل (الكاش في الذاكرة فقط)
+_SALT = Config.KEY_HASH_SALT.encode('utf-8') if Config.KEY_HASH_SALT else os.urandom(16)
+
+_INTERVAL_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([smhd]?)$')
+_INTERVAL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class ApiKeyRevokedError(Exception):
+    """المفتاح الشخصي للمستخدم أُلغي في OpenRouter؛ لا نعود للمفتاح المشترك بصمت"""
+
+    def __init__(self, user_id: int):
+        super().__init__(f"Personal API key of user {user_id} was revoked")
+        self.user_id = user_id
+
+
+def hash_api_key(api_key: str) -> str:
+    """بصمة مملحة للمفتاح حتى لا يُحفظ المفتاح نفسه كمفتاح في الكاش أو السجلات"""
+    return hmac.new(_SALT, api_key.encode('utf-8'), hashlib.sha256).hexdigest()[:24]
+
+
+def parse_interval(value) -> float:
+    """تحويل فترة مثل '10s' أو '1m' إلى ثوانٍ"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _INTERVAL_RE.match(str(value or '').strip())
+    if not match:
+        return None
+    return float(match.group(1)) * _INTERVAL_UNITS[match.group(2)]
+
+
+def parse_key_info(payload: dict) -> dict:
+    """البيانات المفيدة من رد /auth/key"""
+    data = (payload or {}).get('data') or {}
+    rate_limit = data.get('rate_limit') or {}
+    return {
+        'label': data.get('label'),
+        'is_free_tier': data.get('is_free_tier'),
+        'limit_remaining': data.get('limit_remaining'),
+        'rate_limit_requests': rate_limit.get('requests'),
+        'rate_limit_interval': parse_interval(rate_limit.get('interval'))
+    }
+
+
+class KeyValidator:
+    """كاش لنتائج التحقق من مفاتيح API الشخصية مع إعادة تحقق في الخلفية قبل الانتهاء"""
+
+    def __init__(self, fetch_info, on_info=None):
+        # fetch_info(api_key) -> httpx.Response من /auth/key
+        self.fetch_info = fetch_info
+        self.on_info = on_info
+        self._cache = TTLCache(maxsize=Config.KEY_CACHE_SIZE, ttl=max(Config.KEY_VALID_TTL, Config.KEY_INVALID_TTL))
+        self._tracked = {}
+        self._refreshing = set()
+        self._loop_task = None
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'revoked': 0}
+
+    async def _fetch(self, api_key: str) -> dict:
+        """None عند الأخطاء العابرة (لا تُحفظ في الكاش)"""
+        try:
+            response = await self.fetch_info(api_key)
+        except Exception as e:
+            logger.warning(f"API key validation failed: {str(e)}")
+            return None
+
+        now = time.time()
+        if response.status_code == 200:
+            try:
+                info = parse_key_info(response.json())
+            except ValueError:
+                info = parse_key_info({})
+            info.update({'valid': True, 'checked_at': now, 'expires_at': now + Config.KEY_VALID_TTL})
+        elif response.status_code in (401, 403):
+            info = {'valid': False, 'checked_at': now, 'expires_at': now + Config.KEY_INVALID_TTL}
+        else:
+            logger.warning(f"Unexpected /auth/key status {response.status_code}")
+            return None
+
+        self._cache[hash_api_key(api_key)] = info
+        if self.on_info:
+            self.on_info(api_key, info)
+        return info
+
+    def get_cached(self, api_key: str) -> dict:
+        info = self._cache.get(hash_api_key(api_key))
+        if info and info['expires_at'] > time.time():
+            return info
+        return None
+
+    def is_revoked(self, api_key: str) -> bool:
+        info = self.get_cached(api_key)
+        return bool(info) and not info['valid']
+
+    async def validate(self, api_key: str) -> dict:
+        """بيانات المفتاح (مع valid) من الكاش أو من OpenRouter"""
+        info = self.get_cached(api_key)
+        if info is not None:
+            self.stats['hits'] += 1
+            # تحديث مسبق في الخلفية إذا اقترب الانتهاء
+            if info['valid'] and info['expires_at'] - time.time() < Config.KEY_REFRESH_MARGIN:
+                self._refresh_in_background(api_key)
+            return info
+
+        self.stats['misses'] += 1
+        return await self._fetch(api_key)
+
+    def _refresh_in_background(self, api_key: str):
+        key_hash = hash_api_key(api_key)
+        if key_hash in self._refreshing:
+            return
+        self._refreshing.add(key_hash)
+
+        async def refresh():
+            try:
+                info = await self._fetch(api_key)
+                self.stats['revalidated'] += 1
+                if info and not info['valid']:
+                    self.stats['revoked'] += 1
+                    logger.warning(f"Personal API key {key_hash} was revoked")
+            finally:
+                self._refreshing.discard(key_hash)
+
+        asyncio.create_task(refresh())
+
+    def track(self, api_key: str):
+        """متابعة مفتاح مفعل لإعادة التحقق منه دورياً"""
+        self._tracked[hash_api_key(api_key)] = api_key
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._revalidate_loop())
+
+    def untrack(self, api_key: str):
+        self._tracked.pop(hash_api_key(api_key), None)
+
+    async def _revalidate_loop(self):
+        while self._tracked:
+            await asyncio.sleep(Config.KEY_REVALIDATE_INTERVAL)
+            now = time.time()
+            for api_key in list(self._tracked.values()):
+                info = self.get_cached(api_key)
+                if info is None or info['expires_at'] - now < Config.KEY_REFRESH_MARGIN:
+                    self._refresh_in_background(api_key)
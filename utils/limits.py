@@ -1,108 +1,86 @@
 import time
-from config import Config
-from firebase_db import FirebaseDB
+from storage import create_storage
+from utils.premium_index import premium_index
+from utils.request_context import using_request
+from utils.settings import live_settings
+from utils.usage_buffer import UsageBuffer
+from utils.usage_history import DAILY, day_key
 import logging
 
 logger = logging.getLogger(__name__)
 
 class UsageLimiter:
     def __init__(self):
-        self.db = FirebaseDB()
+        self.db = create_storage()
+        self.usage = UsageBuffer(self.db)
         self.premium_users = {}  # مستخدمو الـ API الشخصي (ذاكرة محلية)
 
-    def check_limits(self, user_id: int) -> tuple:
-        """التحقق من حدود الاستخدام"""
+    async def check_limits(self, user_id: int) -> tuple:
+        """التحقق من حدود الاستخدام (من سياق التحديث الجاري دون قراءات إضافية)"""
         try:
-            is_premium = self.is_premium_user(user_id)
-            user_data = self.db.get_user(user_id)
-            current_time = time.time()
+            async with using_request(user_id, self) as request:
+                await request.load()
+                current_time = time.time()
+                char_limit = request.char_limit
 
-            # تحديد الحدود حسب نوع المستخدم
-            char_limit = Config.PREMIUM_CHAR_LIMIT if is_premium else Config.CHAR_LIMIT
-            request_limit = Config.PREMIUM_REQUEST_LIMIT if is_premium else Config.REQUEST_LIMIT
-            reset_hours = Config.PREMIUM_RESET_HOURS if is_premium else Config.RESET_HOURS
+                # ضبط القيم الافتراضية
+                reset_time = float(request.user.get('reset_time', current_time + (request.reset_hours * 3600)))
 
-            # ضبط القيم الافتراضية
-            reset_time = float(user_data.get('reset_time', current_time + (reset_hours * 3600)))
-            request_count = user_data.get('request_count', 0)
+                # إعادة تعيين العداد إذا انتهت المدة
+                if current_time > reset_time:
+                    self.usage.discard_user(user_id)
+                    request.update(request_count=0, reset_time=current_time + (request.reset_hours * 3600))
+                    return True, 0, char_limit
 
-            # إعادة تعيين العداد إذا انتهت المدة
-            if current_time > reset_time:
-                self.db.update_user(user_id, {
-                    'request_count': 0,
-                    'reset_time': current_time + (reset_hours * 3600),
-                    'is_premium': is_premium
-                })
-                return True, 0, char_limit
-
-            remaining = request_limit - request_count
-            time_left = max(0, reset_time - current_time)
-            return remaining > 0, time_left, char_limit
+                remaining = request.request_limit - request.request_count
+                time_left = max(0, reset_time - current_time)
+                return remaining > 0, time_left, char_limit
 
         except Exception as e:
             logger.error(f"Error in check_limits: {str(e)}", exc_info=True)
-            return True, 0, Config.CHAR_LIMIT
+            return True, 0, live_settings.current.char_limit
 
-    def increment_usage(self, user_id: int):
-        """زيادة عدد الطلبات لمستخدم"""
+    async def increment_usage(self, user_id: int, mode: str = None):
+        """زيادة عدد الطلبات لمستخدم (تُمرر للكتابة المؤجلة عند نهاية التحديث)"""
         try:
-            is_premium = self.is_premium_user(user_id)
-            user_data = self.db.get_user(user_id)
-            current_time = time.time()
-
-            # تحديث الإحصائيات العامة
-            stats = self.db.get_stats()
-            self.db.update_stats({
-                'total_requests': stats.get('total_requests', 0) + 1,
-                'daily_requests': stats.get('daily_requests', 0) + 1,
-                'premium_users': self.db.count_premium_users()
-            })
-
-            # تحديث بيانات المستخدم
-            self.db.update_user(user_id, {
-                'request_count': user_data.get('request_count', 0) + 1,
-                'last_request': current_time,
-                'is_premium': is_premium
-            })
-
+            async with using_request(user_id, self) as request:
+                request.record_usage(mode)
         except Exception as e:
             logger.error(f"Error in increment_usage: {str(e)}", exc_info=True)
             raise
 
-    def get_daily_requests_count(self) -> int:
-        """الحصول على عدد الطلبات اليومية"""
+    async def get_request_count(self, user_id: int) -> int:
+        """عدد طلبات المستخدم شاملاً الزيادات التي لم تُكتب بعد"""
+        async with using_request(user_id, self) as request:
+            await request.load()
+            return request.request_count
+
+    async def get_daily_requests_count(self) -> int:
+        """طلبات اليوم (UTC) من حاوية اليوم مع ما لم يُكتب بعد"""
         try:
-            stats = self.db.get_stats()
-            return stats.get('daily_requests', 0)
+            history = await self.db.get_usage_history(hours=0, days=1)
+            today = (history[DAILY] or {}).get(day_key(time.time())) or {}
+            return today.get('requests', 0) + self.usage.pending_today()
         except Exception as e:
             logger.error(f"Error in get_daily_requests_count: {str(e)}")
             return 0
 
-    def set_premium_user(self, user_id: int, api_key: str):
-        """إضافة مستخدم API شخصي مميز مؤقت في الذاكرة"""
+    async def set_premium_user(self, user_id: int, api_key: str):
+        """إضافة مستخدم API شخصي مميز مؤقت في الذاكرة (لا تُكتب علامة is_premium التي يضبطها المشرف)"""
         self.premium_users[user_id] = {
             'api_key': api_key,
             'count': 0,
-            'reset_time': time.time() + (Config.PREMIUM_RESET_HOURS * 3600)
+            'reset_time': time.time() + (live_settings.current.premium_reset_hours * 3600)
         }
+        premium_index.set_api_user(user_id, True)
 
-    def is_premium_user(self, user_id: int) -> bool:
-        """التحقق من كون المستخدم مميزاً"""
-        try:
-            # التحقق من بيانات المستخدم في Firebase
-            user_data = self.db.get_user(user_id)
-            if user_data and user_data.get('is_premium', False):
-                return True
-
-            # التحقق من قائمة API local
-            if user_id in self.premium_users:
-                return True
-
-            # التحقق من شجرة premium_users في Firebase
-            return str(user_id) in self.db.get_premium_users()
+    async def remove_premium_user(self, user_id: int):
+        """إلغاء API الشخصي وإرجاع المستخدم إلى الحساب العادي"""
+        self.premium_users.pop(user_id, None)
+        premium_index.set_api_user(user_id, False)
 
-        except Exception as e:
-            logger.error(f"Error checking premium status: {str(e)}")
-            return False
+    def is_premium_user(self, user_id: int) -> bool:
+        """التحقق من كون المستخدم مميزاً (علامة is_premium، شجرة premium_users، أو API شخصي) من الذاكرة"""
+        return premium_index.is_premium(user_id)
 
 limiter = UsageLimiter()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+# قياس OpenRouterClient (مجمع الاتصالات وحد الطلبات المتزامنة) مقابل الخادم الوهمي داخل نفس العملية:
+#   python -m utils.loadtest --profile realistic --requests 500 --concurrency 50 --stream
+# config.py يتحقق من المتغيرات المطلوبة عند الاستيراد؛ قيم وهمية إن لم تكن معرفة (لا يُتصل بأي خدمة حقيقية)
+for _name in ('BOT_TOKEN', 'WEBHOOK_URL', 'CHANNEL_USERNAME', 'ADMIN_USERNAMES', 'OPENROUTER_API_KEY'):
+    os.environ.setdefault(_name, 'loadtest')
+os.environ.setdefault('STORAGE_BACKEND', 'sql')
+
+import httpx  # noqa: E402
+from utils.fake_openrouter import PROFILES, FakeOpenRouter, Profile  # noqa: E402
+from utils.openrouter import OpenRouterClient  # noqa: E402
+
+SAMPLE_PROMPT = "صحح النص التالي:\n\nانا ذهبت الى المدرسه فى الصباح\n\nأعد النص المصحح فقط."
+
+
+def percentile(values: list, share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def run_load(profile='fast', requests: int = 100, concurrency: int = 10, stream: bool = False,
+                   max_inflight: int = None, seed: int = None) -> dict:
+    """تشغيل عدد من الطلبات بالتوازي وإرجاع زمن الاستجابة (وأول جزء عند التدفق) والأخطاء وإحصاءات الخادم
+
+    profile: اسم من PROFILES أو Profile مخصص.
+    """
+    if not isinstance(profile, Profile):
+        profile = PROFILES[profile]
+    latencies, first_chunks, errors = [], [], {}
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(SAMPLE_PROMPT)
+
+    async with FakeOpenRouter(profile, seed=seed) as server:
+        base_url = await server.start()
+        async with OpenRouterClient(base_url=base_url, max_connections=concurrency,
+                                    max_inflight=max_inflight or concurrency) as client:
+
+            async def one(prompt):
+                started = time.perf_counter()
+                if not stream:
+                    await client.chat(prompt)
+                else:
+                    first_chunk = None
+                    async for _ in client.stream_chat(prompt):
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                    if first_chunk is not None:
+                        first_chunks.append(first_chunk)
+                latencies.append(time.perf_counter() - started)
+
+            async def worker():
+                while not queue.empty():
+                    prompt = queue.get_nowait()
+                    try:
+                        await one(prompt)
+                    except httpx.HTTPStatusError as e:
+                        errors[e.response.status_code] = errors.get(e.response.status_code, 0) + 1
+                    except Exception as e:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        return {
+            'requests': requests,
+            'ok': len(latencies),
+            'errors': errors,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'mean': statistics.fmean(latencies) if latencies else 0.0,
+            'first_chunk_p50': percentile(first_chunks, 0.5),
+            'server': dict(server.stats),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OpenRouterClient against the fake OpenRouter server")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='fast')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--max-inflight', type=int, default=None)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    # سطر لكل طلب من httpx يغطي على النتائج
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    result = asyncio.run(run_load(args.profile, args.requests, args.concurrency, args.stream,
+                                  args.max_inflight, args.seed))
+    print(f"{result['ok']}/{result['requests']} ok in {result['elapsed']:.2f}s "
+          f"({result['throughput']:.1f} req/s), errors: {result['errors'] or 'none'}")
+    print(f"Latency p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+          f"p99 {result['p99'] * 1000:.0f} ms")
+    if args.stream:
+        print(f"First chunk p50 {result['first_chunk_p50'] * 1000:.0f} ms")
+    print(f"Server: {result['server']}")
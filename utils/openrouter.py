@@ -1,42 +1,215 @@
-import requests
+import asyncio
 import json
+import logging
+import httpx
 from config import Config
+from utils.circuit_breaker import upstream_guards
+from utils.hedging import hedge_policy
+from utils.key_validation import ApiKeyRevokedError, KeyValidator
 from utils.limits import limiter
 
-async def validate_user_api(api_key: str) -> bool:
-    """التحقق من صحة API المقدم من المستخدم"""
-    try:
-        response = requests.get(
-            "https://openrouter.ai/api/v1/auth/key",
-            headers={"Authorization": f"Bearer {api_key}"},
-            timeout=5
-        )
-        return response.status_code == 200
-    except:
-        return False
+logger = logging.getLogger(__name__)
 
-def query_openrouter(prompt: str, user_id: int = None) -> str:
-    # استخدام API الشخصي إذا كان متاحاً
-    if user_id and limiter.is_premium_user(user_id):
-        api_key = limiter.premium_users[user_id]['api_key']
-        headers = {"Authorization": f"Bearer {api_key}"}
-    else:
-        headers = {
+# HTTP/2 يحتاج حزمة h2 (httpx[http2])، وإلا نعود إلى HTTP/1.1 مع keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class OpenRouterClient:
+    """عميل OpenRouter غير متزامن بمجمع اتصالات دائم وحد للطلبات المتزامنة"""
+
+    def __init__(self, base_url: str = None, max_connections: int = None,
+                 max_inflight: int = None, timeout: float = None):
+        self.base_url = (base_url or Config.OPENROUTER_BASE_URL).rstrip('/')
+        self.max_connections = max_connections or Config.OPENROUTER_MAX_CONNECTIONS
+        self.max_inflight = max_inflight or Config.OPENROUTER_MAX_INFLIGHT
+        self.timeout = timeout or Config.OPENROUTER_TIMEOUT
+        self.http2 = Config.OPENROUTER_HTTP2 and HTTP2_AVAILABLE
+        self._client = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """إنشاء العميل عند أول استخدام (داخل حلقة الأحداث الجارية)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=Config.OPENROUTER_CONNECT_TIMEOUT)
+            )
+        return self._client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        return self._semaphore
+
+    @staticmethod
+    def build_headers(api_key: str = None) -> dict:
+        """ترويسات الطلب: المفتاح الشخصي أو مفتاح البوت المشترك"""
+        if api_key:
+            return {"Authorization": f"Bearer {api_key}"}
+        return {
             "Authorization": f"Bearer {Config.OPENROUTER_API_KEY}",
             "HTTP-Referer": Config.SITE_URL,
             "X-Title": Config.SITE_TITLE
         }
-    
-    data = {
-        "model": Config.OPENROUTER_MODEL,
-        "messages": [{"role": "user", "content": prompt}]
-    }
-
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        json=data
+
+    async def chat(self, prompt: str, api_key: str = None, model: str = None,
+                   timeout: float = None) -> str:
+        """إرسال طلب إكمال وإرجاع نص الرد"""
+        data = {
+            "model": model or Config.OPENROUTER_MODEL,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+        async with self._get_semaphore():
+            response = await self._get_client().post(
+                "/chat/completions",
+                headers=self.build_headers(api_key),
+                json=data,
+                timeout=timeout or self.timeout
+            )
+
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream_chat(self, prompt: str, api_key: str = None, model: str = None,
+                          timeout: float = None):
+        """إرسال طلب إكمال متدفق (SSE) وإرجاع أجزاء النص فور وصولها"""
+        data = {
+            "model": model or Config.OPENROUTER_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+
+        async with self._get_semaphore():
+            async with self._get_client().stream(
+                "POST",
+                "/chat/completions",
+                headers=self.build_headers(api_key),
+                json=data,
+                timeout=timeout or self.timeout
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+
+                done = False
+                async for line in response.aiter_lines():
+                    # أسطر التعليق (مثل ": OPENROUTER PROCESSING") والأسطر الفارغة تُتجاهل،
+                    # وما بعد [DONE] يُقرأ دون معالجة: الخروج قبل نهاية الجسم يغلق الاتصال بدل إعادته للمجمع
+                    if done or not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        done = True
+                        continue
+                    try:
+                        chunk = json.loads(payload)
+                    except ValueError:
+                        logger.warning(f"Malformed SSE chunk: {payload[:100]}")
+                        continue
+                    if "error" in chunk:
+                        raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def get_key_info(self, api_key: str, timeout: float = 5) -> httpx.Response:
+        """استعلام /auth/key عن مفتاح API"""
+        return await self._get_client().get(
+            "/auth/key",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout
+        )
+
+    async def aclose(self):
+        """إغلاق مجمع الاتصالات"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+client = OpenRouterClient()
+# بيانات كل مفتاح (حد المعدل والرصيد) تُطبق على حارسه حتى نتمهل قبل أن يرفضنا OpenRouter
+key_validator = KeyValidator(
+    client.get_key_info,
+    on_info=lambda api_key, info: upstream_guards.for_key(api_key).apply_key_info(info)
+)
+
+
+def get_user_api_key(user_id: int = None) -> str:
+    """مفتاح API الشخصي للمستخدم إن وجد؛ ApiKeyRevokedError إذا ثبت إلغاؤه"""
+    if user_id and limiter.is_premium_user(user_id):
+        user_api = limiter.premium_users.get(user_id)
+        if user_api:
+            if key_validator.is_revoked(user_api['api_key']):
+                raise ApiKeyRevokedError(user_id)
+            return user_api['api_key']
+    return None
+
+
+async def revoke_user_api(user_id: int):
+    """إيقاف متابعة المفتاح الملغى وإرجاع المستخدم إلى الحساب العادي"""
+    user_api = limiter.premium_users.get(user_id)
+    if user_api:
+        key_validator.untrack(user_api['api_key'])
+    await limiter.remove_premium_user(user_id)
+
+
+async def validate_user_api(api_key: str) -> bool:
+    """التحقق من صحة API المقدم من المستخدم"""
+    info = await key_validator.validate(api_key)
+    return bool(info) and info['valid']
+
+
+async def query_openrouter_async(prompt: str, user_id: int = None, timeout: float = None,
+                                 api_key: str = None) -> str:
+    # استخدام API الشخصي إذا كان متاحاً
+    api_key = api_key or get_user_api_key(user_id)
+    guard = upstream_guards.for_key(api_key)
+    return await hedge_policy.chat(
+        lambda model: guard.call(lambda: client.chat(prompt, api_key=api_key, model=model, timeout=timeout), model)
     )
 
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
+
+async def stream_openrouter(prompt: str, user_id: int = None, timeout: float = None, api_key: str = None):
+    """أجزاء الرد المتدفقة، أو الرد كاملاً دفعة واحدة إذا كان التدفق معطلاً"""
+    if not Config.STREAM_RESPONSES:
+        yield await query_openrouter_async(prompt, user_id, timeout, api_key)
+        return
+
+    api_key = api_key or get_user_api_key(user_id)
+    guard = upstream_guards.for_key(api_key)
+    async for delta in hedge_policy.stream(
+        lambda model: guard.stream(
+            lambda: client.stream_chat(prompt, api_key=api_key, model=model, timeout=timeout), model
+        )
+    ):
+        yield delta
+
+
+def query_openrouter(prompt: str, user_id: int = None) -> str:
+    """غلاف متزامن للسكربتات فقط، لا يُستدعى من داخل حلقة أحداث البوت"""
+    api_key = get_user_api_key(user_id)
+
+    async def _run():
+        async with OpenRouterClient() as one_shot:
+            return await one_shot.chat(prompt, api_key=api_key)
+
+    return asyncio.run(_run())
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from config import Config
+from utils.batching import micro_batcher
+from utils.cache import result_cache
+from utils.chunking import reassemble, split_into_chunks
+from utils.incremental import sentence_memo
+from utils.key_validation import hash_api_key
+from utils.limits import limiter
+from utils.openrouter import get_user_api_key, stream_openrouter
+from utils.prepass import spell_prepass
+from utils.prompts import build_prompt, normalize_mode
+from utils.scheduler import PRIORITY_FREE, PRIORITY_PREMIUM, request_scheduler
+from utils.singleflight import llm_flights
+
+logger = logging.getLogger(__name__)
+
+
+class TextJob:
+    """طلب معالجة نص واحد: الكاش أولاً ثم استدعاء OpenRouter مشترك"""
+
+    def __init__(self, mode: str, text: str, user_id: int = None, is_premium: bool = None,
+                 on_queued=None, incremental: bool = True):
+        self.mode = normalize_mode(mode)
+        self.text = text
+        self.user_id = user_id
+        self.is_premium = is_premium
+        # on_queued(position, eta) لعرض موقع الطلب في الطابور بدل رسالة الانتظار الثابتة
+        self.on_queued = on_queued
+        # الطلبات الفرعية (أجزاء وجمل) لا تستخدم ذاكرة الجمل ولا تحدثها
+        self.incremental = incremental and bool(user_id)
+        self.model = Config.OPENROUTER_MODEL
+        self.api_key = None
+        self.cached = False
+        self.coalesced = False
+        self.local = False
+
+    @property
+    def counts_against_quota(self) -> bool:
+        """نتائج الكاش تُحتسب من الحصة حسب الإعدادات"""
+        return not self.cached or Config.CACHE_HITS_COUNT_QUOTA
+
+    @property
+    def priority(self) -> int:
+        """المميزون وأصحاب API الشخصي في فئة الأولوية العليا"""
+        if self.is_premium is None:
+            self.is_premium = bool(self.user_id) and limiter.is_premium_user(self.user_id)
+        return PRIORITY_PREMIUM if self.is_premium else PRIORITY_FREE
+
+    async def _upstream(self, prompt: str):
+        """الاستدعاء الفعلي؛ يعمل داخل مهمة مشتركة ويحفظ النتيجة في الكاش حتى لو أُلغي المستدعي"""
+        async with request_scheduler.slot(self.user_id, self.priority, on_wait=self.on_queued):
+            async for delta in self._call(prompt):
+                yield delta
+
+    async def _call(self, prompt: str):
+        parts = []
+        # النصوص القصيرة على المفتاح المشترك تُجمع مع نصوص مستخدمين آخرين في طلب واحد
+        if micro_batcher.accepts(self.mode, self.text) and not self.api_key:
+            delta = await micro_batcher.submit(self.mode, self.text)
+            parts.append(delta)
+            yield delta
+        else:
+            async for delta in stream_openrouter(prompt, api_key=self.api_key):
+                parts.append(delta)
+                yield delta
+
+        result = "".join(parts)
+        if result.strip():
+            await result_cache.set(self.mode, self.model, self.text, result)
+
+    async def _stream_segments(self, segments: list, gaps: list, outputs: list):
+        """معالجة الأجزاء بالتوازي وإرجاعها بالترتيب مع الفواصل الأصلية
+
+        segments: قائمة (نص، ناتج) حيث الناتج None يعني أن الجزء يُرسل كطلب فرعي
+        """
+        semaphore = asyncio.Semaphore(Config.CHUNK_MAX_PARALLEL)
+        is_premium = self.priority == PRIORITY_PREMIUM
+        first_sent = next((index for index, (_, output) in enumerate(segments) if output is None), None)
+
+        async def run(index: int, text: str) -> str:
+            async with semaphore:
+                job = TextJob(self.mode, text, self.user_id, is_premium,
+                              on_queued=self.on_queued if index == first_sent else None,
+                              incremental=False)
+                return "".join([delta async for delta in job.stream()])
+
+        tasks = [
+            asyncio.create_task(run(index, text)) if output is None else None
+            for index, (text, output) in enumerate(segments)
+        ]
+        try:
+            for index, ((_, output), task) in enumerate(zip(segments, tasks)):
+                if task is not None:
+                    output = await task
+                outputs.append(output)
+                piece = gaps[index] + output.strip()
+                if index == len(segments) - 1:
+                    piece += gaps[-1]
+                if piece:
+                    yield piece
+        finally:
+            for task in tasks:
+                if task is not None:
+                    task.cancel()
+
+        await result_cache.set(self.mode, self.model, self.text, reassemble(outputs, gaps))
+
+    async def stream(self):
+        """أجزاء النتيجة بالترتيب (دفعة واحدة عند الإصابة في الكاش)"""
+        # المفتاح يُحدد مرة واحدة قبل الدخول في استدعاء مشترك، فلا يصل خطأ المفتاح الملغى لمستخدمين آخرين
+        self.api_key = get_user_api_key(self.user_id)
+        parts = []
+        async for delta in self._stream():
+            parts.append(delta)
+            yield delta
+
+        if self.incremental:
+            sentence_memo.remember(self.user_id, self.mode, self.text, "".join(parts))
+
+    async def _stream(self):
+        if self.mode == "spelling":
+            # التدقيق الإملائي فقط يُجاب محلياً: القاموس لا يرى الأخطاء النحوية في وضع correct
+            checked = await spell_prepass.check(self.text)
+            if checked and checked['status'] != 'suspicious':
+                self.local = True
+                yield checked['text']
+                return
+
+        cached = await result_cache.get(self.mode, self.model, self.text)
+        if cached is not None:
+            self.cached = True
+            yield cached
+            return
+
+        # نص معدل قليلاً عن آخر نص للمستخدم: الجمل غير المتغيرة تُؤخذ من نتيجته السابقة
+        plan = sentence_memo.plan(self.user_id, self.mode, self.text) if self.incremental else None
+        if plan:
+            segments, gaps = plan
+            async for delta in self._stream_segments(segments, gaps, []):
+                yield delta
+            return
+
+        chunks, gaps = split_into_chunks(self.text, int(Config.CHUNK_MAX_TOKENS * Config.CHUNK_CHARS_PER_TOKEN))
+        if len(chunks) > 1:
+            async for delta in self._stream_segments([(chunk, None) for chunk in chunks], gaps, []):
+                yield delta
+            return
+
+        prompt = build_prompt(self.mode, self.text)
+        # المفتاح جزء من هوية الطلب: لا يُحتسب طلب مستخدم على مفتاح غيره ولا يرث أخطاءه أو أولويته
+        flight_key = (self.model, hash_api_key(self.api_key) if self.api_key else None, prompt)
+        self.coalesced = llm_flights.is_inflight(flight_key)
+
+        async for delta in llm_flights.stream(flight_key, lambda: self._upstream(prompt)):
+            yield delta
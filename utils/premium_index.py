@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+EXPIRY_FIELDS = ('expires_at', 'expiry', 'until')
+
+
+def parse_expiry(entry) -> float:
+    """وقت انتهاء عضوية من عقدة premium_users (None = بلا انتهاء)"""
+    if isinstance(entry, dict):
+        for field in EXPIRY_FIELDS:
+            if entry.get(field) is not None:
+                try:
+                    return float(entry[field])
+                except (TypeError, ValueError):
+                    return None
+        return None
+    if isinstance(entry, (int, float)) and not isinstance(entry, bool) and entry > 1e9:
+        # قيمة رقمية بحجم الطابع الزمني تُعامل كوقت انتهاء
+        return float(entry)
+    return None
+
+
+class PremiumIndex:
+    """فهرس واحد في الذاكرة لحالة التميز من ثلاثة مصادر:
+    علامة is_premium في سجل المستخدم، عقدة premium_users، ومفاتيح API الشخصية
+    """
+
+    def __init__(self):
+        self._flagged = set()
+        self._granted = {}
+        self._api_users = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def is_premium(self, user_id: int) -> bool:
+        if user_id in self._flagged or user_id in self._api_users:
+            return True
+        if user_id not in self._granted:
+            return False
+        expires_at = self._granted[user_id]
+        return expires_at is None or expires_at > time.time()
+
+    # ------------------- علامة is_premium -------------------
+    def set_flag(self, user_id: int, is_premium: bool):
+        with self._lock:
+            if is_premium:
+                self._flagged.add(user_id)
+            else:
+                self._flagged.discard(user_id)
+
+    def replace_flags(self, user_ids):
+        with self._lock:
+            self._flagged = {int(user_id) for user_id in user_ids if str(user_id).lstrip('-').isdigit()}
+
+    # ------------------- مفاتيح API الشخصية -------------------
+    def set_api_user(self, user_id: int, active: bool):
+        with self._lock:
+            if active:
+                self._api_users.add(user_id)
+            else:
+                self._api_users.discard(user_id)
+
+    # ------------------- عقدة premium_users -------------------
+    def start(self, root_ref):
+        """الاستماع لعقدة premium_users؛ أول حدث يحمل الشجرة كاملة (مرة واحدة لكل العملية)"""
+        if self._listener is not None:
+            return
+        try:
+            self._listener = root_ref.child('premium_users').listen(self._on_event)
+        except Exception as e:
+            logger.error(f"Error starting premium index listener: {str(e)}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def replace_grants(self, entries: dict):
+        """استبدال المنح كاملة (للتخزين الذي لا يدعم الاستماع)"""
+        with self._lock:
+            self._granted = {}
+            for user_id, entry in (entries or {}).items():
+                self._apply(user_id, entry)
+
+    def _on_event(self, event):
+        path = event.path.strip('/')
+        if not path:
+            with self._lock:
+                if event.event_type == 'put':
+                    self._granted = {}
+                for user_id, entry in (event.data or {}).items():
+                    self._apply(user_id, entry)
+            return
+
+        user_id, _, field = path.partition('/')
+        if not user_id.lstrip('-').isdigit():
+            return
+        with self._lock:
+            if not field:
+                self._apply(user_id, event.data)
+            elif field in EXPIRY_FIELDS:
+                self._granted[int(user_id)] = parse_expiry({field: event.data})
+            else:
+                self._granted.setdefault(int(user_id), None)
+
+    def _apply(self, user_id: str, entry):
+        if not str(user_id).lstrip('-').isdigit():
+            return
+        if entry is None or entry is False:
+            self._granted.pop(int(user_id), None)
+        else:
+            self._granted[int(user_id)] = parse_expiry(entry)
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        return {
+            'flagged': len(self._flagged),
+            'granted': sum(1 for expires_at in self._granted.values() if expires_at is None or expires_at > now),
+            'expired': sum(1 for expires_at in self._granted.values() if expires_at is not None and expires_at <= now),
+            'api_users': len(self._api_users)
+        }
+
+
+premium_index = PremiumIndex()
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from utils.spellcheck import check_in_worker, init_worker
+
+logger = logging.getLogger(__name__)
+
+
+class SpellPrepass:
+    """الفحص الإملائي المحلي في مجمع عمليات منفصل حتى لا يعطل حلقة الأحداث"""
+
+    def __init__(self):
+        self._pool = None
+        self.enabled = Config.SPELL_PREPASS_ENABLED
+        self.stats = {'clean': 0, 'fixed': 0, 'suspicious': 0, 'errors': 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            if not os.path.exists(Config.SPELL_LEXICON_PATH):
+                logger.warning(f"Spell lexicon not found at {Config.SPELL_LEXICON_PATH}, pre-pass disabled")
+                self.enabled = False
+                return None
+            self._pool = ProcessPoolExecutor(
+                max_workers=Config.SPELL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(Config.SPELL_LEXICON_PATH,)
+            )
+        return self._pool
+
+    async def check(self, text: str) -> dict:
+        """نتيجة الفحص أو None إذا كان الفحص معطلاً أو فشل"""
+        if not self.enabled:
+            return None
+        pool = self._get_pool()
+        if pool is None:
+            return None
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, check_in_worker, text)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Spell pre-pass failed: {str(e)}")
+            return None
+
+        self.stats[result['status']] += 1
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+spell_prepass = SpellPrepass()
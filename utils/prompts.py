@@ -0,0 +1,63 @@
+PROMPTS = {
+    "correct": (
+        "صحح الأخطاء النحوية والإملائية في النص التالي مع الحفاظ على نفس المعنى:\n\n"
+        "{text}\n\n"
+        "الرجاء إرسال النص المصحح فقط دون أي تعليقات إضافية."
+    ),
+    "rewrite": (
+        "أعد صياغة النص التالي بلغة عربية فصحى سليمة مع الحفاظ على نفس المعنى:\n\n"
+        "{text}\n\n"
+        "الرجاء إرسال النص المعاد صياغته فقط دون أي تعليقات إضافية."
+    ),
+    "spelling": (
+        "صحح الأخطاء الإملائية فقط في النص التالي دون تغيير كلماته أو تراكيبه:\n\n"
+        "{text}\n\n"
+        "الرجاء إرسال النص المصحح فقط دون أي تعليقات إضافية."
+    )
+}
+
+# أوامر الدفعات: عدة نصوص مرقمة في طلب واحد
+BATCH_PROMPTS = {
+    "correct": (
+        "صحح الأخطاء النحوية والإملائية في كل نص من النصوص المرقمة التالية مع الحفاظ على نفس المعنى.\n"
+        "أعد كل نص مصحح في سطر يبدأ برقمه بين قوسين مربعين مثل [1]، "
+        "بنفس الترتيب ودون أي تعليقات إضافية.\n\n"
+        "{items}"
+    ),
+    "rewrite": (
+        "أعد صياغة كل نص من النصوص المرقمة التالية بلغة عربية فصحى سليمة مع الحفاظ على نفس المعنى.\n"
+        "أعد كل نص معاد صياغته في سطر يبدأ برقمه بين قوسين مربعين مثل [1]، "
+        "بنفس الترتيب ودون أي تعليقات إضافية.\n\n"
+        "{items}"
+    ),
+    "spelling": (
+        "صحح الأخطاء الإملائية فقط في كل نص من النصوص المرقمة التالية دون تغيير كلماته أو تراكيبه.\n"
+        "أعد كل نص مصحح في سطر يبدأ برقمه بين قوسين مربعين مثل [1]، "
+        "بنفس الترتيب ودون أي تعليقات إضافية.\n\n"
+        "{items}"
+    )
+}
+
+# أسماء بديلة تستخدمها أزرار القائمة الرئيسية
+MODE_ALIASES = {
+    "paraphrase": "rewrite"
+}
+
+
+def normalize_mode(mode: str) -> str:
+    """توحيد اسم نوع المعالجة"""
+    mode = MODE_ALIASES.get(mode, mode)
+    if mode not in PROMPTS:
+        raise ValueError(f"Unknown processing mode: {mode}")
+    return mode
+
+
+def build_prompt(mode: str, text: str) -> str:
+    """بناء الأمر المرسل إلى النموذج حسب نوع المعالجة"""
+    return PROMPTS[normalize_mode(mode)].format(text=text)
+
+
+def build_batch_prompt(mode: str, texts: list) -> str:
+    """بناء أمر دفعة واحدة لعدة نصوص مرقمة"""
+    items = "\n\n".join(f"[{i}] {text}" for i, text in enumerate(texts, start=1))
+    return BATCH_PROMPTS[normalize_mode(mode)].format(items=items)
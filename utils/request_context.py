@@ -0,0 +1,153 @@
+import functools
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from utils.bans import banned_users
+from utils.premium_index import premium_index
+from utils.settings import live_settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_context', default=None)
+
+# مجاميع لكل التحديثات لعرضها للمشرفين
+request_stats = {'updates': 0, 'round_trips': 0, 'max_round_trips': 0}
+
+
+def current_request(user_id: int = None):
+    """سياق التحديث الجاري (أو None)؛ مع user_id يُعاد فقط إن كان لنفس المستخدم"""
+    request = _current.get()
+    if request is None or (user_id is not None and request.user_id != user_id):
+        return None
+    return request
+
+
+def count_round_trip():
+    """تُستدعى من طبقة التخزين والتحقق من الاشتراك عند كل طلب شبكة"""
+    request = _current.get()
+    if request is not None:
+        request.round_trips += 1
+
+
+class RequestContext:
+    """حالة مستخدم واحد طوال تحديث تيليجرام واحد
+
+    سجل المستخدم يُقرأ مرة واحدة عند أول حاجة، والتميز والحظر والإعدادات لقطة من الذاكرة،
+    والتعديلات تُجمع ثم تُكتب مرة واحدة في commit عند نهاية التحديث.
+    """
+
+    def __init__(self, user_id: int, limiter):
+        self.user_id = user_id
+        self.limiter = limiter
+        self.settings = live_settings.current
+        self.is_premium = premium_index.is_premium(user_id)
+        self.is_banned = user_id in banned_users
+        self.subscribed = None
+        self.user = None
+        self.round_trips = 0
+        self._new_user = False
+        self._changes = {}
+        self._usage = []
+
+    async def load(self) -> dict:
+        """سجل المستخدم (قراءة واحدة لكل تحديث)"""
+        if self.user is None:
+            self.user = await self.limiter.db.get_user(self.user_id) or {}
+            self._new_user = not self.user
+        return self.user
+
+    @property
+    def char_limit(self) -> int:
+        return self.settings.char_limit_for(self.is_premium)
+
+    @property
+    def request_limit(self) -> int:
+        return self.settings.request_limit_for(self.is_premium)
+
+    @property
+    def reset_hours(self) -> float:
+        return self.settings.reset_hours_for(self.is_premium)
+
+    @property
+    def request_count(self) -> int:
+        """الطلبات المحفوظة + المعلقة في مخزن الكتابة المؤجلة + طلبات هذا التحديث"""
+        return (
+            (self.user or {}).get('request_count', 0)
+            + self.limiter.usage.pending_count(self.user_id)
+            + len(self._usage)
+        )
+
+    def remaining(self) -> int:
+        return max(0, self.request_limit - self.request_count)
+
+    def update(self, **fields):
+        """تعديل حقول السجل محلياً؛ تُكتب عند commit"""
+        self._changes.update(fields)
+        if self.user is not None:
+            self.user.update(fields)
+
+    def record_usage(self, mode: str = None):
+        """طلب مكتمل في هذا التحديث (mode لإحصاءات الاستخدام حسب نوع المعالجة)"""
+        self._usage.append(mode)
+
+    async def commit(self):
+        """تسجيل المستخدم الجديد وكل التعديلات في كتابة واحدة ثم تمرير الاستخدام للمخزن المؤجل"""
+        new_user, self._new_user = self._new_user, False
+        changes, self._changes = self._changes, {}
+        if new_user or changes:
+            await self.limiter.db.commit_user(self.user_id, changes, new_user)
+        for mode in self._usage:
+            self.limiter.usage.record(self.user_id, mode, self.is_premium)
+        self._usage = []
+
+    def _finish(self):
+        request_stats['updates'] += 1
+        request_stats['round_trips'] += self.round_trips
+        request_stats['max_round_trips'] = max(request_stats['max_round_trips'], self.round_trips)
+        logger.debug(f"Update for user {self.user_id} finished with {self.round_trips} round trips")
+
+
+@asynccontextmanager
+async def using_request(user_id: int, limiter):
+    """سياق التحديث الجاري لهذا المستخدم، أو سياق مؤقت يُكتب عند الخروج (للاستدعاء خارج المعالجات)"""
+    request = current_request(user_id)
+    if request is not None:
+        yield request
+        return
+    request = RequestContext(user_id, limiter)
+    token = _current.set(request)
+    try:
+        yield request
+    finally:
+        try:
+            await request.commit()
+        finally:
+            _current.reset(token)
+
+
+def request_scoped(handler):
+    """تشغيل المعالج داخل RequestContext للمستخدم ثم كتابة تعديلاته مرة واحدة في النهاية
+
+    الاستدعاءات المتداخلة (مثل back_to_start ← start) تشارك نفس السياق.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        user = update.effective_user
+        if user is None or _current.get() is not None:
+            return await handler(update, context)
+
+        from utils.limits import limiter
+        request = RequestContext(user.id, limiter)
+        token = _current.set(request)
+        try:
+            return await handler(update, context)
+        finally:
+            try:
+                await request.commit()
+            except Exception as e:
+                logger.error(f"Error committing request state for user {user.id}: {str(e)}")
+            finally:
+                request._finish()
+                _current.reset(token)
+
+    return wrapper
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# فئات الأولوية: الأصغر يُخدم أولاً
+PRIORITY_PREMIUM = 0
+PRIORITY_FREE = 1
+
+
+class _Ticket:
+    def __init__(self, user_id: int, priority: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        # الموقع يُحسب مرة واحدة لكل تغيير في الطوابير، وmoved يوقظ صاحب الطلب عند تغيره
+        self.position = 0
+        self.moved = asyncio.Event()
+
+
+class RequestScheduler:
+    """جدولة طلبات OpenRouter بحد تزامن عام وأولوية للمميزين وعدالة بين المستخدمين"""
+
+    def __init__(self, max_concurrent: int = None):
+        self.max_concurrent = max_concurrent or Config.SCHEDULER_MAX_CONCURRENT
+        self.active = 0
+        # لكل فئة: طابور لكل مستخدم بترتيب الدور (round-robin)
+        self._queues = {PRIORITY_PREMIUM: OrderedDict(), PRIORITY_FREE: OrderedDict()}
+        self.avg_service_time = 3.0
+        self.stats = {'dispatched': 0, 'queued': 0, 'wait_total': 0.0}
+
+    def queued_count(self, priority: int = None) -> int:
+        priorities = [priority] if priority is not None else list(self._queues)
+        return sum(len(q) for p in priorities for q in self._queues[p].values())
+
+    def _dispatch_order(self):
+        """ترتيب الخدمة المتوقع: الفئة الأعلى أولاً ثم تناوب بين المستخدمين"""
+        for priority in sorted(self._queues):
+            users = [deque(q) for q in self._queues[priority].values()]
+            while users:
+                for queue in list(users):
+                    yield queue.popleft()
+                    if not queue:
+                        users.remove(queue)
+
+    def _reposition(self):
+        """إعادة حساب مواقع كل الطلبات المنتظرة بمرور واحد بعد أي تغيير، وتنبيه من تغير موقعه"""
+        for index, ticket in enumerate(self._dispatch_order(), start=1):
+            if ticket.position != index:
+                ticket.position = index
+                ticket.moved.set()
+
+    def position(self, ticket: _Ticket) -> int:
+        """موقع الطلب في الطابور (1 = التالي)"""
+        return ticket.position
+
+    def estimated_wait(self, position: int) -> float:
+        """الانتظار المتوقع بالثواني حسب متوسط زمن الخدمة"""
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_concurrent) * self.avg_service_time
+
+    def _next_ticket(self):
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                user_id, queue = next(iter(users.items()))
+                ticket = queue.popleft()
+                # المستخدم ينتقل لآخر الدور حتى لا يحتكر الطابور
+                del users[user_id]
+                if queue:
+                    users[user_id] = queue
+                return ticket
+        return None
+
+    def _wake_next(self):
+        dispatched = False
+        while self.active < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            if ticket.future.done():
+                continue
+            self.active += 1
+            ticket.future.set_result(True)
+            ticket.moved.set()
+            dispatched = True
+        if dispatched:
+            self._reposition()
+
+    def _remove(self, ticket: _Ticket):
+        users = self._queues[ticket.priority]
+        queue = users.get(ticket.user_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del users[ticket.user_id]
+            self._reposition()
+
+    def _release(self, service_time: float = None):
+        """إعادة المكان؛ service_time=None للطلب الملغى فلا يدخل في متوسط زمن الخدمة"""
+        self.active -= 1
+        if service_time is not None:
+            # متوسط متحرك أسي لزمن الخدمة لتقدير الانتظار
+            self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * service_time
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, priority: int = PRIORITY_FREE, on_wait=None):
+        """حجز مكان للتنفيذ؛ on_wait(position, eta) يُستدعى أثناء الانتظار عند تغير الموقع"""
+        if self.active < self.max_concurrent and not self.queued_count():
+            self.active += 1
+        else:
+            ticket = _Ticket(user_id, priority)
+            self._queues[priority].setdefault(user_id, deque()).append(ticket)
+            self.stats['queued'] += 1
+            self._reposition()
+            last_position = None
+            last_update = 0.0
+            try:
+                while not ticket.future.done():
+                    ticket.moved.clear()
+                    position = ticket.position
+                    # تحديث رسالة الانتظار عند تغير الموقع، بحد أدنى QUEUE_UPDATE_INTERVAL بين التحديثات
+                    if (on_wait and position != last_position
+                            and time.monotonic() - last_update >= Config.QUEUE_UPDATE_INTERVAL):
+                        last_position = position
+                        last_update = time.monotonic()
+                        try:
+                            await on_wait(position, self.estimated_wait(position))
+                        except Exception as e:
+                            logger.debug(f"Queue position callback failed: {str(e)}")
+                    if ticket.future.done():
+                        break
+                    try:
+                        await asyncio.wait_for(ticket.moved.wait(), Config.QUEUE_UPDATE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if ticket.future.done():
+                    # حصل على مكان لحظة الإلغاء، فيجب إعادته
+                    self._release()
+                else:
+                    ticket.future.cancel()
+                    self._remove(ticket)
+                raise
+            self.stats['wait_total'] += time.monotonic() - ticket.enqueued_at
+
+        self.stats['dispatched'] += 1
+        started = time.monotonic()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # الإلغاء في منتصف الطلب لا يمثل زمن خدمة كاملاً
+            self._release(None if cancelled else time.monotonic() - started)
+
+    def get_stats(self) -> dict:
+        queued = self.stats['queued']
+        return {
+            **self.stats,
+            'active': self.active,
+            'queued_premium': self.queued_count(PRIORITY_PREMIUM),
+            'queued_free': self.queued_count(PRIORITY_FREE),
+            'avg_service_time': self.avg_service_time,
+            'avg_queue_wait': self.stats['wait_total'] / queued if queued else 0.0
+        }
+
+
+request_scheduler = RequestScheduler()
@@ -0,0 +1,95 @@
+import logging
+import threading
+from typing import NamedTuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _to_bool(value) -> bool:
+    """bool('false') صحيحة في بايثون، فالنصوص تُقرأ صراحة"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+_COERCERS = {bool: _to_bool}
+
+
+class Settings(NamedTuple):
+    """لقطة ثابتة من إعدادات البوت؛ تُستبدل كاملة عند أي تغيير"""
+    char_limit: int = Config.CHAR_LIMIT
+    premium_char_limit: int = Config.PREMIUM_CHAR_LIMIT
+    request_limit: int = Config.REQUEST_LIMIT
+    premium_request_limit: int = Config.PREMIUM_REQUEST_LIMIT
+    reset_hours: float = Config.RESET_HOURS
+    premium_reset_hours: float = Config.PREMIUM_RESET_HOURS
+    maintenance_mode: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Settings":
+        """بناء اللقطة من عقدة settings مع تجاهل المفاتيح غير المعروفة والقيم التالفة
+
+        التحويل حسب نوع الحقل المعلن لا نوع القيمة الافتراضية (الساعات قد تكون كسرية).
+        """
+        values = {}
+        for name, field_type in cls.__annotations__.items():
+            if name not in (data or {}):
+                continue
+            try:
+                values[name] = _COERCERS.get(field_type, field_type)(data[name])
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid setting {name}={data[name]!r}")
+        return cls(**values)
+
+    def char_limit_for(self, is_premium: bool) -> int:
+        return self.premium_char_limit if is_premium else self.char_limit
+
+    def request_limit_for(self, is_premium: bool) -> int:
+        return self.premium_request_limit if is_premium else self.request_limit
+
+    def reset_hours_for(self, is_premium: bool) -> float:
+        return self.premium_reset_hours if is_premium else self.reset_hours
+
+
+class LiveSettings:
+    """الإعدادات الحالية في الذاكرة، تُحدَّث من أحداث Firebase دون أي طلب شبكة عند القراءة"""
+
+    def __init__(self):
+        self.current = Settings()
+        self._raw = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def start(self, root_ref):
+        """الاستماع لعقدة settings؛ أول حدث يحمل الإعدادات كاملة (مرة واحدة لكل العملية)"""
+        if self._listener is not None:
+            return
+        try:
+            self._listener = root_ref.child('settings').listen(self._on_event)
+        except Exception as e:
+            logger.error(f"Error starting settings listener: {str(e)}")
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def apply(self, changes: dict, replace: bool = False):
+        """دمج تغييرات واستبدال اللقطة دفعة واحدة"""
+        with self._lock:
+            raw = {} if replace else dict(self._raw)
+            raw.update(changes or {})
+            self._raw = raw
+            self.current = Settings.from_dict(raw)
+
+    def _on_event(self, event):
+        path = event.path.strip('/')
+        if not path:
+            self.apply(event.data or {}, replace=event.event_type == 'put')
+        else:
+            self.apply({path.split('/')[0]: event.data})
+        logger.info(f"Settings updated: {self.current}")
+
+
+live_settings = LiveSettings()
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """استدعاء واحد جارٍ مع الأجزاء التي وصلت منه حتى الآن"""
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def notify(self):
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class SingleFlight:
+    """دمج الطلبات المتطابقة المتزامنة في استدعاء واحد يُوزَّع ناتجه على الجميع"""
+
+    def __init__(self):
+        self._flights = {}
+        self.stats = {'leaders': 0, 'followers': 0}
+
+    def is_inflight(self, key) -> bool:
+        return key in self._flights
+
+    async def _run(self, key, flight: _Flight, factory):
+        try:
+            async for delta in factory():
+                flight.parts.append(delta)
+                flight.notify()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._flights.pop(key, None)
+            flight.notify()
+
+    async def stream(self, key, factory):
+        """أجزاء الناتج المشترك؛ إلغاء أحد المنتظرين لا يوقف الاستدعاء المشترك"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            # مهمة مستقلة عن أي منتظر حتى لا يلغيها إلغاء المستدعي
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            self.stats['leaders'] += 1
+        else:
+            self.stats['followers'] += 1
+
+        index = 0
+        while True:
+            while index < len(flight.parts):
+                yield flight.parts[index]
+                index += 1
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return
+            await flight.changed.wait()
+
+    async def do(self, key, factory) -> str:
+        """الناتج الكامل للاستدعاء المشترك"""
+        parts = []
+        async for delta in self.stream(key, factory):
+            parts.append(delta)
+        return "".join(parts)
+
+
+llm_flights = SingleFlight()
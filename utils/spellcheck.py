@@ -0,0 +1,236 @@
+import re
+import sys
+import time
+
+# فحص إملائي محلي خفيف قبل استدعاء النموذج. لا يعتمد على Config حتى يعمل داخل عمليات منفصلة
+# وفي سكربت القياس: python -m utils.spellcheck data/arabic_lexicon.txt
+
+_TASHKEEL_RE = re.compile(r'[\u064B-\u0652\u0670\u0640]')
+_WORD_RE = re.compile(r'[\u0621-\u063A\u0641-\u064A\u064B-\u0652\u0670\u0640]+')
+# حروف وأرقام غير عربية (لاتينية وأرقام ASCII وغيرها)
+_FOREIGN_RE = re.compile(r'[^\W_\u0600-\u06FF]')
+
+# أقل نسبة للحروف العربية حتى يُعتمد الفحص المحلي؛ غير ذلك يُرسل النص للنموذج
+ARABIC_MIN_SHARE = 0.8
+
+# السوابق واللواحق الشائعة (الأطول أولاً)
+PREFIXES = ('وال', 'فال', 'بال', 'كال', 'لل', 'ال', 'و', 'ف', 'ب', 'ل', 'ك')
+SUFFIXES = ('هما', 'كما', 'ها', 'هم', 'هن', 'كم', 'نا', 'ه', 'ك', 'ي')
+# لواحق تشبه التاء المربوطة والألف المقصورة (جميله قد تكون جميلة لا جميل + ه)
+_AMBIGUOUS_SUFFIXES = ('ه', 'ي')
+
+# مجموعات الحروف التي يكثر الخلط بينها
+_CONFUSABLE = [set('اأإآ'), set('ءأؤئ'), set('هة'), set('ىي')]
+_INITIAL_ALEF = 'اأإآ'
+
+_END = '$'
+
+
+class Trie:
+    """شجرة حروف للقاموس مع تكرار كل كلمة"""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def add(self, word: str, frequency: int = 1):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        if _END not in node:
+            self.size += 1
+        node[_END] = max(node.get(_END, 0), frequency)
+
+    def get(self, word: str) -> int:
+        node = self.root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return 0
+        return node.get(_END, 0)
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word) > 0
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def _deletes(word: str) -> set:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _confusable_substitution(word: str, candidate: str) -> bool:
+    """هل يختلف المرشح عن الكلمة بحرف واحد من نفس مجموعة الخلط؟"""
+    if len(word) != len(candidate):
+        return False
+    diffs = [(a, b) for a, b in zip(word, candidate) if a != b]
+    if len(diffs) != 1:
+        return False
+    a, b = diffs[0]
+    return any(a in group and b in group for group in _CONFUSABLE)
+
+
+class SpellChecker:
+    """قاموس في Trie مع فهرس حذف على طريقة SymSpell (مسافة تحرير 1) وقواعد الهمزة والتاء والألف المقصورة"""
+
+    def __init__(self):
+        self.lexicon = Trie()
+        self.deletes = {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "SpellChecker":
+        checker = cls()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = line.split()
+                frequency = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+                checker.add_word(parts[0], frequency)
+        return checker
+
+    def add_word(self, word: str, frequency: int = 1):
+        word = _TASHKEEL_RE.sub('', word)
+        self.lexicon.add(word, frequency)
+        for deleted in _deletes(word):
+            self.deletes.setdefault(deleted, set()).add(word)
+
+    def _stems(self, word: str, ambiguous: bool = True):
+        """الكلمة نفسها ثم صيغها بعد نزع السوابق واللواحق (ambiguous=False يتجاهل اللواحق الملتبسة)"""
+        suffixes = SUFFIXES if ambiguous else tuple(s for s in SUFFIXES if s not in _AMBIGUOUS_SUFFIXES)
+        yield word
+        for prefix in PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+                stem = word[len(prefix):]
+                yield stem
+                for suffix in suffixes:
+                    if stem.endswith(suffix) and len(stem) - len(suffix) >= 2:
+                        yield stem[:-len(suffix)]
+        for suffix in suffixes:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+                yield word[:-len(suffix)]
+
+    def known(self, word: str, ambiguous: bool = True) -> bool:
+        return any(stem in self.lexicon for stem in self._stems(word, ambiguous))
+
+    def lookup(self, word: str) -> set:
+        """مرشحو SymSpell على مسافة تحرير 1"""
+        candidates = set(self.deletes.get(word, ()))
+        if word in self.lexicon:
+            candidates.add(word)
+        for deleted in _deletes(word):
+            if deleted in self.lexicon:
+                candidates.add(deleted)
+            candidates.update(self.deletes.get(deleted, ()))
+        return candidates
+
+    def rule_variants(self, word: str) -> set:
+        """صيغ بديلة حسب قواعد الهمزة في أول الكلمة والتاء المربوطة والألف المقصورة في آخرها"""
+        starts = [word]
+        if word[0] in _INITIAL_ALEF:
+            starts = [alef + word[1:] for alef in _INITIAL_ALEF]
+        variants = set()
+        for start in starts:
+            variants.add(start)
+            if start[-1] in 'هة':
+                variants.add(start[:-1] + ('ة' if start[-1] == 'ه' else 'ه'))
+            if start[-1] in 'ىي':
+                variants.add(start[:-1] + ('ي' if start[-1] == 'ى' else 'ى'))
+        variants.discard(word)
+        return variants
+
+    def correct_token(self, word: str):
+        """(None, []) للكلمة السليمة، (تصحيح, []) للخطأ البسيط، (None, مرشحون) للكلمة المشبوهة"""
+        if len(word) < 2 or self.known(word, ambiguous=False):
+            return None, []
+
+        # قواعد التاء والألف المقصورة قبل قبول جذر نُزعت منه ه أو ي
+        fixes = {variant for variant in self.rule_variants(word) if self.known(variant)}
+        if not fixes and self.known(word):
+            return None, []
+        for candidate in self.lookup(word):
+            if _confusable_substitution(word, candidate):
+                fixes.add(candidate)
+
+        if len(fixes) == 1:
+            return fixes.pop(), []
+        return None, sorted(fixes) or sorted(self.lookup(word))[:5] or [word]
+
+    def check(self, text: str) -> dict:
+        """status: clean (لا شيء مشبوه) / fixed (أخطاء بسيطة صُححت محلياً) / suspicious (يحتاج النموذج)
+
+        النص الذي ليس عربياً في معظمه (لغة أخرى أو أرقام فقط) لا يفحصه القاموس فيُعد مشبوهاً.
+        """
+        arabic = sum(len(token) for token in _WORD_RE.findall(text))
+        foreign = len(_FOREIGN_RE.findall(text))
+        if not arabic or arabic < (arabic + foreign) * ARABIC_MIN_SHARE:
+            return {'status': 'suspicious', 'text': text, 'fixes': [], 'suspicious': []}
+
+        fixes = []
+        suspicious = []
+
+        def replace(match):
+            token = match.group(0)
+            plain = _TASHKEEL_RE.sub('', token)
+            fixed, candidates = self.correct_token(plain)
+            if fixed:
+                fixes.append((token, fixed))
+                return fixed
+            if candidates:
+                suspicious.append((token, candidates))
+            return token
+
+        corrected = _WORD_RE.sub(replace, text)
+        if suspicious:
+            status = 'suspicious'
+        elif fixes:
+            status = 'fixed'
+        else:
+            status = 'clean'
+        return {'status': status, 'text': corrected, 'fixes': fixes, 'suspicious': suspicious}
+
+
+# ------------------- عمليات الفحص المنفصلة -------------------
+_worker_checker = None
+
+
+def init_worker(lexicon_path: str):
+    global _worker_checker
+    _worker_checker = SpellChecker.from_file(lexicon_path)
+
+
+def check_in_worker(text: str) -> dict:
+    return _worker_checker.check(text)
+
+
+# ------------------- القياس -------------------
+def benchmark(checker: SpellChecker, text: str, rounds: int = 200) -> float:
+    """عدد الكلمات المفحوصة في الثانية"""
+    tokens = len(_WORD_RE.findall(text))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        checker.check(text)
+    elapsed = time.perf_counter() - started
+    return tokens * rounds / elapsed if elapsed else 0.0
+
+
+_BENCH_TEXT = (
+    "السلام عليكم ورحمة الله، كيف حالك اليوم؟ ذهبت الى المدرسه في الصباح وقرأت كتابا جديدا. "
+    "هذه رسالة قصيرة الى صديقي مصطفي في المستشفى، وأريد ان أعرف متي يعود الى البيت.\n"
+    "إن اللغة العربية لغة جميلة، ولكن الأخطاء الإملائية فيها كثيرة عند الطلاب."
+)
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/arabic_lexicon.txt"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    started = time.perf_counter()
+    checker = SpellChecker.from_file(path)
+    print(f"Loaded {len(checker.lexicon)} words ({len(checker.deletes)} delete keys) "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    result = checker.check(_BENCH_TEXT)
+    print(f"Sample status: {result['status']}, fixes: {result['fixes']}")
+    print(f"Throughput: {benchmark(checker, _BENCH_TEXT, rounds):,.0f} tokens/s")
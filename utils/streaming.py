@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, RetryAfter
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# الحد الأقصى لطول رسالة تيليجرام
+MAX_MESSAGE_LENGTH = 4096
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list:
+    """تقسيم نص طويل إلى أجزاء لا تتجاوز limit، عند آخر سطر أو مسافة حتى لا تنقطع الكلمات والوسوم"""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = text.rfind(' ', 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip('\n ')
+    parts.append(text)
+    return parts
+
+
+class StreamingMessage:
+    """تحديث رسالة تيليجرام تدريجياً مع تجميع التعديلات المتقاربة"""
+
+    def __init__(self, edit_func, header: str = "", min_interval: float = None,
+                 min_chars: int = None, send_func=None):
+        self.edit_func = edit_func
+        # send_func لإرسال بقية النتيجة الطويلة في رسائل تالية (بدونه تُقتطع)
+        self.send_func = send_func
+        self.header = header
+        self.min_interval = Config.STREAM_EDIT_INTERVAL if min_interval is None else min_interval
+        self.min_chars = Config.STREAM_MIN_CHARS if min_chars is None else min_chars
+        self.text = ""
+        self.edits = 0
+        self.first_token_at = None
+        self._started_at = time.monotonic()
+        self._next_edit_at = 0.0
+        self._shown_length = 0
+
+    def _render(self, text: str) -> str:
+        body = f"{self.header}{text}"
+        if len(body) > MAX_MESSAGE_LENGTH:
+            body = body[:MAX_MESSAGE_LENGTH - 1] + "…"
+        return body
+
+    async def _edit(self, text: str, **kwargs) -> bool:
+        try:
+            await self.edit_func(text, **kwargs)
+            self.edits += 1
+            return True
+        except RetryAfter as e:
+            # تيليجرام يطلب التمهل: نؤجل التعديل التالي بدل إسقاط الطلب
+            self._next_edit_at = time.monotonic() + float(e.retry_after)
+            logger.warning(f"Telegram edit throttled for {e.retry_after}s")
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        return False
+
+    async def show_queue(self, position: int, eta: float):
+        """عرض موقع الطلب في الطابور والانتظار المتوقع قبل بدء المعالجة"""
+        if self.text:
+            return
+        await self._edit(
+            f"⏳ طلبك في الطابور: رقم {position}\n"
+            f"⌛ الانتظار المتوقع: حوالي {max(1, round(eta))} ثانية"
+        )
+
+    async def consume(self, chunks) -> str:
+        """قراءة أجزاء الرد وتعديل الرسالة كلما سمح معدل التعديل"""
+        async for delta in chunks:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic() - self._started_at
+            self.text += delta
+
+            now = time.monotonic()
+            if now < self._next_edit_at or len(self.text) - self._shown_length < self.min_chars:
+                continue
+            # أثناء التدفق نرسل نصاً عادياً لأن الماركداون غير المكتمل قد يُرفض
+            if await self._edit(self._render(self.text) + " ▌"):
+                self._shown_length = len(self.text)
+                self._next_edit_at = now + self.min_interval
+
+        if self.first_token_at is not None:
+            logger.debug(f"Stream done: first token after {self.first_token_at:.2f}s, {self.edits} edits")
+        return self.text
+
+    async def finalize(self, text: str, **kwargs):
+        """التعديل الأخير (يتجاوز التجميع) مع النص الكامل والتذييل
+
+        النص الأطول من حد تيليجرام يُقسم: الجزء الأول في الرسالة نفسها والباقي في رسائل تالية.
+        """
+        parts = split_message(text)
+        if self.send_func is None and len(parts) > 1:
+            parts = [parts[0][:MAX_MESSAGE_LENGTH - 1] + "…"]
+        await self._finalize_part(self.edit_func, parts[0], **kwargs)
+        for part in parts[1:]:
+            await self._finalize_part(self.send_func, part, **kwargs)
+
+    @staticmethod
+    async def _finalize_part(func, text: str, **kwargs):
+        try:
+            await func(text, **kwargs)
+        except RetryAfter as e:
+            logger.warning(f"Final edit throttled, retrying after {e.retry_after}s")
+            await asyncio.sleep(float(e.retry_after))
+            await func(text, **kwargs)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from config import Config
+from utils.usage_history import add_fields, day_key, event_fields, hour_key
+
+logger = logging.getLogger(__name__)
+
+
+class UsageBuffer:
+    """تجميع زيادات عدادات الاستخدام في الذاكرة وكتابتها دفعة واحدة (write-behind)"""
+
+    def __init__(self, db):
+        self.db = db
+        self.interval = Config.USAGE_FLUSH_INTERVAL_MS / 1000
+        self.max_events = Config.USAGE_FLUSH_MAX_EVENTS
+        self._users = {}
+        self._total = 0
+        self._hourly = {}
+        self._events = 0
+        self._timer = None
+        self._lock = None
+        self._tasks = set()
+        self.stats = {'events': 0, 'flushes': 0, 'failed_flushes': 0}
+
+    def record(self, user_id: int, mode: str = None, is_premium: bool = False):
+        """تسجيل طلب مكتمل لمستخدم، مع حاوية الساعة الحالية حسب الفئة ونوع المعالجة"""
+        now = time.time()
+        pending = self._users.setdefault(user_id, {'count': 0, 'last_request': now})
+        pending['count'] += 1
+        pending['last_request'] = now
+        self._total += 1
+        add_fields(self._hourly, hour_key(now), event_fields(mode, is_premium))
+        self._events += 1
+        self.stats['events'] += 1
+
+        loop = asyncio.get_running_loop()
+        if self._events >= self.max_events:
+            self._spawn(loop, self.flush())
+        elif self._timer is None:
+            self._timer = self._spawn(loop, self._flush_later())
+
+    def _spawn(self, loop, coro) -> asyncio.Task:
+        task = loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.interval)
+        finally:
+            self._timer = None
+        await self.flush()
+
+    def pending_count(self, user_id: int) -> int:
+        """طلبات المستخدم التي لم تُكتب بعد (تُضاف عند فحص الحدود)"""
+        pending = self._users.get(user_id)
+        return pending['count'] if pending else 0
+
+    def pending_today(self) -> int:
+        today = day_key(time.time())
+        return sum(fields.get('requests', 0) for key, fields in self._hourly.items() if key.startswith(today))
+
+    def discard_user(self, user_id: int):
+        """إسقاط زيادات المستخدم المعلقة عند تصفير عداده (تخص الفترة السابقة)"""
+        self._users.pop(user_id, None)
+
+    def _take(self) -> tuple:
+        users, total, hourly = self._users, self._total, self._hourly
+        self._users, self._total, self._hourly, self._events = {}, 0, {}, 0
+        return users, total, hourly
+
+    def _restore(self, users: dict, total: int, hourly: dict):
+        """إعادة الزيادات إلى الذاكرة بعد فشل الكتابة حتى لا تضيع"""
+        for user_id, pending in users.items():
+            current = self._users.get(user_id)
+            if current is None:
+                self._users[user_id] = pending
+            else:
+                current['count'] += pending['count']
+                current['last_request'] = max(current['last_request'], pending['last_request'])
+        self._total += total
+        for key, fields in hourly.items():
+            add_fields(self._hourly, key, fields)
+        self._events += sum(pending['count'] for pending in users.values())
+
+    async def _write(self, users: dict, total: int, hourly: dict):
+        if not users and not total and not hourly:
+            return
+        await self.db.apply_usage(users, total, hourly)
+        self.stats['flushes'] += 1
+
+    async def flush(self):
+        """كتابة كل الزيادات المعلقة في طلب واحد"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            users, total, hourly = self._take()
+            try:
+                await self._write(users, total, hourly)
+            except Exception as e:
+                self.stats['failed_flushes'] += 1
+                self._restore(users, total, hourly)
+                logger.error(f"Error flushing usage counters: {str(e)}")
+                if self._timer is None:
+                    self._timer = self._spawn(asyncio.get_running_loop(), self._flush_later())
+
+    async def aclose(self):
+        """كتابة ما تبقى عند إيقاف البوت"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
@@ -0,0 +1,77 @@
+import time
+
+# مفاتيح الحاويات بتوقيت UTC: الترتيب النصي هو الترتيب الزمني
+HOURLY = 'hourly'
+DAILY = 'daily'
+
+SPARK_BARS = "▁▂▃▄▅▆▇█"
+
+
+def hour_key(timestamp: float) -> str:
+    return time.strftime('%Y%m%d%H', time.gmtime(timestamp))
+
+
+def day_key(timestamp: float) -> str:
+    return time.strftime('%Y%m%d', time.gmtime(timestamp))
+
+
+def event_fields(mode: str = None, is_premium: bool = False) -> dict:
+    """حقول الحاوية التي يزيدها طلب واحد: الإجمالي والفئة ونوع المعالجة"""
+    fields = {'requests': 1, 'premium' if is_premium else 'free': 1}
+    if mode:
+        fields[f"mode_{mode}"] = 1
+    return fields
+
+
+def add_fields(buckets: dict, key: str, fields: dict):
+    bucket = buckets.setdefault(key, {})
+    for field, delta in fields.items():
+        bucket[field] = bucket.get(field, 0) + delta
+
+
+def daily_rollup(hourly: dict) -> dict:
+    """تجميع حاويات الساعات إلى أيامها لتُزاد معها في نفس الكتابة"""
+    daily = {}
+    for key, fields in hourly.items():
+        add_fields(daily, key[:8], fields)
+    return daily
+
+
+def retention_cutoffs(now: float, hourly_days: float, daily_days: float) -> tuple:
+    """أول مفتاح يُحتفظ به لكل نوع حاوية (ما قبله يُحذف)"""
+    return hour_key(now - hourly_days * 86400), day_key(now - daily_days * 86400)
+
+
+def summarize(history: dict, now: float = None, hours: int = 24, days: int = 7) -> dict:
+    """ملخص الاتجاهات من حاويات get_usage_history لعرضه في /admin_stats"""
+    now = now or time.time()
+    hourly = history.get(HOURLY) or {}
+    daily = history.get(DAILY) or {}
+
+    recent_hours = [hourly.get(hour_key(now - offset * 3600)) or {} for offset in reversed(range(hours))]
+    tiers = {'premium': 0, 'free': 0}
+    modes = {}
+    for bucket in recent_hours:
+        for field, value in bucket.items():
+            if field in tiers:
+                tiers[field] += value
+            elif field.startswith('mode_'):
+                mode = field[len('mode_'):]
+                modes[mode] = modes.get(mode, 0) + value
+
+    day_keys = [day_key(now - offset * 86400) for offset in reversed(range(days))]
+    recent_days = [(key, (daily.get(key) or {}).get('requests', 0)) for key in day_keys]
+    return {
+        'hourly': [bucket.get('requests', 0) for bucket in recent_hours],
+        'tiers': tiers,
+        'modes': modes,
+        'daily': recent_days,
+        'today': recent_days[-1][1] if recent_days else 0
+    }
+
+
+def sparkline(values: list) -> str:
+    peak = max(values, default=0)
+    if not peak:
+        return SPARK_BARS[0] * len(values)
+    return ''.join(SPARK_BARS[round(value / peak * (len(SPARK_BARS) - 1))] for value in values)